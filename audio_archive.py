@@ -0,0 +1,216 @@
+# audio_archive.py
+
+import glob
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from metrics import metrics
+
+class AudioArchive:
+    """
+    Compressed copies of recordings in one directory per conversation id,
+    sharded like the conversations' data directories, kept within a disk
+    budget. Files are evicted least recently used first once the archive
+    is over max_bytes, and unconditionally max_age seconds after their last
+    use. Nothing reads the archive back yet, so a file's last use is the
+    time it was archived.
+
+    :param archive_dir: Directory holding the archive.
+    :param max_bytes: Total size the archived files may take up.
+    :param max_age: Seconds after its last use that a file is deleted.
+    :param audio_format: Format passed to encode_for_upload; 'flac' keeps the audio lossless at sample_rate.
+    :param sample_rate: Archived audio is downsampled to mono at this rate.
+    """
+    def __init__(self, archive_dir, max_bytes=2 * 1024 ** 3, max_age=365 * 24 * 3600, audio_format='flac',
+                 sample_rate=16000):
+        self.archive_dir = archive_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.audio_format = audio_format
+        self.sample_rate = sample_rate
+        self.lock = threading.Lock()
+        self.entries = {}  # path -> (size, last_used)
+        self.total_bytes = 0
+        # Encodes files handed over by add_later(), one at a time, away from the upload threads
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="archive")
+
+    def load(self):
+        # Scans the archive once; slow on a large one, so it runs with the rest of the loading
+        os.makedirs(self.archive_dir, exist_ok=True)
+        with self.lock:
+            self.entries = {}
+            self.total_bytes = 0
+            for conversation_dir in glob.glob(os.path.join(self.archive_dir, "*", "*")):
+                if not os.path.isdir(conversation_dir):
+                    continue
+                for filename in os.listdir(conversation_dir):
+                    if filename.endswith('.tmp'):
+                        continue
+                    path = os.path.join(conversation_dir, filename)
+                    stat = os.stat(path)
+                    self.entries[path] = (stat.st_size, stat.st_mtime)
+                    self.total_bytes += stat.st_size
+        self.evict()
+
+    def get_conversation_dir(self, conversation_id):
+        return os.path.join(self.archive_dir, conversation_id[:2], conversation_id)
+
+    def add(self, wav_path, conversation_id):
+        """
+        Compresses a WAV file into the conversation's archive and deletes the
+        original. The archived file is named after the time the WAV was last
+        written; it counts as used now, so old recordings aren't evicted as
+        soon as they arrive. Returns the archived path.
+        """
+        from audio_encoder import encode_for_upload
+        conversation_dir = self.get_conversation_dir(conversation_id)
+        os.makedirs(conversation_dir, exist_ok=True)
+        recorded = os.path.getmtime(wav_path)
+        encoded_path = encode_for_upload(wav_path, self.audio_format, self.sample_rate, output_dir=conversation_dir)
+        # encode_for_upload falls back to WAV when the format can't be written
+        extension = os.path.splitext(encoded_path)[1]
+        base_name = time.strftime('%Y%m%d-%H%M%S', time.localtime(recorded))
+        base_name += "_" + os.path.splitext(os.path.basename(wav_path))[0]
+        with self.lock:
+            path = os.path.join(conversation_dir, base_name + extension)
+            suffix = 1
+            while os.path.exists(path):
+                path = os.path.join(conversation_dir, f"{base_name}_{suffix}{extension}")
+                suffix += 1
+            os.replace(encoded_path, path)
+            now = time.time()
+            os.utime(path, (now, now))
+            size = os.path.getsize(path)
+            self.entries[path] = (size, now)
+            self.total_bytes += size
+        os.remove(wav_path)
+        metrics.counter('archive_files_added_total', "Recordings compressed into the archive").inc()
+        self.evict()
+        return path
+
+    def add_later(self, wav_path, conversation_id):
+        # Queues add() on the archive's own thread; a file that fails stays behind for the compactor
+        def add():
+            try:
+                self.add(wav_path, conversation_id)
+            except Exception as e:
+                print(f"Error archiving {wav_path}: {e}")
+        return self.executor.submit(add)
+
+    def delete_conversation(self, conversation_id):
+        conversation_dir = self.get_conversation_dir(conversation_id)
+        with self.lock:
+            for path in [path for path in self.entries if os.path.dirname(path) == conversation_dir]:
+                size, _ = self.entries.pop(path)
+                self.total_bytes -= size
+        shutil.rmtree(conversation_dir, ignore_errors=True)
+        self.update_metrics()
+
+    def remove(self, path):
+        size, _ = self.entries.pop(path)
+        self.total_bytes -= size
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        metrics.counter('archive_files_evicted_total', "Archived recordings deleted to stay within the budget").inc()
+
+    def evict(self):
+        with self.lock:
+            now = time.time()
+            for path in [path for path, (_, last_used) in self.entries.items() if now - last_used > self.max_age]:
+                self.remove(path)
+            if self.total_bytes > self.max_bytes:
+                for path, _ in sorted(self.entries.items(), key=lambda item: item[1][1]):
+                    if self.total_bytes <= self.max_bytes:
+                        break
+                    self.remove(path)
+        self.update_metrics()
+
+    def get_stats(self):
+        with self.lock:
+            return {'files': len(self.entries), 'bytes': self.total_bytes, 'max_bytes': self.max_bytes}
+
+    def update_metrics(self):
+        stats = self.get_stats()
+        metrics.gauge('archive_files', "Recordings in the archive").set(stats['files'])
+        metrics.gauge('archive_bytes', "Disk space used by the archive").set(stats['bytes'])
+
+    def close(self):
+        # Files not archived yet are left for the compactor of the next run
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+class RecordingsCompactor:
+    """
+    Moves WAV files left behind in the recordings directories into the
+    archive every `interval` seconds on a background thread, e.g. chunks
+    kept after transcription or the audio of a job whose failed chunks were
+    discarded. Files still referenced by the job journal are left alone, as
+    are files written in the last `grace` seconds, which may be about to be
+    handed to a transcription queue.
+    """
+    def __init__(self, archive, data_dir, journal, interval=600, grace=600):
+        self.archive = archive
+        self.data_dir = data_dir
+        self.journal = journal
+        self.interval = interval
+        self.grace = grace
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"Error compacting recordings: {e}")
+            if self.stopped.wait(self.interval):
+                return
+
+    def find_leftovers(self):
+        # (wav_path, conversation id) of every WAV that no job needs any more
+        referenced = self.journal.get_chunk_paths()
+        cutoff = time.time() - self.grace
+        leftovers = []
+        for recordings_dir in glob.glob(os.path.join(self.data_dir, "*", "*", "recordings")):
+            conversation_id = os.path.basename(os.path.dirname(recordings_dir))
+            for pattern in ("*.wav", os.path.join("import_*", "*.wav")):
+                for wav_path in glob.glob(os.path.join(recordings_dir, pattern)):
+                    try:
+                        if wav_path in referenced or os.path.getmtime(wav_path) > cutoff:
+                            continue
+                    except OSError:
+                        continue  # Removed since the listing
+                    leftovers.append((wav_path, conversation_id))
+        return leftovers
+
+    def compact(self):
+        for wav_path, conversation_id in sorted(self.find_leftovers()):
+            if self.stopped.is_set():
+                return
+            # A job may have picked the file up since the scan
+            if wav_path in self.journal.get_chunk_paths():
+                continue
+            try:
+                with metrics.timer('archive_compact_seconds', "Time to compress one leftover recording"):
+                    self.archive.add(wav_path, conversation_id)
+            except Exception as e:
+                print(f"Error archiving {wav_path}: {e}")
+                continue
+            parent = os.path.dirname(wav_path)
+            if os.path.basename(parent).startswith("import_"):
+                try:
+                    os.rmdir(parent)
+                except OSError:
+                    pass  # Other parts remain
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
@@ -0,0 +1,41 @@
+# audio_backend.py
+
+import threading
+
+# PortAudio constants, so code that only passes them along doesn't need PyAudio imported
+PA_INT16 = 8  # pyaudio.paInt16
+PA_INPUT_OVERFLOW = 2  # pyaudio.paInputOverflow
+PA_CONTINUE = 0  # pyaudio.paContinue
+
+_shared_audio = None
+_lock = threading.Lock()
+
+def get_shared_audio():
+    """
+    Returns the process-wide PyAudio instance, creating it on first use.
+    Initializing PortAudio enumerates every audio device, which can take
+    seconds, so one instance is kept for the lifetime of the app instead of
+    one per recording.
+    """
+    global _shared_audio
+    with _lock:
+        if _shared_audio is None:
+            import pyaudio
+            _shared_audio = pyaudio.PyAudio()
+        return _shared_audio
+
+def warm_up_in_background():
+    # Starts PortAudio on a background thread so the first recording starts immediately
+    def warm_up():
+        try:
+            get_shared_audio()
+        except Exception as e:
+            print(f"Error initializing audio: {e}")
+    threading.Thread(target=warm_up, daemon=True).start()
+
+def terminate_shared_audio():
+    global _shared_audio
+    with _lock:
+        if _shared_audio is not None:
+            _shared_audio.terminate()
+            _shared_audio = None
@@ -0,0 +1,123 @@
+# audio_encoder.py
+
+import os
+import shutil
+import subprocess
+import tempfile
+import wave
+import numpy as np
+
+# Upload format -> (file extension, pydub export arguments)
+ENCODINGS = {
+    'flac': ('.flac', {'format': 'flac'}),
+    'mp3': ('.mp3', {'format': 'mp3', 'bitrate': '48k'}),
+    'opus': ('.ogg', {'format': 'ogg', 'codec': 'libopus', 'bitrate': '24k'}),
+    'wav': ('.wav', None),
+}
+
+def read_wav(file_path):
+    """
+    Reads a PCM WAV file into a mono float32 array in the range [-1, 1].
+
+    :return: (samples, sample_rate)
+    """
+    with wave.open(file_path, 'rb') as wf:
+        channels = wf.getnchannels()
+        sample_width = wf.getsampwidth()
+        sample_rate = wf.getframerate()
+        raw = wf.readframes(wf.getnframes())
+
+    if sample_width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif sample_width == 2:
+        samples = np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768
+    elif sample_width == 4:
+        samples = np.frombuffer(raw, dtype='<i4').astype(np.float32) / 2147483648
+    else:
+        raise ValueError(f"Unsupported sample width: {sample_width} bytes")
+
+    if channels > 1:
+        samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+    return samples, sample_rate
+
+def lowpass_filter(cutoff, taps=63):
+    # Windowed-sinc FIR; cutoff is a fraction of the source sample rate
+    n = np.arange(taps) - (taps - 1) / 2
+    kernel = 2 * cutoff * np.sinc(2 * cutoff * n) * np.blackman(taps)
+    return (kernel / kernel.sum()).astype(np.float32)
+
+def resample(samples, source_rate, target_rate):
+    """
+    Resamples a mono float32 signal. Downsampling is preceded by an
+    anti-aliasing low-pass filter; both steps are vectorized.
+    """
+    if source_rate == target_rate or len(samples) == 0:
+        return samples
+    if target_rate < source_rate:
+        # Keep a little headroom below the new Nyquist frequency
+        samples = np.convolve(samples, lowpass_filter(0.45 * target_rate / source_rate), mode='same')
+    target_length = int(round(len(samples) * target_rate / source_rate))
+    positions = np.arange(target_length) * (source_rate / target_rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+def to_pcm16(samples):
+    return (np.clip(samples, -1, 1) * 32767).astype('<i2').tobytes()
+
+def write_wav(file_path, pcm, sample_rate):
+    with wave.open(file_path, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm)
+
+def encode_for_upload(file_path, audio_format='flac', sample_rate=16000, output_dir=None):
+    """
+    Downsamples a WAV file to mono 16-bit at sample_rate and encodes it in
+    audio_format ('flac', 'opus', 'mp3' or 'wav'). Compressed formats need
+    pydub with ffmpeg; if those are unavailable the resampled WAV is used.
+
+    :return: Path of the new temporary file. The caller is responsible for removing it.
+    """
+    if audio_format not in ENCODINGS:
+        raise ValueError(f"Unsupported upload format: {audio_format}")
+    samples, source_rate = read_wav(file_path)
+    pcm = to_pcm16(resample(samples, source_rate, sample_rate))
+
+    base_name = os.path.splitext(os.path.basename(file_path))[0]
+    extension, export_args = ENCODINGS[audio_format]
+    if export_args is not None:
+        fd, encoded_path = tempfile.mkstemp(prefix=f"{base_name}_", suffix=extension, dir=output_dir)
+        os.close(fd)
+        try:
+            from pydub import AudioSegment
+            segment = AudioSegment(data=pcm, sample_width=2, frame_rate=sample_rate, channels=1)
+            segment.export(encoded_path, **export_args)
+            return encoded_path
+        except Exception as e:
+            os.remove(encoded_path)
+            print(f"Could not encode {file_path} as {audio_format}, uploading WAV instead: {e}")
+
+    fd, encoded_path = tempfile.mkstemp(prefix=f"{base_name}_", suffix='.wav', dir=output_dir)
+    os.close(fd)
+    write_wav(encoded_path, pcm, sample_rate)
+    return encoded_path
+
+def decode_to_wav(file_path, output_path, sample_rate=16000):
+    """
+    Decodes any audio file ffmpeg can read (mp3, m4a, ogg, ...) into a mono
+    16-bit WAV at sample_rate. ffmpeg streams to the file, so long inputs are
+    decoded in constant memory.
+    """
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        raise RuntimeError("ffmpeg is needed to decode compressed audio")
+    result = subprocess.run(
+        [ffmpeg, '-nostdin', '-loglevel', 'error', '-y', '-i', file_path,
+         '-ac', '1', '-ar', str(sample_rate), '-c:a', 'pcm_s16le', '-f', 'wav', output_path],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    if result.returncode != 0:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise RuntimeError(f"ffmpeg could not decode {file_path}: {result.stderr.strip()}")
+    return output_path
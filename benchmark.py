@@ -0,0 +1,296 @@
+# benchmark.py
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from audio_encoder import read_wav, resample, to_pcm16, write_wav
+from conversation_manager import ConversationManager
+from recorder import Recorder
+from stub_transcription_server import StubTranscriptionServer
+from transcriber import Transcriber
+from transcription_queue import TranscriptionQueue
+
+def make_fixture(file_path, duration=120, sample_rate=44100, seed=0):
+    """
+    Writes a reproducible speech-like WAV: voiced bursts of a few seconds
+    separated by short pauses, over a quiet noise floor.
+    """
+    rng = np.random.default_rng(seed)
+    samples = rng.normal(0, 0.001, int(duration * sample_rate)).astype(np.float32)
+    position = int(sample_rate)  # A second of room noise first, so the VAD can learn the noise floor
+    while position < len(samples):
+        length = int(rng.uniform(1.5, 6.0) * sample_rate)
+        t = np.arange(min(length, len(samples) - position)) / sample_rate
+        pitch = rng.uniform(100, 220)
+        voiced = sum(np.sin(2 * np.pi * pitch * harmonic * t) / harmonic for harmonic in range(1, 6))
+        envelope = 0.6 + 0.4 * np.sin(2 * np.pi * rng.uniform(3, 6) * t)  # Syllable-rate modulation
+        samples[position:position + len(t)] += (0.15 * voiced * envelope).astype(np.float32)
+        position += length + int(rng.uniform(0.4, 1.5) * sample_rate)
+    write_wav(file_path, to_pcm16(samples), sample_rate)
+
+class WavAudioSource:
+    """
+    Stand-in for PyAudio that plays a WAV file into the stream callback, so
+    Recorder can run headless. Audio is delivered at `speed` times real time;
+    `finished` is set once the whole file has been delivered.
+    """
+    def __init__(self, file_path, speed=1.0):
+        self.file_path = file_path
+        self.speed = speed
+        self.finished = threading.Event()
+        self.duration = 0
+
+    def get_sample_size(self, format):
+        return 2
+
+    def open(self, format=None, channels=1, rate=44100, input=True, frames_per_buffer=1024, stream_callback=None):
+        samples, sample_rate = read_wav(self.file_path)
+        pcm = to_pcm16(resample(samples, sample_rate, rate))
+        self.duration = len(pcm) / 2 / rate
+        return WavInputStream(pcm, rate, frames_per_buffer, stream_callback, self.speed, self.finished)
+
+class WavInputStream:
+    def __init__(self, pcm, rate, frames_per_buffer, stream_callback, speed, finished):
+        self.pcm = pcm
+        self.rate = rate
+        self.frames_per_buffer = frames_per_buffer
+        self.stream_callback = stream_callback
+        self.speed = speed
+        self.finished = finished
+        self.active = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        block_size = self.frames_per_buffer * 2
+        start = time.perf_counter()
+        for block_index, offset in enumerate(range(0, len(self.pcm), block_size)):
+            if not self.active:
+                return
+            # Paced against the start time so scheduling delays don't accumulate
+            due = start + block_index * self.frames_per_buffer / self.rate / self.speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            data = self.pcm[offset:offset + block_size]
+            self.stream_callback(data, len(data) // 2, {}, 0)
+        self.finished.set()
+
+    def stop_stream(self):
+        self.active = False
+        self.thread.join()
+
+    def close(self):
+        self.active = False
+
+def generate_fixtures(directory, count, duration, seed=0):
+    # In a separate process, so the arrays used to generate them don't count towards the peak RSS
+    paths = [os.path.join(directory, f"fixture_{number}.wav") for number in range(count)]
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        list(executor.map(make_fixture, paths, [duration] * count, [44100] * count,
+                          [seed + number for number in range(count)]))
+    return paths
+
+def serve(connection, options):
+    server = StubTranscriptionServer(**options).start()
+    connection.send(server.url)
+    connection.recv()
+    server.stop()
+    connection.send(server.get_stats())
+
+class ServerProcess:
+    """
+    Runs StubTranscriptionServer in a child process, so the request bodies
+    it holds and its threads aren't counted in the benchmark's peak RSS.
+    get_stats() is available once the server has been stopped.
+    """
+    def __init__(self, **options):
+        self.connection, child_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=serve, args=(child_connection, options), daemon=True)
+        self.url = None
+        self.stats = None
+
+    def start(self):
+        self.process.start()
+        self.url = self.connection.recv()
+        return self
+
+    def stop(self):
+        self.connection.send('stop')
+        self.stats = self.connection.recv()
+        self.process.join()
+
+    def get_stats(self):
+        return self.stats
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Not available on Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def run_benchmark(fixtures, chunk_duration=30, speed=8.0, latency=0.5, jitter=0.1, error_rate=0.0,
+                  workers=4, upload_format='flac', seed=0):
+    """
+    Replays every fixture through Recorder, TranscriptionQueue and
+    Transcriber against a local stub server, and stores the transcripts
+    through ConversationManager. Runs in the current directory. The stub
+    server runs in its own process, so peak_rss_mb is the app's memory.
+
+    :return: Dict with per-fixture and overall results.
+    """
+    random.seed(seed)  # Retry jitter in Transcriber
+    server = ServerProcess(latency=latency, jitter=jitter, error_rate=error_rate, seed=seed).start()
+    transcriber = Transcriber('benchmark', backoff_base=0.1, backoff_max=1.0, upload_format=upload_format,
+                              api_base=server.url)
+    manager = ConversationManager()
+    results = []
+    started = time.perf_counter()
+    try:
+        for number, fixture in enumerate(fixtures):
+            results.append(run_fixture(manager, transcriber, fixture, f"benchmark_{number}",
+                                       chunk_duration, speed, workers))
+    finally:
+        elapsed = time.perf_counter() - started
+        transcriber.close()
+        server.stop()
+        manager.close()
+
+    chunks = sum(result['chunks'] for result in results)
+    latencies = sorted(result['stop_to_transcript'] for result in results)
+    return {
+        'fixtures': results,
+        'chunks': chunks,
+        'chunks_per_second': chunks / elapsed if elapsed else 0,
+        'stop_to_transcript_max': latencies[-1] if latencies else None,
+        'stop_to_transcript_median': latencies[len(latencies) // 2] if latencies else None,
+        'bytes_uploaded': transcriber.bytes_uploaded,
+        'server': server.get_stats(),
+        'peak_rss_mb': peak_rss_mb(),
+        'elapsed': elapsed,
+    }
+
+def run_fixture(manager, transcriber, fixture, name, chunk_duration, speed, workers):
+    manager.create_conversation(name)
+    path = [name]
+    done = threading.Event()
+    outcome = {}
+
+    def on_complete(text):
+        manager.append_transcript(text, path)
+        outcome['finished'] = time.perf_counter()
+        done.set()
+
+    def on_error(failed_chunks):
+        outcome['finished'] = time.perf_counter()
+        outcome['failed_chunks'] = len(failed_chunks)
+        done.set()
+
+    queue = TranscriptionQueue(transcriber, on_complete=on_complete, on_error=on_error, max_workers=workers)
+    chunk_count = [0]
+
+    def on_chunk_saved(chunk_path):
+        chunk_count[0] += 1
+        queue.submit(chunk_path)
+
+    source = WavAudioSource(fixture, speed)
+    recorder = Recorder(manager.get_recordings_dir_from_path(path), on_chunk_saved=on_chunk_saved, audio=source)
+    recorder.chunk_duration = chunk_duration
+    recorder.boundary_tolerance = chunk_duration / 4
+    started = time.perf_counter()
+    thread = threading.Thread(target=recorder.record)
+    thread.start()
+    source.finished.wait()
+    stopped = time.perf_counter()
+    recorder.stop()
+    thread.join()
+    queue.close()
+    done.wait()
+    return {
+        'fixture': fixture,
+        'audio_seconds': source.duration,
+        'chunks': chunk_count[0],
+        'failed_chunks': outcome.get('failed_chunks', 0),
+        'stop_to_transcript': outcome['finished'] - stopped,
+        'wall_seconds': outcome['finished'] - started,
+        'segments_stored': manager.get_segment_count(path),
+        'dropped_frames': recorder.dropped_frames,
+    }
+
+def print_report(report):
+    for result in report['fixtures']:
+        print(f"{os.path.basename(result['fixture'])}: {result['audio_seconds']:.0f}s audio, "
+              f"{result['chunks']} chunks ({result['failed_chunks']} failed), "
+              f"stop-to-transcript {result['stop_to_transcript'] * 1000:.0f} ms, "
+              f"{result['dropped_frames']} dropped frames")
+    print(f"Chunks: {report['chunks']} ({report['chunks_per_second']:.2f}/s)")
+    if report['stop_to_transcript_median'] is not None:
+        print(f"Stop-to-transcript: median {report['stop_to_transcript_median'] * 1000:.0f} ms, "
+              f"max {report['stop_to_transcript_max'] * 1000:.0f} ms")
+    print(f"Bytes uploaded: {report['bytes_uploaded']} "
+          f"({report['server']['requests']} requests, {report['server']['errors']} simulated errors)")
+    if report['peak_rss_mb'] is not None:
+        print(f"Peak RSS: {report['peak_rss_mb']:.1f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark record -> chunk -> upload -> store against a local stand-in transcription server."
+    )
+    parser.add_argument("fixtures", nargs="*", help="WAV files to replay (default: generated fixtures)")
+    parser.add_argument("--generate", type=int, default=3, help="Number of fixtures to generate if none are given")
+    parser.add_argument("--duration", type=float, default=120, help="Duration of generated fixtures in seconds")
+    parser.add_argument("--chunk-duration", type=float, default=30, help="Recorder chunk duration in seconds")
+    parser.add_argument("--speed", type=float, default=8.0, help="Replay speed relative to real time")
+    parser.add_argument("--latency", type=float, default=0.5, help="Stub server seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Stub server extra seconds per request, at most")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent uploads")
+    parser.add_argument("--format", default='flac', help="Upload format ('none' uploads WAV as recorded)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the report to this file")
+    parser.add_argument("--keep", action="store_true", help="Keep the working directory")
+    args = parser.parse_args()
+
+    fixtures = [os.path.abspath(fixture) for fixture in args.fixtures]
+    json_path = os.path.abspath(args.json) if args.json else None
+    # Everything, including the conversations directory, lives in a scratch directory
+    workdir = tempfile.mkdtemp(prefix="benchmark_")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        if not fixtures:
+            fixtures = generate_fixtures(workdir, args.generate, args.duration, args.seed)
+        report = run_benchmark(
+            fixtures,
+            chunk_duration=args.chunk_duration,
+            speed=args.speed,
+            latency=args.latency,
+            jitter=args.jitter,
+            error_rate=args.error_rate,
+            workers=args.workers,
+            upload_format=None if args.format == 'none' else args.format,
+            seed=args.seed
+        )
+    finally:
+        os.chdir(cwd)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    print_report(report)
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,43 @@
 # config.py
 
 OPENAI_API_KEY = 'sk-proj-tICQb7JF42DQFJ3HWQJqT3BlbkFJXDM2MKh6VmekS16yPRio'
+
+# Base URL of the OpenAI-compatible transcription API
+OPENAI_API_BASE = 'https://api.openai.com/v1'
+
+# Audio is resampled and compressed before upload ('flac', 'opus', 'mp3', 'wav', or None to send recordings as-is)
+UPLOAD_AUDIO_FORMAT = 'flac'
+UPLOAD_SAMPLE_RATE = 16000
+
+# Imported audio files are split into parts of at most this many seconds before upload
+IMPORT_CHUNK_DURATION = 240
+# The API rejects larger files; compressed audio that can't be decoded and split must fit whole
+MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+
+# Transcriptions are cached on disk so the same audio is never paid for twice
+TRANSCRIPTION_CACHE_DIR = 'conversations/cache'
+TRANSCRIPTION_CACHE_MAX_BYTES = 100 * 1024 * 1024
+TRANSCRIPTION_CACHE_MAX_AGE = 90 * 24 * 3600  # Seconds since last use
+
+# Pipeline metrics are written here periodically ('prometheus' text format or 'json').
+# Kept in a subdirectory so rewriting it doesn't look like a metadata change.
+METRICS_FILE = 'conversations/metrics/metrics.prom'
+METRICS_FORMAT = 'prometheus'
+METRICS_INTERVAL = 15  # Seconds
+
+# Every transcription request goes through one scheduler, which stays under the API's rate limits
+# and sends chunks of a recording in progress ahead of imported files
+TRANSCRIPTION_REQUESTS_PER_MINUTE = 50
+TRANSCRIPTION_AUDIO_SECONDS_PER_MINUTE = 7200
+TRANSCRIPTION_WORKERS = 4
+TRANSCRIPTION_MAX_PENDING = 16  # Queued import chunks before splitting waits for uploads to catch up
+
+# Recordings are kept as compressed audio in the archive within a disk budget, so they can be re-transcribed later.
+# Leftover WAVs in the recordings directories are moved there in the background.
+ARCHIVE_RECORDINGS = True
+ARCHIVE_FORMAT = 'flac'
+ARCHIVE_SAMPLE_RATE = 16000
+ARCHIVE_MAX_BYTES = 2 * 1024 ** 3
+ARCHIVE_MAX_AGE = 365 * 24 * 3600  # Seconds since last use
+ARCHIVE_COMPACT_INTERVAL = 600  # Seconds between scans for leftover WAVs
+ARCHIVE_COMPACT_GRACE = 600  # Seconds a WAV must be untouched before it counts as left over
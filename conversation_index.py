@@ -0,0 +1,120 @@
+# conversation_index.py
+
+import threading
+
+EMPTY_STATS = {'last_modified': 0, 'segments': 0, 'bytes': 0}
+
+def get_leaf(tree, path):
+    # The folder dict or conversation id at path, or None
+    node = tree
+    for part in path:
+        node = node.get(part) if isinstance(node, dict) else None
+    return node
+
+class ConversationIndex:
+    """
+    In-memory metadata for every conversation (last modified time, segment
+    count and text size) plus aggregates for every folder, so sorting and
+    displaying the tree never touches the disk. It is loaded with one
+    aggregate query, kept current by ConversationManager on every write, and
+    reloaded when the store is changed from outside.
+
+    Conversations are keyed by the id held in their leaf of the tree, which
+    is always read from the tree passed in, so the index can be built before
+    that tree is published.
+
+    lock also guards the tree itself: ConversationManager changes it only
+    while holding the lock, so writes from the transcript saver's thread
+    never walk a folder that is being changed.
+
+    :param transcript_store: TranscriptStore the stats are read from.
+    """
+    def __init__(self, transcript_store):
+        self.transcript_store = transcript_store
+        self.lock = threading.RLock()
+        self.conversations = {}  # conversation key -> stats
+        self.folders = {}  # folder path tuple -> stats plus a 'conversations' count
+        self.paths = {}  # conversation key -> path
+
+    def load(self):
+        """Reloads all conversation stats. Returns True if anything changed."""
+        stats = self.transcript_store.get_conversation_stats()
+        with self.lock:
+            changed = stats != self.conversations
+            self.conversations = stats
+        return changed
+
+    def get_conversation(self, key):
+        return self.conversations.get(key, EMPTY_STATS)
+
+    def get_folder(self, path):
+        return self.folders.get(tuple(path), dict(EMPTY_STATS, conversations=0))
+
+    def paths_for_keys(self, keys):
+        return [self.paths[key] for key in keys if key in self.paths]
+
+    def rebuild(self, tree):
+        """Recomputes every folder aggregate in one in-memory walk of the tree."""
+        with self.lock:
+            self.folders = {}
+            self.paths = {}
+            self.aggregate(tree, [])
+
+    def refresh_paths(self, tree, paths):
+        """
+        Reloads the stats of a few conversations after they were written and
+        updates only the folders above them.
+        """
+        with self.lock:
+            keys = [get_leaf(tree, path) for path in paths]
+        # The store is read without the lock so tree changes don't wait for it
+        stats = self.transcript_store.get_conversation_stats(keys)
+        with self.lock:
+            for key, path in zip(keys, paths):
+                if get_leaf(tree, path) != key:
+                    # Moved or deleted while the stats were read
+                    path = self.paths.get(key)
+                    if path is None:
+                        continue
+                self.paths[key] = path
+                if key in stats:
+                    self.conversations[key] = stats[key]
+                else:
+                    self.conversations.pop(key, None)
+                self.update_ancestors(tree, path[:-1])
+
+    def update_ancestors(self, tree, folder_path):
+        # Each level only combines its direct children, using the aggregates already stored for subfolders
+        with self.lock:
+            for depth in range(len(folder_path), -1, -1):
+                path = folder_path[:depth]
+                node = get_leaf(tree, path)
+                if isinstance(node, dict):
+                    self.folders[tuple(path)] = self.combine(node, path)
+
+    def aggregate(self, node, path):
+        # Post-order walk so every folder is combined from its already computed subfolders
+        for name, value in node.items():
+            child_path = path + [name]
+            if isinstance(value, dict):
+                self.aggregate(value, child_path)
+            else:
+                self.paths[value] = child_path
+        self.folders[tuple(path)] = self.combine(node, path)
+
+    def combine(self, node, path):
+        totals = dict(EMPTY_STATS, conversations=0)
+        for name, value in node.items():
+            child_path = path + [name]
+            if isinstance(value, dict):
+                stats = self.folders.get(tuple(child_path))
+                if stats is None:
+                    continue
+                totals['conversations'] += stats['conversations']
+            else:
+                stats = self.get_conversation(value)
+                totals['conversations'] += 1
+            totals['last_modified'] = max(totals['last_modified'], stats['last_modified'])
+            totals['segments'] += stats['segments']
+            totals['bytes'] += stats['bytes']
+        return totals
@@ -1,54 +1,151 @@
 # conversation_manager.py
 
-import os
 import json
+import os
 import time
 import shutil
+import threading
+import uuid
+from transcript_store import TranscriptStore
+from tree_journal import TreeJournal
+from conversation_index import ConversationIndex
+from audio_archive import AudioArchive
+from metrics import metrics
+from config import ARCHIVE_FORMAT, ARCHIVE_SAMPLE_RATE, ARCHIVE_MAX_BYTES, ARCHIVE_MAX_AGE
+
+READ_SECONDS = 'conversation_read_seconds'
+WRITE_SECONDS = 'conversation_write_seconds'
+# Ids given to conversations saved before they had one are derived from their path, so an
+# interrupted migration assigns the same ids when it runs again
+LEGACY_ID_NAMESPACE = uuid.UUID('8a4b4d2e-6f0c-4b57-9d0e-3c1f5a7e2b91')
+
+def new_conversation_id():
+    return uuid.uuid4().hex
 
 class ConversationManager:
-    def __init__(self):
+    """
+    Conversation tree, transcripts and their metadata.
+
+    Every conversation has a stable id, stored as its leaf in the tree. The
+    id keys its transcript segments, its archived audio and its directory
+    under data/<first two characters of the id>/, so renaming or moving a
+    folder only changes the tree, whatever it contains.
+
+    :param load: Load the tree and metadata right away. Pass False to call
+                 load() later, e.g. on a background thread while the window
+                 is already showing; until then the tree is empty.
+    """
+    def __init__(self, load=True):
         self.conversations_dir = "conversations"
         os.makedirs(self.conversations_dir, exist_ok=True)
         self.conversations_file = os.path.join(self.conversations_dir, "conversations.json")
+        # Tree mutations are appended to this log and periodically compacted into conversations.json
+        self.conversations_log = os.path.join(self.conversations_dir, "conversations.log")
+        # Per-conversation files such as recordings, in directories sharded by id
+        self.data_dir = os.path.join(self.conversations_dir, "data")
+        self.tree_journal = TreeJournal(self.conversations_file, self.conversations_log)
         self.selected_conversation = None
         self.selected_conversation_path = None
-        self.load_conversations()
+        self.transcript_store = TranscriptStore(os.path.join(self.conversations_dir, "transcripts.sqlite3"))
+        self.conversations = {}
+        # Per-conversation and per-folder metadata, so the tree can be sorted without touching the disk
+        self.index = ConversationIndex(self.transcript_store)
+        # Compressed recordings, per conversation id
+        self.audio_archive = AudioArchive(
+            os.path.join(self.conversations_dir, "archive"),
+            max_bytes=ARCHIVE_MAX_BYTES,
+            max_age=ARCHIVE_MAX_AGE,
+            audio_format=ARCHIVE_FORMAT,
+            sample_rate=ARCHIVE_SAMPLE_RATE
+        )
+        self.loaded = threading.Event()
+        if load:
+            self.load()
 
-    def load_conversations(self):
-        if os.path.exists(self.conversations_file):
-            with open(self.conversations_file, 'r') as f:
-                self.conversations = json.load(f)
-        else:
-            self.conversations = {}
+    def load(self):
+        with metrics.timer('conversation_load_seconds', "Time to load the tree and its metadata"):
+            conversations = self.tree_journal.load()
+            self.migrate_legacy_transcripts()
+            self.migrate_to_stable_ids(conversations)
+            self.index.load()
+            self.index.rebuild(conversations)
+            self.audio_archive.load()
+            # Published last, so readers see either the empty tree or the complete one
+            self.conversations = conversations
+        self.loaded.set()
 
     def save_conversations(self):
-        with open(self.conversations_file, 'w') as f:
-            json.dump(self.conversations, f, indent=4)
+        # Compacts the operation log into a fresh snapshot right away
+        self.tree_journal.compact()
 
     def get_conversations(self):
         return self.conversations
 
     def create_folder(self, folder_name, parent_path=[]):
         node = self.get_node(parent_path)
-        if node is None:
+        if not isinstance(node, dict):
             return False
         if folder_name in node:
             return False
-        node[folder_name] = {}
-        self.save_conversations()
+        with self.index.lock:
+            self.tree_journal.apply({'op': 'create', 'path': parent_path + [folder_name], 'value': {}})
+            self.index.update_ancestors(self.conversations, parent_path + [folder_name])
         return True
 
     def create_conversation(self, name, parent_path=[]):
         node = self.get_node(parent_path)
-        if node is None:
+        if not isinstance(node, dict):
             return False
         if name in node:
             return False
-        node[name] = None  # Conversations are leaves with value None
-        self.save_conversations()
+        # Conversations are leaves holding their id
+        with self.index.lock:
+            self.tree_journal.apply({'op': 'create', 'path': parent_path + [name], 'value': new_conversation_id()})
+        self.index.refresh_paths(self.conversations, [parent_path + [name]])
         self.select_conversation(parent_path + [name])
         return True
 
+    def ensure_conversation(self, path):
+        """Creates the conversation and any missing folders above it. Returns False if path is a folder."""
+        for depth in range(1, len(path)):
+            if self.is_conversation(path[:depth]):
+                return False
+            if self.get_node(path[:depth]) is None:
+                self.create_folder(path[depth - 1], path[:depth - 1])
+        if self.is_conversation(path):
+            return True
+        if self.get_node(path) is not None:
+            return False
+        return self.create_conversation(path[-1], path[:-1])
+
+    def iter_conversation_paths(self, path=[]):
+        """
+        Yields the path of every conversation in the subtree at path (or path
+        itself if it is a conversation), depth first in name order, which is
+        also the order of the paths as lists.
+        """
+        node = self.get_node(path)
+        if isinstance(node, str):
+            yield list(path)
+            return
+        if not isinstance(node, dict):
+            return
+        for name in sorted(node):
+            if isinstance(node[name], dict):
+                yield from self.iter_conversation_paths(path + [name])
+            else:
+                yield path + [name]
+
+    def iter_folder_paths(self, path=[]):
+        # Every folder below path, depth first in name order
+        node = self.get_node(path)
+        if not isinstance(node, dict):
+            return
+        for name in sorted(node):
+            if isinstance(node.get(name), dict):
+                yield path + [name]
+                yield from self.iter_folder_paths(path + [name])
+
     def get_node(self, path):
         node = self.conversations
         for part in path:
@@ -68,66 +165,77 @@ class ConversationManager:
 
     def rename_item(self, old_path, new_name):
         node = self.get_node(old_path[:-1])
-        if node is None:
+        if not isinstance(node, dict):
             return False
-        if new_name in node:
+        if new_name in node or old_path[-1] not in node:
             return False
-        node[new_name] = node.pop(old_path[-1])
-        self.save_conversations()
-        self.selected_conversation = new_name
-        self.selected_conversation_path = old_path[:-1] + [new_name]
+        # Data is keyed by id, so nothing on disk changes
+        with self.index.lock:
+            self.tree_journal.apply({'op': 'rename', 'path': old_path, 'name': new_name})
+            self.index.rebuild(self.conversations)
+        self.update_selection(old_path, old_path[:-1] + [new_name])
         return True
 
-    def delete_item(self, path):
+    def move_item(self, path, new_parent_path):
+        """Moves a folder or conversation into another folder. Like rename, only the tree changes."""
         node = self.get_node(path[:-1])
-        if node is None:
+        target = self.get_node(new_parent_path)
+        if not isinstance(node, dict) or path[-1] not in node or not isinstance(target, dict) or path[-1] in target:
             return False
-        try:
-            del node[path[-1]]
-            self.save_conversations()
-            self.deselect_conversation()
-            # Delete associated files and directories
-            self.delete_associated_files(path)
-            return True
-        except KeyError:
+        if new_parent_path[:len(path)] == path:
+            return False  # Into itself
+        with self.index.lock:
+            self.tree_journal.apply({'op': 'move', 'path': path, 'to': new_parent_path})
+            self.index.rebuild(self.conversations)
+        self.update_selection(path, new_parent_path + [path[-1]])
+        return True
+
+    def update_selection(self, old_path, new_path):
+        # Keeps the selected conversation selected when it or a folder above it changes path
+        selected = self.selected_conversation_path
+        if selected and selected[:len(old_path)] == old_path:
+            self.select_conversation(new_path + selected[len(old_path):])
+
+    def delete_item(self, path):
+        node = self.get_node(path[:-1])
+        if not isinstance(node, dict) or path[-1] not in node:
             return False
+        conversation_ids = [self.get_conversation_key(conversation_path)
+                            for conversation_path in self.iter_conversation_paths(path)]
+        with self.index.lock:
+            self.tree_journal.apply({'op': 'delete', 'path': path})
+            self.index.rebuild(self.conversations)
+        self.deselect_conversation()
+        # Delete the data of every conversation that was in the subtree
+        for conversation_id in conversation_ids:
+            self.delete_conversation_data(conversation_id)
+        return True
 
-    def delete_associated_files(self, path):
-        # Delete transcripts and recordings
-        transcript_path = self.get_transcript_path_from_path(path)
-        if os.path.exists(transcript_path):
-            os.remove(transcript_path)
-        transcript_dir = self.get_transcript_dir_from_path(path)
-        if os.path.exists(transcript_dir):
-            shutil.rmtree(transcript_dir)
-        recordings_dir = self.get_recordings_dir_from_path(path)
-        if os.path.exists(recordings_dir):
-            shutil.rmtree(recordings_dir)
-
-    def get_transcript_path(self):
-        return self.get_transcript_path_from_path(self.selected_conversation_path)
-
-    def get_transcript_path_from_path(self, path):
-        if not path:
-            return None
-        filename = "_".join(path) + "_transcript.txt"
-        return os.path.join(self.conversations_dir, filename)
+    def delete_conversation_data(self, conversation_id):
+        # Transcripts, recordings and archived audio
+        self.transcript_store.delete_conversation(conversation_id)
+        self.audio_archive.delete_conversation(conversation_id)
+        conversation_dir = self.get_conversation_dir(conversation_id)
+        if os.path.exists(conversation_dir):
+            shutil.rmtree(conversation_dir)
 
     def get_transcript(self):
         transcripts = self.get_transcripts()
         return "\n\n".join([text for timestamp, text in transcripts])
 
     def save_transcript(self, transcript):
-        timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
-        transcripts = self.get_transcripts()
-        transcripts.append((timestamp, transcript))
-        self.save_transcripts(transcripts)
+        self.append_transcript(transcript)
 
-    def append_transcript(self, text):
+    def append_transcript(self, text, path=None):
+        # Recordings where the VAD found no speech transcribe to nothing; they don't get a segment
+        if not text.strip():
+            return None
         timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
-        transcripts = self.get_transcripts()
-        transcripts.append((timestamp, text))
-        self.save_transcripts(transcripts)
+        path = path or self.selected_conversation_path
+        with metrics.timer(WRITE_SECONDS, "Time of transcript store writes", operation='append'):
+            segment_id = self.transcript_store.append(self.get_conversation_key(path), timestamp, text)
+            self.index.refresh_paths(self.conversations, [path])
+        return segment_id
 
     def get_recordings_dir(self):
         return self.get_recordings_dir_from_path(self.selected_conversation_path)
@@ -135,52 +243,190 @@ class ConversationManager:
     def get_recordings_dir_from_path(self, path):
         if not path:
             return None
-        dir_name = "_".join(path) + "_recordings"
-        recordings_dir = os.path.join(self.conversations_dir, dir_name)
+        recordings_dir = os.path.join(self.get_conversation_dir(self.get_conversation_key(path)), "recordings")
         os.makedirs(recordings_dir, exist_ok=True)
         return recordings_dir
 
+    def get_conversation_dir(self, conversation_id):
+        # Sharded by the first characters of the id, so no directory holds more than a few hundred entries
+        return os.path.join(self.data_dir, conversation_id[:2], conversation_id)
+
     def get_conversation_last_modified(self, path):
-        transcript_dir = self.get_transcript_dir_from_path(path)
-        if os.path.exists(transcript_dir):
-            return os.path.getmtime(transcript_dir)
-        else:
-            return 0
+        return self.get_conversation_stats(path)['last_modified']
+
+    def get_folder_last_modified(self, path):
+        return self.get_folder_stats(path)['last_modified']
+
+    def get_conversation_stats(self, path):
+        # {'last_modified', 'segments', 'bytes'} from the in-memory index
+        return self.index.get_conversation(self.get_conversation_key(path))
+
+    def get_folder_stats(self, path):
+        # Aggregate over every conversation below the folder, plus a 'conversations' count
+        return self.index.get_folder(path)
+
+    def get_metadata_files(self):
+        # Files whose modification by another process means the metadata index may be stale
+        db_path = self.transcript_store.db_path
+        return [db_path, db_path + "-wal"]
+
+    def reload_metadata(self):
+        """
+        Reloads conversation metadata after the store was changed from outside.
+        Returns True if anything changed.
+        """
+        # The watcher also fires on this process's own writes, which the index already has
+        if not self.transcript_store.changed_externally():
+            return False
+        changed = self.index.load()
+        if changed:
+            self.index.rebuild(self.conversations)
+        return changed
+
+    def is_conversation(self, path):
+        node = self.get_node(path[:-1]) if path else None
+        return isinstance(node, dict) and isinstance(node.get(path[-1]), str)
+
+    def get_conversation_key(self, path):
+        # Stable id of a conversation, which keys all of its data; None if path isn't a conversation
+        value = self.get_node(path)
+        return value if isinstance(value, str) else None
+
+    def get_conversation_path(self, conversation_id):
+        # Current path of a conversation, or None once it has been deleted
+        paths = self.index.paths_for_keys([conversation_id])
+        return paths[0] if paths else None
+
+    def migrate_legacy_transcripts(self):
+        # One-time move of <key>_transcripts/<timestamp>.txt directories into the transcript store
+        for dir_name in os.listdir(self.conversations_dir):
+            transcript_dir = os.path.join(self.conversations_dir, dir_name)
+            if dir_name.endswith("_transcripts") and os.path.isdir(transcript_dir):
+                key = dir_name[:-len("_transcripts")]
+                count = self.transcript_store.import_legacy_dir(key, transcript_dir)
+                print(f"Migrated {count} transcript segments of '{key}'.")
+
+    def migrate_to_stable_ids(self, tree):
+        """
+        One-time move of the data of conversations saved before they had ids,
+        whose transcripts, recordings and archive were named after
+        "_".join(path). The tree snapshot written last commits the migration;
+        until then every step can safely be repeated.
+        """
+        legacy = {}
+        self.collect_legacy_conversations(tree, [], legacy)
+        if not legacy:
+            return
+        with self.transcript_store.lock, self.transcript_store.connection:
+            for path, conversation_id in legacy.items():
+                self.transcript_store.connection.execute(
+                    "UPDATE segments SET conversation = ? WHERE conversation = ?", (conversation_id, "_".join(path))
+                )
+        for path, conversation_id in legacy.items():
+            old_key = "_".join(path)
+            conversation_dir = self.get_conversation_dir(conversation_id)
+            moves = [
+                (os.path.join(self.conversations_dir, old_key + "_recordings"),
+                 os.path.join(conversation_dir, "recordings")),
+                (os.path.join(self.conversations_dir, old_key + "_transcript.txt"),
+                 os.path.join(conversation_dir, "transcript.txt")),
+                (os.path.join(self.audio_archive.archive_dir, old_key),
+                 self.audio_archive.get_conversation_dir(conversation_id)),
+            ]
+            for old, new in moves:
+                # Paths that collided under the old naming share one set of files; the first one keeps it
+                if os.path.exists(old) and not os.path.exists(new):
+                    os.makedirs(os.path.dirname(new), exist_ok=True)
+                    os.replace(old, new)
+        for path, conversation_id in legacy.items():
+            node = tree
+            for part in path[:-1]:
+                node = node[part]
+            node[path[-1]] = conversation_id
+        self.tree_journal.compact()
+        print(f"Gave {len(legacy)} conversations stable ids.")
+
+    def collect_legacy_conversations(self, node, path, legacy):
+        for name, value in node.items():
+            if isinstance(value, dict):
+                self.collect_legacy_conversations(value, path + [name], legacy)
+            elif value is None:
+                legacy[tuple(path + [name])] = uuid.uuid5(LEGACY_ID_NAMESPACE, json.dumps(path + [name])).hex
 
-    def get_transcript_dir(self):
-        return self.get_transcript_dir_from_path(self.selected_conversation_path)
+    def migrate_job_journal(self, journal):
+        """
+        Points unfinished jobs saved with a conversation path at the
+        conversation's id, and their chunks at its new recordings directory.
+        Jobs of conversations that no longer exist get no conversation.
+        """
+        for job in journal.get_unfinished_jobs():
+            path = job['conversation']
+            if not isinstance(path, list):
+                continue
+            conversation_id = self.get_conversation_key(path)
+            old_dir = os.path.join(self.conversations_dir, "_".join(path) + "_recordings")
+            new_dir = None
+            if conversation_id:
+                new_dir = os.path.join(self.get_conversation_dir(conversation_id), "recordings")
+            journal.reassign_job(job['id'], conversation_id, old_dir, new_dir)
 
-    def get_transcript_dir_from_path(self, path):
+    def get_transcripts(self, path=None):
+        return [(timestamp, text) for segment_id, timestamp, text in self.get_segments(path)]
+
+    def get_segments(self, path=None, offset=0, limit=None):
+        path = path or self.selected_conversation_path
         if not path:
-            return None
-        dir_name = "_".join(path) + "_transcripts"
-        transcript_dir = os.path.join(self.conversations_dir, dir_name)
-        return transcript_dir
-
-    def get_transcripts(self):
-        transcript_dir = self.get_transcript_dir()
-        transcripts = []
-        if transcript_dir and os.path.exists(transcript_dir):
-            for filename in sorted(os.listdir(transcript_dir)):
-                if filename.endswith('.txt'):
-                    filepath = os.path.join(transcript_dir, filename)
-                    with open(filepath, 'r') as f:
-                        text = f.read()
-                    timestamp = filename.rstrip('.txt')
-                    transcripts.append((timestamp, text))
-        return transcripts
-
-    def save_transcripts(self, transcripts):
-        transcript_dir = self.get_transcript_dir()
-        if transcript_dir:
-            os.makedirs(transcript_dir, exist_ok=True)
-            # Clear existing transcripts
-            for filename in os.listdir(transcript_dir):
-                if filename.endswith('.txt'):
-                    os.remove(os.path.join(transcript_dir, filename))
-            # Save new transcripts
-            for timestamp, text in transcripts:
-                filename = f"{timestamp}.txt"
-                filepath = os.path.join(transcript_dir, filename)
-                with open(filepath, 'w') as f:
-                    f.write(text)
\ No newline at end of file
+            return []
+        with metrics.timer(READ_SECONDS, "Time of transcript store reads", operation='get_segments'):
+            return self.transcript_store.get_segments(self.get_conversation_key(path), offset, limit)
+
+    def iter_segments(self, path, batch_size=500):
+        # Batches of (segment_id, timestamp, text), for reading conversations too long to hold in memory
+        return self.transcript_store.iter_segments(self.get_conversation_key(path), batch_size)
+
+    def get_segment_count(self, path=None):
+        path = path or self.selected_conversation_path
+        if not path:
+            return 0
+        with metrics.timer(READ_SECONDS, "Time of transcript store reads", operation='count'):
+            return self.transcript_store.count(self.get_conversation_key(path))
+
+    def update_segment(self, segment_id, text):
+        self.update_segments({segment_id: text})
+
+    def update_segments(self, texts):
+        # texts: {segment_id: text}; only these segments are written, in one transaction
+        with metrics.timer(WRITE_SECONDS, "Time of transcript store writes", operation='update'):
+            self.transcript_store.update_many(texts)
+            keys = self.transcript_store.get_conversations_of_segments(texts)
+            self.index.refresh_paths(self.conversations, self.index.paths_for_keys(keys))
+
+    def search(self, query, limit=50):
+        """
+        Full-text search over every conversation's segments.
+
+        :return: [(path, segment_id, timestamp, snippet)], best match first.
+        """
+        results = []
+        with metrics.timer(READ_SECONDS, "Time of transcript store reads", operation='search'):
+            found = self.transcript_store.search(query, limit)
+        for segment_id, key, timestamp, snippet in found:
+            paths = self.index.paths_for_keys([key])
+            if paths:  # Segments of conversations no longer in the tree are skipped
+                results.append((paths[0], segment_id, timestamp, snippet))
+        return results
+
+    def get_segment_row(self, segment_id):
+        return self.transcript_store.get_segment_row(segment_id)
+
+    def save_transcripts(self, transcripts, path=None):
+        path = path or self.selected_conversation_path
+        if path:
+            with metrics.timer(WRITE_SECONDS, "Time of transcript store writes", operation='replace_all'):
+                self.transcript_store.replace_all(self.get_conversation_key(path), transcripts)
+                self.index.refresh_paths(self.conversations, [path])
+
+    def close(self):
+        self.audio_archive.close()
+        self.tree_journal.close()
+        self.transcript_store.close()
@@ -1,56 +1,261 @@
 # conversation_tree.py
 
-from PyQt5.QtWidgets import QTreeWidget, QTreeWidgetItem
+from PyQt5.QtWidgets import QTreeView, QAbstractItemView
+from PyQt5.QtCore import QAbstractItemModel, QModelIndex, Qt, pyqtSignal
+from metrics import metrics
 
-class ConversationTree(QTreeWidget):
+LAST_MODIFIED_ROLE = Qt.UserRole + 1
+
+class TreeNode:
+    __slots__ = ('name', 'parent', 'is_folder', 'last_modified', 'children', 'row')
+
+    def __init__(self, name, parent, is_folder, last_modified=0):
+        self.name = name
+        self.parent = parent
+        self.is_folder = is_folder
+        self.last_modified = last_modified
+        self.children = None  # None until fetched; folders only
+        self.row = 0
+
+    def path(self):
+        path = []
+        node = self
+        while node.parent is not None:
+            path.append(node.name)
+            node = node.parent
+        return path[::-1]
+
+    def renumber(self, start=0):
+        for row in range(start, len(self.children)):
+            self.children[row].row = row
+
+class ConversationTreeModel(QAbstractItemModel):
+    """
+    Item model over the ConversationManager tree. A folder's children are only
+    created when it is first expanded (canFetchMore/fetchMore), and creates,
+    renames and deletes update the single affected row instead of rebuilding
+    the tree. Siblings are kept sorted by last modified time, newest first.
+    """
     def __init__(self, conversation_manager):
         super().__init__()
         self.conversation_manager = conversation_manager
+        self.root = TreeNode(None, None, True)
+
+    def node(self, index):
+        return index.internalPointer() if index.isValid() else self.root
+
+    def index(self, row, column, parent=QModelIndex()):
+        node = self.node(parent)
+        if node.children is None or not 0 <= row < len(node.children) or column != 0:
+            return QModelIndex()
+        return self.createIndex(row, 0, node.children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        parent = index.internalPointer().parent
+        if parent is None or parent is self.root:
+            return QModelIndex()
+        return self.createIndex(parent.row, 0, parent)
+
+    def rowCount(self, parent=QModelIndex()):
+        node = self.node(parent)
+        return len(node.children) if node.children is not None else 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        if role == Qt.DisplayRole:
+            return node.name
+        if role == LAST_MODIFIED_ROLE:
+            return node.last_modified
+        return None
+
+    def hasChildren(self, parent=QModelIndex()):
+        node = self.node(parent)
+        if not node.is_folder:
+            return False
+        if node.children is not None:
+            return bool(node.children)
+        return bool(self.conversation_manager.get_node(node.path()))
+
+    def canFetchMore(self, parent=QModelIndex()):
+        node = self.node(parent)
+        return node.is_folder and node.children is None
+
+    def fetchMore(self, parent=QModelIndex()):
+        node = self.node(parent)
+        if not node.is_folder or node.children is not None:
+            return
+        with metrics.timer('tree_fetch_seconds', "Time to load the children of a folder"):
+            children = [self.make_node(node, name) for name in self.conversation_manager.get_node(node.path()) or {}]
+            children.sort(key=lambda child: child.last_modified, reverse=True)
+        node.children = []
+        if children:
+            self.beginInsertRows(parent, 0, len(children) - 1)
+            node.children = children
+            node.renumber()
+            self.endInsertRows()
+
+    def make_node(self, parent, name):
+        path = parent.path() + [name]
+        is_folder = isinstance(self.conversation_manager.get_node(path), dict)
+        if is_folder:
+            last_modified = self.conversation_manager.get_folder_last_modified(path)
+        else:
+            last_modified = self.conversation_manager.get_conversation_last_modified(path)
+        return TreeNode(name, parent, is_folder, last_modified)
+
+    def find(self, path):
+        # Returns the node for path, or None if it (or an ancestor) hasn't been fetched
+        node, depth = self.find_deepest(path)
+        return node if depth == len(path) else None
+
+    def find_deepest(self, path):
+        # Deepest fetched node along path and how many path parts it covers
+        node = self.root
+        for depth, name in enumerate(path):
+            child = None
+            if node.children is not None:
+                child = next((child for child in node.children if child.name == name), None)
+            if child is None:
+                return node, depth
+            node = child
+        return node, len(path)
+
+    def fetch_path(self, path):
+        # Like find, but fetches the folders along path first
+        node = self.root
+        for name in path:
+            if node.children is None:
+                self.fetchMore(self.index_for_node(node))
+            node = next((child for child in node.children or [] if child.name == name), None)
+            if node is None:
+                return None
+        return node
+
+    def index_for_node(self, node):
+        if node is None or node is self.root:
+            return QModelIndex()
+        return self.createIndex(node.row, 0, node)
+
+    def sorted_row(self, parent, last_modified):
+        # First row whose sibling is older, keeping newest-first order
+        for row, child in enumerate(parent.children):
+            if child.last_modified < last_modified:
+                return row
+        return len(parent.children)
+
+    def insert_item(self, parent_path, name):
+        parent = self.find(parent_path)
+        if parent is None:
+            return
+        if parent.children is None:
+            # Not fetched yet; it will show up when the folder is expanded, but it may need an expand arrow now
+            index = self.index_for_node(parent)
+            self.dataChanged.emit(index, index)
+            return
+        node = self.make_node(parent, name)
+        row = self.sorted_row(parent, node.last_modified)
+        self.beginInsertRows(self.index_for_node(parent), row, row)
+        parent.children.insert(row, node)
+        parent.renumber(row)
+        self.endInsertRows()
+
+    def rename_item(self, path, new_name):
+        node = self.find(path)
+        if node is None:
+            return
+        node.name = new_name
+        index = self.index_for_node(node)
+        self.dataChanged.emit(index, index, [Qt.DisplayRole])
+
+    def remove_item(self, path):
+        node = self.find(path)
+        if node is None:
+            return
+        parent = node.parent
+        row = node.row
+        self.beginRemoveRows(self.index_for_node(parent), row, row)
+        del parent.children[row]
+        parent.renumber(row)
+        self.endRemoveRows()
+
+    def touch_item(self, path):
+        """Moves a conversation and its folders to the top after it was modified."""
+        # Ancestors that have been fetched move even if the conversation itself isn't shown yet
+        node, _ = self.find_deepest(path)
+        last_modified = self.conversation_manager.get_conversation_last_modified(path)
+        while node is not None and node is not self.root:
+            node.last_modified = max(node.last_modified, last_modified)
+            parent = node.parent
+            row = node.row
+            new_row = self.sorted_row(parent, node.last_modified)
+            if new_row < row:
+                parent_index = self.index_for_node(parent)
+                self.beginMoveRows(parent_index, row, row, parent_index, new_row)
+                parent.children.insert(new_row, parent.children.pop(row))
+                parent.renumber(new_row)
+                self.endMoveRows()
+            node = parent
+
+    def reset(self):
+        self.beginResetModel()
+        self.root = TreeNode(None, None, True)
+        self.endResetModel()
+
+class ConversationTree(QTreeView):
+    itemSelectionChanged = pyqtSignal()
+
+    def __init__(self, conversation_manager):
+        super().__init__()
+        self.conversation_manager = conversation_manager
+        self.tree_model = ConversationTreeModel(conversation_manager)
+        self.setModel(self.tree_model)
         self.setHeaderHidden(True)
-        self.refresh()
+        self.setUniformRowHeights(True)
+        self.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.selectionModel().selectionChanged.connect(lambda *args: self.itemSelectionChanged.emit())
 
     def refresh(self):
-        self.clear()
-        self.build_tree(self.conversation_manager.get_conversations(), self)
-
-    def build_tree(self, data, parent, parent_path=[]):
-        items = []
-        for key, value in data.items():
-            item = QTreeWidgetItem([key])
-            full_path = parent_path + [key]
-            if isinstance(value, dict):
-                # Folder
-                self.build_tree(value, item, full_path)
-                # Get the latest modified time from children
-                item_last_modified = max(
-                    (child.data(0, 1) for child in self.iterate_children(item)),
-                    default=0
-                )
-            else:
-                # Conversation
-                item_last_modified = self.conversation_manager.get_conversation_last_modified(full_path)
-            item.setData(0, 1, item_last_modified)
-            items.append((item_last_modified, item))
-        # Sort items based on last modified time
-        for _, item in sorted(items, key=lambda x: x[0], reverse=True):
-            parent.addTopLevelItem(item) if parent == self else parent.addChild(item)
+        # Full rebuild; only needed when the tree changed outside this window
+        with metrics.timer('tree_refresh_seconds', "Time to rebuild the conversation tree"):
+            self.tree_model.reset()
+
+    def insert_item(self, parent_path, name):
+        self.tree_model.insert_item(parent_path, name)
+
+    def rename_item(self, path, new_name):
+        self.tree_model.rename_item(path, new_name)
+
+    def remove_item(self, path):
+        self.tree_model.remove_item(path)
+
+    def touch_item(self, path):
+        self.tree_model.touch_item(path)
+
+    def select_path(self, path):
+        """Expands the folders above path and selects it. Returns False if it isn't in the tree."""
+        index = self.tree_model.index_for_node(self.tree_model.fetch_path(path))
+        if not index.isValid():
+            return False
+        parent = index.parent()
+        while parent.isValid():
+            self.expand(parent)
+            parent = parent.parent()
+        self.setCurrentIndex(index)
+        self.scrollTo(index)
+        return True
 
     def get_selected_path(self):
-        item = self.currentItem()
-        if item:
-            path = []
-            while item:
-                path.insert(0, item.text(0))
-                item = item.parent()
-            return path
+        indexes = self.selectionModel().selectedIndexes()
+        if indexes:
+            return indexes[0].internalPointer().path()
         return []
 
     def is_conversation(self, path):
-        node = self.conversation_manager.get_node(path[:-1])
-        return node.get(path[-1], {}) is None
-
-    def iterate_children(self, item):
-        for i in range(item.childCount()):
-            child = item.child(i)
-            yield child
-            yield from self.iterate_children(child)
\ No newline at end of file
+        return self.conversation_manager.is_conversation(path)
@@ -0,0 +1,253 @@
+# ingest.py
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from conversation_manager import ConversationManager
+from tree_journal import JournalLockedError
+from job_journal import JobJournal, DONE, OPEN, UNSPLIT, INGEST_SOURCE_PREFIX
+from transcriber import Transcriber
+from transcription_cache import TranscriptionCache
+from transcription_queue import TranscriptionQueue
+from transcription_scheduler import TranscriptionScheduler
+from config import (
+    OPENAI_API_KEY, OPENAI_API_BASE, UPLOAD_AUDIO_FORMAT, UPLOAD_SAMPLE_RATE, IMPORT_CHUNK_DURATION,
+    TRANSCRIPTION_CACHE_DIR, TRANSCRIPTION_CACHE_MAX_BYTES, TRANSCRIPTION_CACHE_MAX_AGE,
+    TRANSCRIPTION_REQUESTS_PER_MINUTE, TRANSCRIPTION_AUDIO_SECONDS_PER_MINUTE, TRANSCRIPTION_WORKERS,
+    TRANSCRIPTION_MAX_PENDING
+)
+
+AUDIO_EXTENSIONS = ('.wav', '.flac', '.mp3', '.m4a', '.mp4', '.mpeg', '.mpga', '.ogg', '.webm')
+
+def find_audio_files(directory, recursive=False):
+    if not recursive:
+        names = sorted(os.listdir(directory))
+        return [os.path.join(directory, name) for name in names if name.lower().endswith(AUDIO_EXTENSIONS)]
+    files = []
+    for root, dirs, names in os.walk(directory):
+        dirs.sort()
+        files.extend(os.path.join(root, name) for name in sorted(names) if name.lower().endswith(AUDIO_EXTENSIONS))
+    return files
+
+class Ingester:
+    """
+    Transcribes a batch of audio files into one conversation without the
+    GUI. Up to `jobs` files are split at once, their chunks are uploaded
+    through one shared TranscriptionScheduler, and transcripts are appended
+    in file order within a run. A file that fails is appended when a later
+    run retries it, after the files that succeeded before it.
+
+    Every file is a job in the JobJournal, so an interrupted run picks up
+    where it stopped: finished files are skipped, and files that were being
+    transcribed resume at their first unfinished chunk.
+    """
+    def __init__(self, conversation_manager, transcriber, journal, conversation_path, scheduler, jobs=2,
+                 chunk_duration=IMPORT_CHUNK_DURATION):
+        self.conversation_manager = conversation_manager
+        self.transcriber = transcriber
+        self.journal = journal
+        self.conversation_path = conversation_path
+        self.conversation_id = conversation_manager.get_conversation_key(conversation_path)
+        self.scheduler = scheduler
+        self.jobs = jobs
+        self.chunk_duration = chunk_duration
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.files_total = 0
+        self.files_done = 0
+        self.files_failed = 0
+        self.chunks_submitted = 0
+        self.chunks_done = 0
+        self.chunks_failed = 0
+
+    def run(self, files):
+        """Ingests files in order. Returns the number of files that failed."""
+        pending = []
+        for file_path in files:
+            stat = os.stat(file_path)
+            if self.journal.is_ingested(file_path, stat.st_size, stat.st_mtime):
+                print(f"Skipping {file_path}: already ingested.")
+            else:
+                pending.append((file_path, stat))
+        self.files_total = len(pending)
+        unfinished = {job['source'][len(INGEST_SOURCE_PREFIX):]: job for job in self.journal.get_unfinished_jobs()
+                      if job['source'].startswith(INGEST_SOURCE_PREFIX)}
+
+        with ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix="ingest") as executor:
+            futures = [executor.submit(self.transcribe_file, file_path, unfinished.get(file_path))
+                       for file_path, stat in pending]
+            # Results are saved in file order, whatever order they finish in
+            for (file_path, stat), future in zip(pending, futures):
+                job_id, text = future.result()
+                if text is None:
+                    self.files_failed += 1
+                    print(f"\nFailed to transcribe {file_path}; run again to retry its failed chunks.")
+                    continue
+                self.conversation_manager.append_transcript(text, self.conversation_path)
+                self.journal.finish_ingest(job_id, file_path, stat.st_size, stat.st_mtime, self.conversation_id)
+                self.files_done += 1
+                self.report_progress()
+        print()
+        return self.files_failed
+
+    def transcribe_file(self, file_path, job=None):
+        # Runs on an ingest thread; returns (job_id, text or None) once every chunk has finished
+        recordings_dir = self.conversation_manager.get_recordings_dir_from_path(self.conversation_path)
+        # Splitting was interrupted or failed, so the job is missing parts; start the file over
+        if job and (job['state'] == OPEN or
+                    any(chunk['state'] == UNSPLIT for chunk in self.journal.get_chunks(job['id']))):
+            self.discard_job(job)
+            job = None
+        done = threading.Event()
+        result = {}
+
+        def on_complete(text):
+            result['text'] = text
+            done.set()
+
+        def on_error(failed_chunks):
+            done.set()
+
+        if job:
+            job_id = job['id']
+        else:
+            job_id = self.journal.create_job(self.conversation_id, INGEST_SOURCE_PREFIX + file_path)
+        queue = TranscriptionQueue(
+            self.transcriber,
+            on_complete=on_complete,
+            on_error=on_error,
+            journal=self.journal,
+            job_id=job_id,
+            on_chunk_complete=self.on_chunk_complete,
+            scheduler=self.scheduler
+        )
+        if job:
+            # Chunks finished in an earlier run aren't uploaded again
+            chunks = self.journal.get_chunks(job_id)
+            self.count_submitted(sum(1 for chunk in chunks if chunk['state'] != DONE))
+            queue.resume()
+        else:
+            parts_dir = tempfile.mkdtemp(prefix="import_", dir=recordings_dir)
+            self.count_submitted(queue.submit_file(file_path, parts_dir, self.chunk_duration))
+        queue.close()
+        done.wait()
+        if 'text' in result:
+            self.remove_parts_dir(self.journal.get_chunks(job_id))
+        return job_id, result.get('text')
+
+    def discard_job(self, job):
+        chunks = self.journal.get_chunks(job['id'])
+        for chunk in chunks:
+            if os.path.exists(chunk['path']):
+                os.remove(chunk['path'])
+        self.remove_parts_dir(chunks)
+        self.journal.finish_job(job['id'])
+
+    def remove_parts_dir(self, chunks):
+        for directory in {os.path.dirname(chunk['path']) for chunk in chunks}:
+            if os.path.basename(directory).startswith("import_"):
+                shutil.rmtree(directory, ignore_errors=True)
+
+    def count_submitted(self, count):
+        with self.lock:
+            self.chunks_submitted += count
+        self.report_progress()
+
+    def on_chunk_complete(self, chunk_path, text):
+        with self.lock:
+            if text is None:
+                self.chunks_failed += 1
+            else:
+                self.chunks_done += 1
+        self.report_progress()
+
+    def report_progress(self):
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            rate = self.chunks_done / elapsed * 60 if elapsed else 0
+            line = (f"Files {self.files_done}/{self.files_total} ({self.files_failed} failed), "
+                    f"chunks {self.chunks_done}/{self.chunks_submitted} ({self.chunks_failed} failed), "
+                    f"{rate:.1f} chunks/min, {elapsed:.0f}s elapsed")
+        eta = self.scheduler.get_stats()['eta_seconds']
+        if eta is not None:
+            line += f", queue empty in about {eta:.0f}s"
+        # Rewrite one status line on a terminal; one line per update otherwise
+        if sys.stdout.isatty():
+            print("\r" + line, end="", flush=True)
+        else:
+            print(line, flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Transcribe a directory of audio files into a conversation, without the GUI."
+    )
+    parser.add_argument("directory", help="Directory containing the audio files")
+    parser.add_argument("conversation", help="Conversation path, e.g. 'Meetings/2024/Standups'")
+    parser.add_argument("--recursive", action="store_true", help="Include subdirectories")
+    parser.add_argument("--jobs", type=int, default=2, help="Files transcribed at the same time")
+    parser.add_argument("--workers", type=int, default=TRANSCRIPTION_WORKERS, help="Concurrent uploads")
+    parser.add_argument("--requests-per-minute", type=float, default=TRANSCRIPTION_REQUESTS_PER_MINUTE,
+                        help="API request limit (0 for none)")
+    parser.add_argument("--audio-seconds-per-minute", type=float, default=TRANSCRIPTION_AUDIO_SECONDS_PER_MINUTE,
+                        help="Seconds of audio uploaded per minute (0 for no limit)")
+    parser.add_argument("--chunk-duration", type=float, default=IMPORT_CHUNK_DURATION,
+                        help="Maximum seconds of audio per upload")
+    parser.add_argument("--data-dir", default=".", help="Directory containing the app's conversations directory")
+    args = parser.parse_args()
+
+    files = [os.path.abspath(file_path) for file_path in find_audio_files(args.directory, args.recursive)]
+    if not files:
+        print(f"No audio files found in {args.directory}.")
+        return 0
+    conversation_path = [part for part in args.conversation.split("/") if part]
+    if not conversation_path:
+        parser.error("conversation path is empty")
+    os.chdir(args.data_dir)
+
+    try:
+        conversation_manager = ConversationManager()
+    except JournalLockedError:
+        print("The conversations are open in the app or another command; close it and try again.")
+        return 1
+    if not conversation_manager.ensure_conversation(conversation_path):
+        print(f"'{args.conversation}' is a folder, not a conversation.")
+        return 1
+    journal = JobJournal(os.path.join(conversation_manager.conversations_dir, "jobs.sqlite3"))
+    conversation_manager.migrate_job_journal(journal)
+    transcriber = Transcriber(
+        OPENAI_API_KEY,
+        upload_format=UPLOAD_AUDIO_FORMAT,
+        upload_sample_rate=UPLOAD_SAMPLE_RATE,
+        cache=TranscriptionCache(
+            TRANSCRIPTION_CACHE_DIR,
+            max_bytes=TRANSCRIPTION_CACHE_MAX_BYTES,
+            max_age=TRANSCRIPTION_CACHE_MAX_AGE
+        ),
+        api_base=OPENAI_API_BASE
+    )
+    scheduler = TranscriptionScheduler(
+        transcriber,
+        requests_per_minute=args.requests_per_minute,
+        audio_seconds_per_minute=args.audio_seconds_per_minute,
+        max_workers=args.workers,
+        max_pending=TRANSCRIPTION_MAX_PENDING
+    )
+    ingester = Ingester(conversation_manager, transcriber, journal, conversation_path, scheduler,
+                        jobs=args.jobs, chunk_duration=args.chunk_duration)
+    try:
+        failed = ingester.run(files)
+    finally:
+        scheduler.close()
+        transcriber.close()
+        journal.close()
+        conversation_manager.close()
+    print(f"Ingested {ingester.files_done} files, {failed} failed.")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+# job_journal.py
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+# Marks where splitting an imported file failed; the rest of the file is missing from the job
+UNSPLIT = 'unsplit'
+
+# Job states: 'open' jobs may still receive chunks (a recording in progress),
+# 'closed' jobs have all their chunks, 'finished' jobs have been saved to their conversation
+OPEN = 'open'
+CLOSED = 'closed'
+FINISHED = 'finished'
+
+# Source of jobs started by the batch ingester, followed by the path of the file
+INGEST_SOURCE_PREFIX = 'ingest:'
+
+class JobJournal:
+    """
+    Durable record of transcription jobs and the state of every chunk in
+    them. A chunk's text is committed before its audio file is deleted, so
+    after a failure or crash a job can be resumed at its first unfinished
+    chunk without uploading completed audio again.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    conversation TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    created REAL NOT NULL
+                )""")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    job_id INTEGER NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+                    idx INTEGER NOT NULL,
+                    path TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    text TEXT,
+                    PRIMARY KEY (job_id, idx)
+                )""")
+            # Files the batch ingester has fully saved, so a rerun skips them unless they changed
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS ingested_files (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    conversation TEXT NOT NULL,
+                    finished REAL NOT NULL
+                )""")
+
+    def execute(self, query, params=()):
+        with self.lock, self.connection:
+            return self.connection.execute(query, params).fetchall()
+
+    def create_job(self, conversation_id, source, state=OPEN):
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO jobs (conversation, source, state, created) VALUES (?, ?, ?, ?)",
+                (json.dumps(conversation_id), source, state, time.time())
+            )
+            return cursor.lastrowid
+
+    def reassign_job(self, job_id, conversation_id, old_dir, new_dir=None):
+        # Records the job under conversation_id and moves chunk paths from old_dir to new_dir
+        with self.lock, self.connection:
+            self.connection.execute(
+                "UPDATE jobs SET conversation = ? WHERE id = ?", (json.dumps(conversation_id), job_id)
+            )
+            if new_dir is None:
+                return
+            rows = self.connection.execute("SELECT idx, path FROM chunks WHERE job_id = ?", (job_id,)).fetchall()
+            for index, path in rows:
+                if path.startswith(old_dir + os.sep):
+                    self.connection.execute(
+                        "UPDATE chunks SET path = ? WHERE job_id = ? AND idx = ?",
+                        (os.path.join(new_dir, os.path.relpath(path, old_dir)), job_id, index)
+                    )
+
+    def get_job(self, job_id):
+        rows = self.execute("SELECT conversation, source, state FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        conversation, source, state = rows[0]
+        return {'id': job_id, 'conversation': json.loads(conversation), 'source': source, 'state': state}
+
+    def get_unfinished_jobs(self):
+        rows = self.execute("SELECT id FROM jobs WHERE state != ? ORDER BY id", (FINISHED,))
+        return [self.get_job(job_id) for job_id, in rows]
+
+    def close_job(self, job_id):
+        self.execute("UPDATE jobs SET state = ? WHERE id = ? AND state = ?", (CLOSED, job_id, OPEN))
+
+    def finish_job(self, job_id):
+        # The transcript has been saved; nothing about the job needs to survive
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM chunks WHERE job_id = ?", (job_id,))
+            self.connection.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def finish_conversation_jobs(self, conversation_ids):
+        # Drops the jobs of deleted conversations, whose transcripts have nowhere to go
+        with self.lock, self.connection:
+            for conversation_id in conversation_ids:
+                job_ids = [job_id for job_id, in self.connection.execute(
+                    "SELECT id FROM jobs WHERE conversation = ?", (json.dumps(conversation_id),)
+                )]
+                for job_id in job_ids:
+                    self.connection.execute("DELETE FROM chunks WHERE job_id = ?", (job_id,))
+                    self.connection.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def finish_ingest(self, job_id, path, size, mtime, conversation_id):
+        # Finishes the job and records the file as ingested in one transaction
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM chunks WHERE job_id = ?", (job_id,))
+            self.connection.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            self.connection.execute(
+                "INSERT OR REPLACE INTO ingested_files (path, size, mtime, conversation, finished) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (path, size, mtime, json.dumps(conversation_id), time.time())
+            )
+
+    def is_ingested(self, path, size, mtime):
+        return bool(self.execute(
+            "SELECT 1 FROM ingested_files WHERE path = ? AND size = ? AND mtime = ?", (path, size, mtime)
+        ))
+
+    def add_chunk(self, job_id, path, state=PENDING):
+        with self.lock, self.connection:
+            (next_index,), = self.connection.execute(
+                "SELECT COALESCE(MAX(idx), -1) + 1 FROM chunks WHERE job_id = ?", (job_id,)
+            ).fetchall()
+            self.connection.execute(
+                "INSERT INTO chunks (job_id, idx, path, state) VALUES (?, ?, ?, ?)",
+                (job_id, next_index, path, state)
+            )
+            return next_index
+
+    def complete_chunk(self, job_id, index, text):
+        self.execute(
+            "UPDATE chunks SET state = ?, text = ? WHERE job_id = ? AND idx = ?",
+            (DONE, text, job_id, index)
+        )
+
+    def fail_chunk(self, job_id, index):
+        self.execute("UPDATE chunks SET state = ? WHERE job_id = ? AND idx = ?", (FAILED, job_id, index))
+
+    def get_chunks(self, job_id):
+        rows = self.execute("SELECT idx, path, state, text FROM chunks WHERE job_id = ? ORDER BY idx", (job_id,))
+        return [{'index': index, 'path': path, 'state': state, 'text': text} for index, path, state, text in rows]
+
+    def get_chunk_paths(self):
+        return {path for path, in self.execute("SELECT path FROM chunks")}
+
+    def get_transcript(self, job_id):
+        rows = self.execute(
+            "SELECT text FROM chunks WHERE job_id = ? AND state = ? ORDER BY idx", (job_id, DONE)
+        )
+        return '\n'.join(text for text, in rows)
+
+    def close(self):
+        # Waits for a write in progress on another thread; chunks finishing later stay pending and are resumed
+        with self.lock:
+            self.connection.close()
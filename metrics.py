@@ -0,0 +1,184 @@
+# metrics.py
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds; wide enough for both file writes and API calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def snapshot(self):
+        return {'value': self.value}
+
+class Gauge:
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def snapshot(self):
+        return {'value': self.value}
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)  # The last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self.lock:
+            self.bucket_counts[index] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'count': self.count,
+                'sum': self.sum,
+                'mean': self.sum / self.count if self.count else 0.0,
+                'max': self.max,
+                'buckets': dict(zip([str(bound) for bound in self.buckets] + ['+Inf'], self.bucket_counts)),
+            }
+
+class MetricsRegistry:
+    """
+    Process-wide counters, gauges and histograms, optionally labelled.
+    Metrics are created on first use, and recording one only takes a short
+    lock, so instrumentation can stay in place on hot paths.
+    """
+    def __init__(self):
+        self.metrics = {}  # (name, labels) -> metric
+        self.kinds = {}  # name -> (kind, description)
+        self.lock = threading.Lock()
+
+    def get(self, kind, name, description, labels, factory):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self.metrics.get(key)
+        if metric is None:
+            with self.lock:
+                metric = self.metrics.get(key)
+                if metric is None:
+                    metric = self.metrics[key] = factory()
+                    self.kinds.setdefault(name, (kind, description))
+        return metric
+
+    def counter(self, name, description="", **labels):
+        return self.get('counter', name, description, labels, Counter)
+
+    def gauge(self, name, description="", **labels):
+        return self.get('gauge', name, description, labels, Gauge)
+
+    def histogram(self, name, description="", buckets=DEFAULT_BUCKETS, **labels):
+        return self.get('histogram', name, description, labels, lambda: Histogram(buckets))
+
+    @contextmanager
+    def timer(self, name, description="", **labels):
+        """Records how long the block takes, in seconds, in a histogram."""
+        histogram = self.histogram(name, description, **labels)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            histogram.observe(time.perf_counter() - start)
+
+    def snapshot(self):
+        """Returns {name: [{'labels': {...}, ...values}]} for every metric."""
+        with self.lock:
+            items = sorted(self.metrics.items())
+        result = {}
+        for (name, labels), metric in items:
+            result.setdefault(name, []).append(dict(metric.snapshot(), labels=dict(labels)))
+        return result
+
+    def to_prometheus(self):
+        lines = []
+        with self.lock:
+            kinds = dict(self.kinds)
+        for name, series in self.snapshot().items():
+            kind, description = kinds[name]
+            if description:
+                lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for values in series:
+                labels = values['labels']
+                if kind == 'histogram':
+                    cumulative = 0
+                    for bound, count in values['buckets'].items():
+                        cumulative += count
+                        lines.append(f"{name}_bucket{format_labels(labels, le=bound)} {cumulative}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {values['sum']}")
+                    lines.append(f"{name}_count{format_labels(labels)} {values['count']}")
+                else:
+                    lines.append(f"{name}{format_labels(labels)} {values['value']}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        return json.dumps({'time': time.time(), 'metrics': self.snapshot()}, indent=2)
+
+def format_labels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+class MetricsExporter:
+    """
+    Writes the registry to a file every `interval` seconds on a background
+    thread, in Prometheus text format or as JSON. The file is replaced
+    atomically, so a scraper never reads a half-written one.
+    """
+    def __init__(self, registry, path, interval=15, format='prometheus'):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.format = format
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def write(self):
+        data = self.registry.to_json() if self.format == 'json' else self.registry.to_prometheus()
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, 'w') as f:
+                f.write(data)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Error writing metrics: {e}")
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+        # One last write so the file reflects the whole session
+        self.write()
+
+# Shared by every module
+metrics = MetricsRegistry()
@@ -0,0 +1,50 @@
+# metrics_panel.py
+
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QTableWidget, QTableWidgetItem, QHeaderView
+from PyQt5.QtCore import QTimer
+
+class MetricsPanel(QWidget):
+    """
+    Table of every metric in a MetricsRegistry: counters and gauges show
+    their value, timers their count, mean and maximum. Refreshed every
+    `interval` milliseconds while the panel is visible.
+    """
+    def __init__(self, registry, interval=2000):
+        super().__init__()
+        self.registry = registry
+        self.layout = QVBoxLayout()
+        self.table = QTableWidget(0, 5)
+        self.table.setHorizontalHeaderLabels(["Metric", "Labels", "Count / Value", "Mean", "Max"])
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.layout.addWidget(self.table)
+        self.setLayout(self.layout)
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        self.refresh()
+        self.timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        rows = []
+        for name, series in self.registry.snapshot().items():
+            for values in series:
+                labels = ", ".join(f"{key}={value}" for key, value in values['labels'].items())
+                if 'count' in values:
+                    # Timers are in seconds; shown in milliseconds
+                    rows.append((name, labels, str(values['count']),
+                                 f"{values['mean'] * 1000:.1f} ms", f"{values['max'] * 1000:.1f} ms"))
+                else:
+                    rows.append((name, labels, str(values['value']), "", ""))
+        self.table.setRowCount(len(rows))
+        for row, cells in enumerate(rows):
+            for column, text in enumerate(cells):
+                self.table.setItem(row, column, QTableWidgetItem(text))
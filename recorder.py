@@ -1,65 +1,220 @@
 # recorder.py
 
-import pyaudio
 import wave
 import threading
 import time
 import os
+import re
+from ring_buffer import RingBuffer
+from vad import VoiceActivityDetector
+from metrics import metrics
+from audio_backend import get_shared_audio, PA_INT16, PA_INPUT_OVERFLOW, PA_CONTINUE
+
+def recover_partial_chunks(directory):
+    # Chunks that were still being written when the app crashed have a valid header; keep them for transcription
+    for filename in os.listdir(directory):
+        if re.fullmatch(r"recording_chunk_\d+\.wav\.part", filename):
+            part_path = os.path.join(directory, filename)
+            os.replace(part_path, part_path[:-len(".part")])
+            print(f"Recovered partial chunk: {filename}")
+
+class ChunkWriter:
+    """
+    Keeps a chunk's WAV file open and appends audio as it arrives. The header
+    is rewritten after every write, so the file on disk is always playable.
+    The chunk is written under a .part name and renamed once it is finished.
+    """
+    def __init__(self, path, rate, sample_width=2, channels=1):
+        self.path = path
+        self.part_path = path + ".part"
+        self.frame_count = 0
+        self.wave_file = wave.open(self.part_path, 'wb')
+        self.wave_file.setnchannels(channels)
+        self.wave_file.setsampwidth(sample_width)
+        self.wave_file.setframerate(rate)
+
+    def write(self, data):
+        self.wave_file.writeframes(data)
+        self.frame_count += len(data) // self.wave_file.getsampwidth()
+
+    def close(self):
+        self.wave_file.close()
+        os.replace(self.part_path, self.path)
+        return self.path
+
+    def discard(self):
+        self.wave_file.close()
+        os.remove(self.part_path)
 
 class Recorder:
-    def __init__(self, output_directory):
+    """
+    Records from the default input device into chunk files.
+
+    :param output_directory: Directory the recording_chunk_N.wav files are written to.
+    :param on_chunk_saved: Called with the path of every finished chunk.
+    :param audio: Audio backend with the PyAudio interface (get_sample_size, open); the shared,
+                  already initialized PyAudio instance is used if omitted.
+    """
+    def __init__(self, output_directory, on_chunk_saved=None, audio=None):
         self.output_directory = output_directory
-        self.frames = []
+        self.on_chunk_saved = on_chunk_saved  # Called with the path of every finished chunk
+        self.chunk_writer = None
         self.recording = False
-        self.chunk_duration = 240  # Maximum duration per chunk in seconds
-        self.audio = pyaudio.PyAudio()
+        self.chunk_duration = 240  # Target audio duration per chunk in seconds
+        self.boundary_tolerance = 20  # Seconds a chunk may run over while waiting for a pause
+        self.min_pause = 0.3  # Silence needed before a chunk can be cut there
+        self.max_silence = 1.0  # Longer stretches of silence are shortened to this
+        self.rate = 44100
+        self.buffer_size = 1024
+        self.ring_buffer_duration = 30  # Seconds of audio the capture callback can get ahead of the writer
+        self.audio = audio or get_shared_audio()
         self.stream = None
+        self.ring_buffer = None
+        # Capture health: overflow_count counts overruns reported by PortAudio,
+        # dropped_frames counts frames lost because the ring buffer was full
+        self.captured_frames = 0
+        self.overflow_count = 0
+        self.dropped_frames = 0
         self.current_chunk = 0
-        self.start_time = None
+        self.chunk_has_speech = False
+        self.silent_frames = 0  # Length of the current stretch of silence
+        self.vad = VoiceActivityDetector(self.rate)
         self.lock = threading.Lock()
 
     def record(self):
         self.recording = True
-        self.start_time = time.time()
-        self.frames = []
-        self.current_chunk = 0
-        self.stream = self.audio.open(format=pyaudio.paInt16,
+        recover_partial_chunks(self.output_directory)
+        self.current_chunk = self.next_chunk_index()
+        self.chunk_writer = None
+        self.chunk_has_speech = False
+        self.silent_frames = 0
+        self.captured_frames = 0
+        self.overflow_count = 0
+        self.dropped_frames = 0
+        self.vad.reset()
+        sample_width = self.audio.get_sample_size(PA_INT16)
+        self.ring_buffer = RingBuffer(int(self.ring_buffer_duration * self.rate) * sample_width)
+        self.chunk_limit = int(self.chunk_duration * self.rate)
+        self.hard_limit = int((self.chunk_duration + self.boundary_tolerance) * self.rate)
+        self.pause_frames = int(self.min_pause * self.rate)
+        self.max_silent_frames = int(self.max_silence * self.rate)
+        # PortAudio delivers audio on its own thread; this thread only drains the ring buffer
+        self.stream = self.audio.open(format=PA_INT16,
                                       channels=1,
-                                      rate=44100,
+                                      rate=self.rate,
                                       input=True,
-                                      frames_per_buffer=1024)
+                                      frames_per_buffer=self.buffer_size,
+                                      stream_callback=self.audio_callback)
         print("Recording started.")
+        block_size = self.buffer_size * sample_width
+        poll_interval = self.buffer_size / self.rate
         while self.recording:
-            try:
-                data = self.stream.read(1024, exception_on_overflow=False)
-            except Exception as e:
-                print(f"Error reading audio stream: {e}")
-                continue
-            with self.lock:
-                self.frames.append(data)
-            elapsed_time = time.time() - self.start_time
-            if elapsed_time >= self.chunk_duration:
-                self.save_chunk()
-                self.start_time = time.time()
-                self.frames = []
-        if self.frames:
-            self.save_chunk()
+            if not self.drain(block_size):
+                self.update_capture_metrics()
+                time.sleep(poll_interval)
         self.stream.stop_stream()
         self.stream.close()
-        self.audio.terminate()
+        # Whatever the callback delivered before the stream stopped is still written
+        self.drain(block_size)
+        if self.chunk_writer:
+            self.save_chunk()
+        self.update_capture_metrics()
         print("Recording stopped.")
+        print(f"Captured {self.captured_frames} frames, {self.overflow_count} overflows, "
+              f"{self.dropped_frames} dropped frames.")
+
+    def audio_callback(self, in_data, frame_count, time_info, status):
+        # Runs on the PortAudio thread: no locks, no I/O, just copy into the ring buffer
+        if status & PA_INPUT_OVERFLOW:
+            self.overflow_count += 1
+        if self.ring_buffer.write(in_data):
+            self.captured_frames += frame_count
+        else:
+            self.dropped_frames += frame_count
+        return (None, PA_CONTINUE)
+
+    def drain(self, block_size):
+        data = self.ring_buffer.read()
+        for start in range(0, len(data), block_size):
+            self.process_block(data[start:start + block_size])
+        return bool(data)
+
+    def process_block(self, data):
+        frame_count = len(data) // 2
+        # Until the VAD has learned the room's noise floor everything is kept, since its verdicts can't be trusted yet
+        learning = not self.vad.learned
+        if self.vad.is_speech(data) or learning:
+            self.silent_frames = 0
+            self.chunk_has_speech = True
+        else:
+            self.silent_frames += frame_count
+        # Drop silence beyond max_silence so it is neither uploaded nor paid for
+        if self.silent_frames <= self.max_silent_frames:
+            self.write_frames(data)
+        # Past the target length, cut at the first pause, or unconditionally once the tolerance is used up
+        chunk_frames = self.chunk_writer.frame_count if self.chunk_writer else 0
+        if chunk_frames >= self.chunk_limit:
+            if self.silent_frames >= self.pause_frames or chunk_frames >= self.hard_limit:
+                self.save_chunk()
+
+    def update_capture_metrics(self):
+        # The audio callback must not take locks, so its counters are published from the recording thread
+        metrics.gauge('recorder_captured_frames', "Frames captured in the current recording").set(self.captured_frames)
+        metrics.gauge('recorder_overflows', "Input overflows in the current recording").set(self.overflow_count)
+        metrics.gauge('recorder_dropped_frames', "Frames lost to a full ring buffer").set(self.dropped_frames)
+        metrics.gauge('recorder_buffered_bytes', "Audio waiting in the ring buffer").set(self.ring_buffer.available())
+
+    def get_capture_stats(self):
+        return {
+            'captured_frames': self.captured_frames,
+            'overflow_count': self.overflow_count,
+            'dropped_frames': self.dropped_frames,
+            'buffered_bytes': self.ring_buffer.available() if self.ring_buffer else 0,
+        }
+
+    def write_frames(self, data):
+        with self.lock, metrics.timer('recorder_write_seconds', "Time to append audio to the chunk file"):
+            if self.chunk_writer is None:
+                chunk_filename = f"recording_chunk_{self.current_chunk}.wav"
+                self.chunk_writer = ChunkWriter(
+                    os.path.join(self.output_directory, chunk_filename),
+                    self.rate,
+                    self.audio.get_sample_size(PA_INT16)
+                )
+            self.chunk_writer.write(data)
 
     def stop(self):
         self.recording = False
 
+    def next_chunk_index(self):
+        # Continue numbering after chunks left over from an earlier session so they are not overwritten
+        indices = [-1]
+        for filename in os.listdir(self.output_directory):
+            match = re.fullmatch(r"recording_chunk_(\d+)\.wav", filename)
+            if match:
+                indices.append(int(match.group(1)))
+        return max(indices) + 1
+
     def save_chunk(self):
+        with metrics.timer('recorder_save_chunk_seconds', "Time to finish a chunk and hand it over"):
+            self.finish_chunk()
+
+    def finish_chunk(self):
         with self.lock:
-            chunk_filename = f"recording_chunk_{self.current_chunk}.wav"
-            chunk_path = os.path.join(self.output_directory, chunk_filename)
-            with wave.open(chunk_path, 'wb') as wf:
-                wf.setnchannels(1)
-                wf.setsampwidth(self.audio.get_sample_size(pyaudio.paInt16))
-                wf.setframerate(44100)
-                wf.writeframes(b''.join(self.frames))
-            print(f"Saved chunk: {chunk_filename}")
-            self.current_chunk += 1
\ No newline at end of file
+            chunk_writer = self.chunk_writer
+            self.chunk_writer = None
+            chunk_has_speech = self.chunk_has_speech
+            self.chunk_has_speech = False
+            if chunk_writer is None:
+                return
+            if not chunk_has_speech:
+                chunk_writer.discard()
+                metrics.counter('recorder_chunks_total', "Chunks finished", outcome='silent').inc()
+                print("Skipped chunk without speech.")
+                return
+            chunk_path = chunk_writer.close()
+            metrics.counter('recorder_chunks_total', "Chunks finished", outcome='saved').inc()
+            print(f"Saved chunk: {os.path.basename(chunk_path)}")
+            self.current_chunk += 1
+        if self.on_chunk_saved:
+            self.on_chunk_saved(chunk_path)
@@ -0,0 +1,51 @@
+# ring_buffer.py
+
+class RingBuffer:
+    """
+    Preallocated single-producer, single-consumer byte ring buffer.
+
+    The producer (the audio callback) only advances write_position and the
+    consumer only advances read_position, so neither side takes a lock. Data
+    that does not fit is dropped rather than blocking the producer, and
+    counted in dropped_bytes.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.buffer = bytearray(capacity)
+        self.write_position = 0  # Total bytes ever written
+        self.read_position = 0  # Total bytes ever read
+        self.dropped_bytes = 0
+
+    def available(self):
+        return self.write_position - self.read_position
+
+    def free(self):
+        return self.capacity - self.available()
+
+    def write(self, data):
+        size = len(data)
+        if size > self.free():
+            self.dropped_bytes += size
+            return False
+        start = self.write_position % self.capacity
+        first = min(size, self.capacity - start)
+        self.buffer[start:start + first] = data[:first]
+        if first < size:
+            self.buffer[:size - first] = data[first:]
+        # Publish only after the bytes are in place
+        self.write_position += size
+        return True
+
+    def read(self, max_size=None):
+        size = self.available()
+        if max_size is not None:
+            size = min(size, max_size)
+        if size <= 0:
+            return b''
+        start = self.read_position % self.capacity
+        first = min(size, self.capacity - start)
+        data = bytes(self.buffer[start:start + first])
+        if first < size:
+            data += bytes(self.buffer[:size - first])
+        self.read_position += size
+        return data
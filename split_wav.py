@@ -1,55 +1,164 @@
 # split_wav.py
 
-from pydub import AudioSegment
+import argparse
+import math
+import mmap
 import os
-import sys
+import struct
+import wave
 
-def split_wav(file_path, output_dir=None):
+COPY_BLOCK_SIZE = 1 << 20  # Bytes copied per write when producing a part
+
+def is_wav_file(file_path):
+    with open(file_path, 'rb') as f:
+        header = f.read(12)
+    return header[:4] == b'RIFF' and header[8:12] == b'WAVE'
+
+def read_wav_layout(data):
     """
-    Splits a WAV file into two equal halves.
+    Finds the format and the location of the sample data in a mapped WAV file
+    without decoding any audio.
 
-    :param file_path: Path to the input WAV file.
-    :param output_dir: Directory to save the split files. Defaults to the input file's directory.
+    :return: (channels, sample_width, frame_rate, data_offset, data_size)
     """
-    if not os.path.isfile(file_path):
-        print(f"Error: File '{file_path}' does not exist.")
-        return
+    if data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+        raise ValueError("Not a RIFF/WAVE file")
+    fmt = None
+    position = 12
+    while position + 8 <= len(data):
+        chunk_id = data[position:position + 4]
+        chunk_size = struct.unpack('<I', data[position + 4:position + 8])[0]
+        body = position + 8
+        if chunk_id == b'fmt ':
+            _, channels, frame_rate, _, _, bits = struct.unpack('<HHIIHH', data[body:body + 16])
+            fmt = (channels, (bits + 7) // 8, frame_rate)
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise ValueError("WAV data chunk comes before its fmt chunk")
+            # Files still being recorded may declare a shorter or longer size than is actually there
+            data_size = min(chunk_size, len(data) - body)
+            return fmt + (body, data_size)
+        position = body + chunk_size + (chunk_size & 1)
+    raise ValueError("WAV file has no data chunk")
 
-    # Load the audio file
-    audio = AudioSegment.from_wav(file_path)
-    duration_ms = len(audio)  # Duration in milliseconds
+def find_split_frame(data, layout, start_frame, target_frame, silence_window, min_pause):
+    """
+    Moves a cut point back to the middle of the last pause within
+    silence_window seconds before target_frame. Only the window itself is
+    decoded. Returns target_frame if there is no pause.
+    """
+    import numpy as np
+    from vad import find_pauses
 
-    # Calculate midpoint
-    midpoint = duration_ms // 2
+    channels, sample_width, frame_rate, data_offset, _ = layout
+    if sample_width != 2:
+        return target_frame
+    frame_size = channels * sample_width
+    window_start = max(start_frame + 1, target_frame - int(silence_window * frame_rate))
+    if window_start >= target_frame:
+        return target_frame
+    raw = data[data_offset + window_start * frame_size:data_offset + target_frame * frame_size]
+    samples = np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    pauses = find_pauses(samples, frame_rate, min_pause)
+    if not pauses:
+        return target_frame
+    pause_start, pause_end = pauses[-1]
+    return window_start + (pause_start + pause_end) // 2
 
-    # Split the audio
-    first_half = audio[:midpoint]
-    second_half = audio[midpoint:]
+def iter_split_wav(file_path, output_dir=None, max_duration=None, max_bytes=None, parts=None,
+                   split_on_silence=False, silence_window=30, min_pause=0.3):
+    """
+    Splits a WAV file into consecutive parts, writing each part as soon as
+    its boundary is known. The input is memory-mapped and copied in blocks,
+    so files of any size can be split in constant memory.
 
-    # Prepare output directory
+    :param file_path: Path to the input WAV file.
+    :param output_dir: Directory to save the split files. Defaults to the input file's directory.
+    :param max_duration: Maximum duration of a part in seconds.
+    :param max_bytes: Maximum size of a part file in bytes, header included.
+    :param parts: Number of equal parts to split into.
+    :param split_on_silence: Move each cut back to the nearest pause within silence_window seconds (16-bit audio only).
+    :return: Generator of part file paths, in order.
+    """
     if output_dir is None:
         output_dir = os.path.dirname(file_path)
     else:
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-
-    # Generate output file names
+        os.makedirs(output_dir, exist_ok=True)
     base_name = os.path.splitext(os.path.basename(file_path))[0]
-    first_half_path = os.path.join(output_dir, f"{base_name}_part1.wav")
-    second_half_path = os.path.join(output_dir, f"{base_name}_part2.wav")
 
-    # Export split files
-    first_half.export(first_half_path, format="wav")
-    second_half.export(second_half_path, format="wav")
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        layout = read_wav_layout(data)
+        channels, sample_width, frame_rate, data_offset, data_size = layout
+        frame_size = channels * sample_width
+        total_frames = data_size // frame_size
+
+        part_frames = total_frames
+        if parts:
+            part_frames = min(part_frames, math.ceil(total_frames / parts))
+        if max_duration:
+            part_frames = min(part_frames, int(max_duration * frame_rate))
+        if max_bytes:
+            # Leave room for the 44-byte header the wave module writes
+            part_frames = min(part_frames, (max_bytes - 44) // frame_size)
+        if part_frames <= 0:
+            raise ValueError("Split limits are too small for a single frame")
+
+        start_frame = 0
+        part_number = 1
+        while start_frame < total_frames:
+            end_frame = min(start_frame + part_frames, total_frames)
+            if split_on_silence and end_frame < total_frames:
+                end_frame = find_split_frame(data, layout, start_frame, end_frame, silence_window, min_pause)
+
+            part_path = os.path.join(output_dir, f"{base_name}_part{part_number}.wav")
+            with wave.open(part_path, 'wb') as wf:
+                wf.setnchannels(channels)
+                wf.setsampwidth(sample_width)
+                wf.setframerate(frame_rate)
+                position = data_offset + start_frame * frame_size
+                end = data_offset + end_frame * frame_size
+                while position < end:
+                    block_end = min(position + COPY_BLOCK_SIZE, end)
+                    wf.writeframes(data[position:block_end])
+                    position = block_end
+            yield part_path
+
+            start_frame = end_frame
+            part_number += 1
+
+def split_wav(file_path, output_dir=None, max_duration=None, max_bytes=None, parts=None, split_on_silence=False):
+    """
+    Splits a WAV file and returns the list of part paths. Without any limits
+    the file is split into two equal halves.
+    """
+    if not os.path.isfile(file_path):
+        print(f"Error: File '{file_path}' does not exist.")
+        return []
+    if not (max_duration or max_bytes or parts):
+        parts = 2
+    part_paths = list(iter_split_wav(
+        file_path,
+        output_dir,
+        max_duration=max_duration,
+        max_bytes=max_bytes,
+        parts=parts,
+        split_on_silence=split_on_silence
+    ))
 
     print(f"Successfully split '{file_path}' into:")
-    print(f" - {first_half_path}")
-    print(f" - {second_half_path}")
+    for part_path in part_paths:
+        print(f" - {part_path}")
+    return part_paths
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python split_wav.py <path_to_wav_file> [output_directory]")
-    else:
-        wav_file = sys.argv[1]
-        output_directory = sys.argv[2] if len(sys.argv) > 2 else None
-        split_wav(wav_file, output_directory)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Split a WAV file into parts.")
+    parser.add_argument("wav_file", help="Path to the WAV file")
+    parser.add_argument("output_directory", nargs="?", default=None, help="Directory for the parts")
+    parser.add_argument("--parts", type=int, help="Number of equal parts (default: 2 if no other limit is given)")
+    parser.add_argument("--max-duration", type=float, help="Maximum part duration in seconds")
+    parser.add_argument("--max-bytes", type=int, help="Maximum part size in bytes")
+    parser.add_argument("--silence", action="store_true", help="Cut at pauses near each boundary")
+    args = parser.parse_args()
+    split_wav(args.wav_file, args.output_directory, args.max_duration, args.max_bytes, args.parts, args.silence)
@@ -0,0 +1,87 @@
+# startup_check.py
+#
+# Cold start measurement used by test_startup.py: every run launches this script with --child in a fresh process.
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Seconds from launching the process until the main window is shown
+STARTUP_BUDGET = 1.5
+# Modules that must not be imported before the window is shown
+DEFERRED_MODULES = ('requests', 'pyaudio', 'numpy', 'pydub')
+
+def report(event, **values):
+    print(json.dumps(dict(values, event=event)), flush=True)
+
+def run_child():
+    # Mirrors main.py, reporting when the window is shown and when the conversations have loaded
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtCore import QTimer
+    from ui_main import MainWindow
+    app = QApplication(sys.argv[:1])
+    window = MainWindow()
+    window.show()
+    app.processEvents()
+    report('shown', imported=[name for name in DEFERRED_MODULES if name in sys.modules])
+
+    def check_loaded():
+        if window.conversation_manager.loaded.is_set():
+            app.processEvents()  # Let the tree refresh
+            report('ready')
+            window.close()
+            app.quit()
+        else:
+            QTimer.singleShot(5, check_loaded)
+
+    check_loaded()
+    app.exec_()
+
+def create_conversations(count, segments_per_conversation=20):
+    """Fills the conversations directory in the current directory with folders of conversations."""
+    from conversation_manager import ConversationManager
+    manager = ConversationManager()
+    for number in range(count):
+        folder = f"Folder {number // 50}"
+        manager.create_folder(folder)
+        manager.create_conversation(f"Conversation {number}", [folder])
+        key = manager.get_conversation_key([folder, f"Conversation {number}"])
+        store = manager.transcript_store
+        with store.lock, store.connection:
+            for segment in range(segments_per_conversation):
+                store.insert(key, "2024-01-01 00:00:00", f"Segment {segment} of conversation {number}.")
+    manager.save_conversations()
+    manager.close()
+
+def measure(data_dir):
+    # One cold start in a fresh process; returns (seconds until shown, seconds until ready, deferred modules imported)
+    env = dict(os.environ, QT_QPA_PLATFORM=os.environ.get('QT_QPA_PLATFORM', 'offscreen'))
+    script = os.path.abspath(__file__)
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, script, "--child"], cwd=data_dir, env=env,
+                               stdout=subprocess.PIPE, text=True)
+    shown = ready = None
+    imported = []
+    for line in process.stdout:
+        try:
+            message = json.loads(line)
+        except ValueError:
+            continue  # Ordinary output of the app
+        if message['event'] == 'shown':
+            shown = time.perf_counter() - started
+            imported = message['imported']
+        elif message['event'] == 'ready':
+            ready = time.perf_counter() - started
+    if process.wait() != 0 or shown is None or ready is None:
+        raise RuntimeError(f"Startup run failed with exit code {process.returncode}")
+    return shown, ready, imported
+
+if __name__ == "__main__":
+    if "--child" in sys.argv:
+        run_child()
+    else:
+        # The check itself is a test; running this script runs just that test
+        import pytest
+        sys.exit(pytest.main(["-q", os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_startup.py")]))
@@ -0,0 +1,112 @@
+# stub_transcription_server.py
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class StubTranscriptionServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the OpenAI transcription endpoint, for benchmarks and
+    offline runs. Every request is answered after `latency` seconds (plus up
+    to `jitter`) and fails with a retryable error at `error_rate`. Delays and
+    failures come from a seeded generator, and the returned text is derived
+    from the uploaded bytes, so runs are reproducible.
+
+    :param port: Port to listen on; 0 picks a free one.
+    :param latency: Seconds every request takes.
+    :param jitter: Up to this many extra seconds per request.
+    :param error_rate: Fraction of requests answered with error_status.
+    :param error_status: HTTP status of simulated failures.
+    :param seed: Seed for the latency and failure sequence.
+    """
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.5, jitter=0.0, error_rate=0.0, error_status=503, seed=0):
+        super().__init__(('127.0.0.1', port), StubTranscriptionHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.bytes_received = 0
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def next_response(self, body_size):
+        # Draws delay and outcome under the lock so the sequence doesn't depend on thread timing
+        with self.lock:
+            self.requests += 1
+            self.bytes_received += body_size
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        return delay, failed
+
+    def get_stats(self):
+        with self.lock:
+            return {'requests': self.requests, 'errors': self.errors, 'bytes_received': self.bytes_received}
+
+class StubTranscriptionHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not self.path.endswith('/audio/transcriptions'):
+            self.respond(404, {'error': {'message': 'Not found'}})
+            return
+        delay, failed = self.server.next_response(len(body))
+        time.sleep(delay)
+        if failed:
+            self.respond(self.server.error_status, {'error': {'message': 'Simulated failure'}})
+            return
+        digest = hashlib.sha256(body).hexdigest()[:12]
+        self.respond(200, {'text': f"Transcript {digest} of {len(body)} bytes.", 'language': 'english'})
+
+    def respond(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the OpenAI transcription API.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds every request takes")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many extra seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    server = StubTranscriptionServer(args.port, args.latency, args.jitter, args.error_rate, seed=args.seed)
+    print(f"Serving on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
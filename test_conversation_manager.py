@@ -0,0 +1,92 @@
+# test_conversation_manager.py
+
+import json
+import os
+import sys
+import pytest
+import transfer
+from conversation_manager import ConversationManager
+from transcript_store import TranscriptStore
+from tree_journal import JournalLockedError
+from transfer import Exporter
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    # ConversationManager keeps its files under ./conversations
+    monkeypatch.chdir(tmp_path)
+    manager = ConversationManager()
+    manager.create_folder("Folder")
+    manager.create_conversation("Conversation", ["Folder"])
+    manager.create_conversation("Other", ["Folder"])
+    manager.append_transcript("hello world", ["Folder", "Conversation"])
+    yield manager
+    manager.close()
+
+def reopen(manager):
+    manager.close()
+    return ConversationManager()
+
+def test_index_resolves_ids_after_restart(manager):
+    conversation_id = manager.get_conversation_key(["Folder", "Conversation"])
+    manager = reopen(manager)
+    try:
+        assert manager.get_conversation_path(conversation_id) == ["Folder", "Conversation"]
+        assert [result[0] for result in manager.search("hello")] == [["Folder", "Conversation"]]
+        stats = manager.get_folder_stats(["Folder"])
+        assert stats['conversations'] == 2
+        assert stats['segments'] == 1
+    finally:
+        manager.close()
+
+def test_delete_single_conversation(manager):
+    conversation_id = manager.get_conversation_key(["Folder", "Conversation"])
+    recordings_dir = manager.get_recordings_dir_from_path(["Folder", "Conversation"])
+    assert manager.delete_item(["Folder", "Conversation"])
+    assert manager.get_node(["Folder"]) == {"Other": manager.get_conversation_key(["Folder", "Other"])}
+    assert manager.transcript_store.count(conversation_id) == 0
+    assert not os.path.exists(recordings_dir)
+    assert manager.get_folder_stats(["Folder"])['conversations'] == 1
+
+def test_export_single_conversation(manager, tmp_path):
+    output_path = str(tmp_path / "out.jsonl")
+    Exporter(manager, output_path).run(["Folder", "Conversation"])
+    with open(output_path) as f:
+        lines = [json.loads(line) for line in f]
+    assert lines[0] == {'conversation': ["Folder", "Conversation"]}
+    assert [line['text'] for line in lines[1:]] == ["hello world"]
+
+def test_empty_transcript_is_skipped(manager):
+    conversation_id = manager.get_conversation_key(["Folder", "Other"])
+    assert manager.append_transcript("", ["Folder", "Other"]) is None
+    assert manager.append_transcript(" \n", ["Folder", "Other"]) is None
+    assert manager.transcript_store.count(conversation_id) == 0
+    assert manager.get_conversation_stats(["Folder", "Other"])['segments'] == 0
+
+def test_reload_metadata_ignores_own_writes(manager):
+    manager.append_transcript("more", ["Folder", "Other"])
+    assert not manager.reload_metadata()
+    # Another process writing to the store
+    other = TranscriptStore(manager.transcript_store.db_path)
+    try:
+        other.append(manager.get_conversation_key(["Folder", "Other"]), "2024-01-01 00:00:00", "from elsewhere")
+    finally:
+        other.close()
+    assert manager.reload_metadata()
+    assert manager.get_conversation_stats(["Folder", "Other"])['segments'] == 2
+
+def test_second_manager_on_same_directory_is_refused(manager):
+    with pytest.raises(JournalLockedError):
+        ConversationManager()
+    manager.close()
+    other = ConversationManager()
+    try:
+        assert other.is_conversation(["Folder", "Conversation"])
+    finally:
+        other.close()
+
+def test_import_command_refuses_open_directory(manager, tmp_path, monkeypatch):
+    input_path = tmp_path / "in.jsonl"
+    input_path.write_text(json.dumps({'conversation': ["Imported"]}) + "\n")
+    monkeypatch.setattr(sys, 'argv', ["transfer.py", "import", str(input_path), "--data-dir", str(tmp_path)])
+    assert transfer.main() == 1
+    assert manager.get_node(["Imported"]) is None
@@ -0,0 +1,26 @@
+# test_startup.py
+
+import os
+import statistics
+import pytest
+from startup_check import STARTUP_BUDGET, create_conversations, measure
+
+RUNS = 3
+CONVERSATIONS = 1000
+
+def has_offscreen_platform():
+    from PyQt5.QtCore import QLibraryInfo
+    platforms_dir = os.path.join(QLibraryInfo.location(QLibraryInfo.PluginsPath), "platforms")
+    return os.path.isdir(platforms_dir) and any("offscreen" in name for name in os.listdir(platforms_dir))
+
+def test_cold_start_within_budget(tmp_path, monkeypatch):
+    pytest.importorskip("PyQt5.QtWidgets")
+    if not has_offscreen_platform():
+        pytest.skip("Qt offscreen platform plugin not available")
+    monkeypatch.chdir(tmp_path)
+    create_conversations(CONVERSATIONS)
+    results = [measure(str(tmp_path)) for _ in range(RUNS)]
+    shown = statistics.median(result[0] for result in results)
+    imported = sorted({name for result in results for name in result[2]})
+    assert not imported, f"imported before the window was shown: {', '.join(imported)}"
+    assert shown <= STARTUP_BUDGET, f"window took {shown * 1000:.0f} ms to show"
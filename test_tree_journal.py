@@ -0,0 +1,16 @@
+# test_tree_journal.py
+
+import pytest
+from tree_journal import TreeJournal, JournalLockedError
+
+def test_second_writer_is_refused(tmp_path):
+    snapshot_path, log_path = str(tmp_path / "tree.json"), str(tmp_path / "tree.log")
+    journal = TreeJournal(snapshot_path, log_path)
+    journal.load()
+    journal.apply({'op': 'create', 'path': ["a"], 'value': {}})
+    other = TreeJournal(snapshot_path, log_path)
+    with pytest.raises(JournalLockedError):
+        other.load()
+    journal.close()
+    assert other.load() == {"a": {}}
+    other.close()
@@ -1,26 +1,200 @@
 # transcriber.py
 
+import io
+import mimetypes
+import os
+import random
+import threading
+import time
+import uuid
 import requests
+from requests.adapters import HTTPAdapter
+from audio_encoder import encode_for_upload
+from metrics import metrics
+
+# Responses worth retrying: rate limiting and server-side failures
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+class MultipartStream:
+    """
+    File-like multipart/form-data body that reads the audio file in blocks
+    while it is being sent instead of building the whole request in memory.
+    """
+    def __init__(self, fields, file_field, file_path):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={self.boundary}'
+
+        head = io.BytesIO()
+        for name, value in fields.items():
+            head.write(f'--{self.boundary}\r\n'.encode())
+            head.write(f'Content-Disposition: form-data; name="{name}"\r\n\r\n'.encode())
+            head.write(f'{value}\r\n'.encode())
+        filename = os.path.basename(file_path)
+        file_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        head.write(f'--{self.boundary}\r\n'.encode())
+        head.write(f'Content-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'.encode())
+        head.write(f'Content-Type: {file_type}\r\n\r\n'.encode())
+        head.seek(0)
+        tail = io.BytesIO(f'\r\n--{self.boundary}--\r\n'.encode())
+
+        self.file = open(file_path, 'rb')
+        self.length = len(head.getvalue()) + os.fstat(self.file.fileno()).st_size + len(tail.getvalue())
+        self.parts = [head, self.file, tail]
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        data = b''
+        while self.parts and (size < 0 or len(data) < size):
+            block = self.parts[0].read(-1 if size < 0 else size - len(data))
+            if not block:
+                self.parts.pop(0)
+                continue
+            data += block
+        return data
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
 class Transcriber:
-    def __init__(self, api_key):
+    def __init__(self, api_key, max_retries=4, backoff_base=1.0, backoff_max=30.0,
+                 connect_timeout=10, read_timeout=300, pool_size=8,
+                 upload_format='flac', upload_sample_rate=16000, cache=None,
+                 model='whisper-1', response_format='verbose_json', api_base='https://api.openai.com/v1'):
         self.api_key = api_key
+        self.api_base = api_base.rstrip('/')
+        self.model = model
+        self.response_format = response_format
+        # Optional TranscriptionCache consulted before anything is uploaded
+        self.cache = cache
+        # WAV input is resampled and compressed before upload; None uploads files verbatim
+        self.upload_format = upload_format
+        self.upload_sample_rate = upload_sample_rate
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = (connect_timeout, read_timeout)
+        # Request body bytes sent, retries included
+        self.bytes_uploaded = 0
+        self.stats_lock = threading.Lock()
+        # Called with the seconds to back off when the API answers 429, so a scheduler can slow every caller down
+        self.on_rate_limited = None
+        # Called with the delay and the file instead of sleeping before a retry, so a scheduler can charge the
+        # retry to its rate limits and let another request go while this one backs off
+        self.wait_for_retry = None
+        # One keep-alive session shared by all uploads, so chunks reuse connections instead of a new TLS handshake each
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f'Bearer {self.api_key}'
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def close(self):
+        self.session.close()
 
     def transcribe(self, audio_file_path, language='en'):
-        url = "https://api.openai.com/v1/audio/transcriptions"
-        headers = {
-            'Authorization': f'Bearer {self.api_key}',
-        }
-        files = {
-            'file': open(audio_file_path, 'rb'),
-            'model': (None, 'whisper-1'),
-            'response_format': (None, 'verbose_json'),
-            'language': (None, language),
+        with metrics.timer('transcriber_transcribe_seconds', "Time to transcribe a file, cache and retries included"):
+            return self.transcribe_file(audio_file_path, language)
+
+    def transcribe_file(self, audio_file_path, language='en'):
+        cache_key = None
+        if self.cache:
+            cache_key = self.cache.key(
+                audio_file_path,
+                model=self.model,
+                language=language,
+                response_format=self.response_format
+            )
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                print(f"Using cached transcription for {audio_file_path}")
+                return cached
+
+        result = self.encode_and_upload(audio_file_path, language)
+        if result is not None and cache_key:
+            self.cache.put(cache_key, result)
+        return result
+
+    def encode_and_upload(self, audio_file_path, language='en'):
+        if not self.upload_format or not audio_file_path.lower().endswith('.wav'):
+            return self.upload(audio_file_path, language)
+        try:
+            with metrics.timer('transcriber_encode_seconds', "Time to resample and compress a file for upload"):
+                upload_path = encode_for_upload(audio_file_path, self.upload_format, self.upload_sample_rate)
+        except Exception as e:
+            print(f"Error encoding {audio_file_path}: {e}")
+            return self.upload(audio_file_path, language)
+        try:
+            return self.upload(upload_path, language)
+        finally:
+            os.remove(upload_path)
+
+    def upload(self, audio_file_path, language='en'):
+        url = f"{self.api_base}/audio/transcriptions"
+        fields = {
+            'model': self.model,
+            'response_format': self.response_format,
+            'language': language,
         }
 
-        response = requests.post(url, headers=headers, files=files)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Error: {response.status_code} - {response.text}")
-            return None
\ No newline at end of file
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            response = None
+            try:
+                with MultipartStream(fields, 'file', audio_file_path) as body:
+                    with self.stats_lock:
+                        self.bytes_uploaded += len(body)
+                    metrics.counter('transcriber_bytes_uploaded_total', "Request body bytes sent").inc(len(body))
+                    with metrics.timer('transcriber_request_seconds', "Duration of one API request"):
+                        response = self.session.post(
+                            url,
+                            data=body,
+                            headers={'Content-Type': body.content_type},
+                            timeout=self.timeout
+                        )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                metrics.counter('transcriber_requests_total', "API requests by outcome", status='network_error').inc()
+                print(f"Error: {e}")
+            else:
+                metrics.counter('transcriber_requests_total', "API requests by outcome",
+                                status=str(response.status_code)).inc()
+                if response.status_code == 200:
+                    return response.json() if self.response_format.endswith('json') else {'text': response.text}
+                print(f"Error: {response.status_code} - {response.text}")
+                if response.status_code not in RETRY_STATUS_CODES:
+                    metrics.counter('transcriber_failures_total', "Files that could not be transcribed").inc()
+                    return None
+                retry_after = self.parse_retry_after(response)
+
+            if attempt < self.max_retries:
+                metrics.counter('transcriber_retries_total', "Requests retried").inc()
+                delay = self.backoff_delay(attempt, retry_after)
+                if response is not None and response.status_code == 429 and self.on_rate_limited:
+                    self.on_rate_limited(delay)
+                print(f"Retrying {audio_file_path} in {delay:.1f}s (attempt {attempt + 2} of {self.max_retries + 1})")
+                if self.wait_for_retry:
+                    self.wait_for_retry(delay, audio_file_path)
+                else:
+                    time.sleep(delay)
+        metrics.counter('transcriber_failures_total', "Files that could not be transcribed").inc()
+        return None
+
+    def backoff_delay(self, attempt, retry_after=None):
+        # Exponential backoff with full jitter, never shorter than what the server asked for
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def parse_retry_after(self, response):
+        try:
+            return float(response.headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            return None
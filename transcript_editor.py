@@ -1,59 +1,185 @@
 # transcript_editor.py
 
-from PyQt5.QtWidgets import QListWidget, QListWidgetItem, QWidget, QTextEdit, QVBoxLayout
-from PyQt5.QtCore import Qt, pyqtSignal
-import time
+from PyQt5.QtWidgets import (
+    QWidget, QListView, QVBoxLayout, QStyledItemDelegate, QPlainTextEdit, QStyle, QAbstractItemView
+)
+from PyQt5.QtCore import Qt, pyqtSignal, QAbstractListModel, QModelIndex, QRect, QSize
+
+SEGMENT_ID_ROLE = Qt.UserRole + 1
+PAGE_SIZE = 100  # Segments read from storage at a time
+PADDING = 6
+MIN_ROW_HEIGHT = 50
+
+class TranscriptModel(QAbstractListModel):
+    """
+    List model over a conversation's segments. Segments are read from storage
+    a page at a time as the view scrolls (canFetchMore/fetchMore), so opening
+    a conversation costs one page regardless of its length.
+    """
+    segmentChanged = pyqtSignal(int, str)  # segment id, new text
+
+    def __init__(self):
+        super().__init__()
+        self.fetch_page = None  # fetch_page(offset, limit) -> [(segment_id, timestamp, text)]
+        self.total = 0
+        self.segments = []  # [segment_id, timestamp, text] for the rows loaded so far
+
+    def set_source(self, fetch_page, total):
+        self.beginResetModel()
+        self.fetch_page = fetch_page
+        self.total = total
+        self.segments = []
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.segments)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.fetch_page is not None and len(self.segments) < self.total
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        page = self.fetch_page(len(self.segments), PAGE_SIZE)
+        if not page:
+            # Storage has fewer segments than we were told; stop asking
+            self.total = len(self.segments)
+            return
+        start = len(self.segments)
+        self.beginInsertRows(QModelIndex(), start, start + len(page) - 1)
+        self.segments.extend(list(segment) for segment in page)
+        self.endInsertRows()
+
+    def fetch_all(self):
+        while self.canFetchMore():
+            self.fetchMore()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        segment_id, timestamp, text = self.segments[index.row()]
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return text
+        if role == Qt.ToolTipRole:
+            return f"Recorded on: {timestamp}"
+        if role == Qt.UserRole:
+            return timestamp
+        if role == SEGMENT_ID_ROLE:
+            return segment_id
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.EditRole:
+            return False
+        segment = self.segments[index.row()]
+        if segment[2] == value:
+            return False
+        segment[2] = value
+        self.dataChanged.emit(index, index, [Qt.DisplayRole, Qt.EditRole])
+        # Only the edited segment is reported, so only it needs saving
+        self.segmentChanged.emit(segment[0], value)
+        return True
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsEditable
+
+    def append_segment(self, segment_id, timestamp, text):
+        if len(self.segments) < self.total:
+            # Not everything is loaded yet; the new segment arrives with a later page
+            self.total += 1
+            return
+        row = len(self.segments)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.segments.append([segment_id, timestamp, text])
+        self.total += 1
+        self.endInsertRows()
+
+class TranscriptDelegate(QStyledItemDelegate):
+    """
+    Paints segments as wrapped text and creates a text editor only for the
+    row being edited. Every keystroke is committed to the model, which
+    reports it for saving.
+    """
+    def paint(self, painter, option, index):
+        self.initStyleOption(option, index)
+        text = option.text
+        option.text = ""
+        style = option.widget.style() if option.widget else None
+        if style:
+            style.drawControl(QStyle.CE_ItemViewItem, option, painter, option.widget)
+        painter.save()
+        if option.state & QStyle.State_Selected:
+            painter.setPen(option.palette.highlightedText().color())
+        painter.drawText(option.rect.adjusted(PADDING, PADDING, -PADDING, -PADDING), Qt.TextWordWrap, text)
+        painter.restore()
+
+    def sizeHint(self, option, index):
+        width = option.widget.viewport().width() if option.widget else option.rect.width()
+        text = index.data(Qt.DisplayRole) or ""
+        bounds = option.fontMetrics.boundingRect(QRect(0, 0, max(width - 2 * PADDING, 1), 0), Qt.TextWordWrap, text)
+        return QSize(width, max(MIN_ROW_HEIGHT, bounds.height() + 2 * PADDING))
+
+    def createEditor(self, parent, option, index):
+        editor = QPlainTextEdit(parent)
+        editor.textChanged.connect(lambda: self.commitData.emit(editor))
+        return editor
+
+    def setEditorData(self, editor, index):
+        text = index.data(Qt.EditRole) or ""
+        if editor.toPlainText() != text:
+            editor.setPlainText(text)
+
+    def setModelData(self, editor, model, index):
+        model.setData(index, editor.toPlainText(), Qt.EditRole)
+
+    def updateEditorGeometry(self, editor, option, index):
+        editor.setGeometry(option.rect)
 
 class TranscriptEditor(QWidget):
-    textChanged = pyqtSignal()
+    segmentChanged = pyqtSignal(int, str)  # segment id, new text
 
     def __init__(self):
         super().__init__()
         self.layout = QVBoxLayout()
-        self.transcript_list = QListWidget()
+        self.transcript_model = TranscriptModel()
+        self.transcript_model.segmentChanged.connect(self.segmentChanged)
+        self.transcript_list = QListView()
+        self.transcript_list.setModel(self.transcript_model)
+        self.transcript_list.setItemDelegate(TranscriptDelegate(self.transcript_list))
+        self.transcript_list.setResizeMode(QListView.Adjust)
+        self.transcript_list.setLayoutMode(QListView.Batched)
+        self.transcript_list.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.transcript_list.setEditTriggers(
+            QAbstractItemView.CurrentChanged | QAbstractItemView.DoubleClicked | QAbstractItemView.EditKeyPressed
+        )
         self.layout.addWidget(self.transcript_list)
         self.setLayout(self.layout)
 
     def clear(self):
-        self.transcript_list.clear()
-
-    def set_transcripts(self, transcripts):
-        self.transcript_list.clear()
-        for timestamp, text in transcripts:
-            item = QListWidgetItem()
-            item_widget = QTextEdit()
-            item_widget.setPlainText(text)
-            item_widget.setReadOnly(False)
-            item_widget.setMinimumHeight(50)
-            item.setSizeHint(item_widget.sizeHint())
-            self.transcript_list.addItem(item)
-            self.transcript_list.setItemWidget(item, item_widget)
-            item.setData(Qt.UserRole, timestamp)
-            # Add timestamp display
-            item.setToolTip(f"Recorded on: {timestamp}")
-            # Connect the textChanged signal
-            item_widget.textChanged.connect(self.textChanged)
+        self.transcript_model.set_source(None, 0)
+
+    def set_source(self, fetch_page, total):
+        """Shows a conversation whose segments are read on demand through fetch_page(offset, limit)."""
+        self.transcript_model.set_source(fetch_page, total)
+
+    def set_transcripts(self, segments):
+        segments = list(segments)
+        self.transcript_model.set_source(lambda offset, limit: segments[offset:offset + limit], len(segments))
 
     def get_transcripts(self):
-        transcripts = []
-        for i in range(self.transcript_list.count()):
-            item = self.transcript_list.item(i)
-            widget = self.transcript_list.itemWidget(item)
-            text = widget.toPlainText()
-            timestamp = item.data(Qt.UserRole)
-            transcripts.append((timestamp, text))
-        return transcripts
-
-    def append_transcript(self, text):
-        timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
-        item = QListWidgetItem()
-        item_widget = QTextEdit()
-        item_widget.setPlainText(text)
-        item_widget.setReadOnly(False)
-        item_widget.setMinimumHeight(50)
-        item.setSizeHint(item_widget.sizeHint())
-        self.transcript_list.addItem(item)
-        self.transcript_list.setItemWidget(item, item_widget)
-        item.setData(Qt.UserRole, timestamp)
-        item.setToolTip(f"Recorded on: {timestamp}")
-        item_widget.textChanged.connect(self.textChanged)
\ No newline at end of file
+        self.transcript_model.fetch_all()
+        return [(timestamp, text) for segment_id, timestamp, text in self.transcript_model.segments]
+
+    def append_transcript(self, segment_id, timestamp, text):
+        self.transcript_model.append_segment(segment_id, timestamp, text)
+
+    def scroll_to_segment(self, row):
+        # Pages are fetched up to the row first
+        while row >= self.transcript_model.rowCount() and self.transcript_model.canFetchMore():
+            self.transcript_model.fetchMore()
+        index = self.transcript_model.index(row)
+        if index.isValid():
+            self.transcript_list.scrollTo(index, QAbstractItemView.PositionAtTop)
+            self.transcript_list.setCurrentIndex(index)
@@ -0,0 +1,76 @@
+# transcript_saver.py
+
+import threading
+import time
+
+class TranscriptSaver:
+    """
+    Write-behind saver for transcript edits. Edits are recorded per segment
+    and written on a background thread once the user has paused typing for
+    `delay` seconds, so repeated edits of the same segment are coalesced into
+    one write and the GUI thread never waits on disk I/O while typing.
+
+    :param conversation_manager: ConversationManager the segments are saved through.
+    :param delay: Seconds without edits before pending changes are written.
+    """
+    def __init__(self, conversation_manager, delay=1.0):
+        self.conversation_manager = conversation_manager
+        self.delay = delay
+        self.pending = {}  # segment_id -> latest text
+        self.last_edit = 0
+        self.writing = False
+        self.flush_requested = False
+        self.running = True
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def mark_dirty(self, segment_id, text):
+        with self.condition:
+            self.pending[segment_id] = text
+            self.last_edit = time.monotonic()
+            self.condition.notify_all()
+
+    def flush(self):
+        # Write everything pending now and wait until it is on disk
+        with self.condition:
+            if not self.pending and not self.writing:
+                return
+            self.flush_requested = True
+            self.condition.notify_all()
+            while self.pending or self.writing:
+                self.condition.wait()
+
+    def close(self):
+        self.flush()
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.thread.join()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.pending:
+                    self.condition.wait()
+                if not self.running and not self.pending:
+                    return
+                # Debounce: wait until edits have stopped for `delay` seconds, unless a flush is requested
+                while self.pending and not self.flush_requested:
+                    remaining = self.last_edit + self.delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                changes = self.pending
+                self.pending = {}
+                self.flush_requested = False
+                self.writing = True
+            try:
+                if changes:
+                    self.conversation_manager.update_segments(changes)
+            except Exception as e:
+                print(f"Error saving transcript: {e}")
+            finally:
+                with self.condition:
+                    self.writing = False
+                    self.condition.notify_all()
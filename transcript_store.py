@@ -0,0 +1,270 @@
+# transcript_store.py
+
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Keep the external-content FTS5 index in step with the segments table
+SEARCH_TRIGGERS = (
+    """CREATE TRIGGER IF NOT EXISTS segments_fts_insert AFTER INSERT ON segments BEGIN
+        INSERT INTO segments_fts (rowid, text) VALUES (new.id, new.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS segments_fts_delete AFTER DELETE ON segments BEGIN
+        INSERT INTO segments_fts (segments_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS segments_fts_update AFTER UPDATE OF text ON segments BEGIN
+        INSERT INTO segments_fts (segments_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO segments_fts (rowid, text) VALUES (new.id, new.text);
+    END""",
+)
+
+def make_snippet(text, words, width=120):
+    # The part of text around the first word found, on one line
+    text = " ".join(text.split())
+    lowered = text.lower()
+    positions = [lowered.find(word.lower()) for word in words]
+    positions = [position for position in positions if position >= 0]
+    start = max(0, min(positions) - width // 4) if positions else 0
+    snippet = text[start:start + width]
+    if start > 0:
+        snippet = "..." + snippet
+    if start + width < len(text):
+        snippet += "..."
+    return snippet
+
+class TranscriptStore:
+    """
+    All transcript segments of all conversations in one SQLite database.
+
+    Segments are addressed by a stable integer id and ordered by a per-
+    conversation sequence number, so appending, updating one segment and
+    reading a page of segments each touch only the rows involved, however
+    many segments a conversation has. Segment text is also kept in an FTS5
+    full-text index, maintained by triggers on every insert, update and
+    delete, so searching all conversations is a single indexed query.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS segments (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    conversation TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    modified REAL NOT NULL
+                )""")
+            self.connection.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS segments_order ON segments (conversation, seq)"
+            )
+        self.full_text_search = self.create_search_index()
+        self.data_version = self.get_data_version()
+
+    def create_search_index(self):
+        # Returns False if this SQLite build has no FTS5; search then falls back to a table scan
+        with self.lock, self.connection:
+            exists = self.connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'segments_fts'"
+            ).fetchall()
+            try:
+                self.connection.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5("
+                    "text, content='segments', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+                )
+            except sqlite3.OperationalError:
+                return False
+            for statement in SEARCH_TRIGGERS:
+                self.connection.execute(statement)
+            if not exists:
+                # Index segments written before the index existed
+                self.connection.execute("INSERT INTO segments_fts (segments_fts) VALUES ('rebuild')")
+        return True
+
+    def get_data_version(self):
+        # Changes only when another connection commits, not on this one's own writes
+        with self.lock:
+            return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def changed_externally(self):
+        """True if another process has written to the store since the last call."""
+        version = self.get_data_version()
+        changed = version != self.data_version
+        self.data_version = version
+        return changed
+
+    def execute(self, query, params=()):
+        with self.lock, self.connection:
+            return self.connection.execute(query, params).fetchall()
+
+    def append(self, conversation, timestamp, text):
+        with self.lock, self.connection:
+            return self.insert(conversation, timestamp, text)
+
+    def insert(self, conversation, timestamp, text, modified=None):
+        # Caller holds the lock and a transaction
+        (seq,), = self.connection.execute(
+            "SELECT COALESCE(MAX(seq), -1) + 1 FROM segments WHERE conversation = ?", (conversation,)
+        ).fetchall()
+        cursor = self.connection.execute(
+            "INSERT INTO segments (conversation, seq, timestamp, text, modified) VALUES (?, ?, ?, ?, ?)",
+            (conversation, seq, timestamp, text, modified or time.time())
+        )
+        return cursor.lastrowid
+
+    def update(self, segment_id, text):
+        self.execute("UPDATE segments SET text = ?, modified = ? WHERE id = ?", (text, time.time(), segment_id))
+
+    def update_many(self, texts):
+        # texts: {segment_id: text}, written in a single transaction
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "UPDATE segments SET text = ?, modified = ? WHERE id = ?",
+                [(text, now, segment_id) for segment_id, text in texts.items()]
+            )
+
+    def get_segments(self, conversation, offset=0, limit=None):
+        """Returns [(segment_id, timestamp, text)] in order, optionally one page at a time."""
+        return self.execute(
+            "SELECT id, timestamp, text FROM segments WHERE conversation = ? ORDER BY seq LIMIT ? OFFSET ?",
+            (conversation, -1 if limit is None else limit, offset)
+        )
+
+    def iter_segments(self, conversation, batch_size=500, connection=None):
+        """
+        Yields lists of up to batch_size (segment_id, timestamp, text) in
+        order. Each batch is one indexed range query continuing after the
+        last seq read, so memory and time per batch stay constant however
+        long the conversation is. Pass a connection from open_reader() to read
+        without taking the store's lock.
+        """
+        query = ("SELECT seq, id, timestamp, text FROM segments WHERE conversation = ? AND seq > ? "
+                 "ORDER BY seq LIMIT ?")
+        last_seq = -1
+        while True:
+            params = (conversation, last_seq, batch_size)
+            rows = connection.execute(query, params).fetchall() if connection else self.execute(query, params)
+            if not rows:
+                return
+            last_seq = rows[-1][0]
+            yield [(segment_id, timestamp, text) for seq, segment_id, timestamp, text in rows]
+
+    def open_reader(self):
+        # Separate connection for reading on another thread; WAL lets it run alongside writes
+        return sqlite3.connect(self.db_path, check_same_thread=False)
+
+    def count(self, conversation):
+        (count,), = self.execute("SELECT COUNT(*) FROM segments WHERE conversation = ?", (conversation,))
+        return count
+
+    def get_conversation_stats(self, conversations=None):
+        """
+        Returns {conversation: {'last_modified', 'segments', 'bytes'}} for every
+        conversation with segments, or just the given ones, in one query.
+        """
+        query = ("SELECT conversation, MAX(modified), COUNT(*), SUM(LENGTH(CAST(text AS BLOB))) "
+                 "FROM segments")
+        params = ()
+        if conversations is not None:
+            conversations = list(conversations)
+            query += f" WHERE conversation IN ({', '.join('?' * len(conversations))})"
+            params = conversations
+        rows = self.execute(query + " GROUP BY conversation", params)
+        return {
+            conversation: {'last_modified': modified, 'segments': segments, 'bytes': size}
+            for conversation, modified, segments, size in rows
+        }
+
+    def search(self, query, limit=50, candidates=1000):
+        """
+        Finds segments containing every word of query, the last word matching
+        as a prefix. The newest `candidates` matches are ranked by relevance,
+        so a query matching nearly every segment still costs a bounded amount
+        of work.
+
+        :return: [(segment_id, conversation, timestamp, snippet)], best match first.
+        """
+        words = re.findall(r"\w+", query)
+        if not words:
+            return []
+        if self.full_text_search:
+            match = " ".join(f'"{word}"' for word in words) + "*"
+            rows = self.execute(
+                "SELECT s.id, s.conversation, s.timestamp, s.text FROM ("
+                "SELECT rowid, rank FROM segments_fts WHERE segments_fts MATCH ? ORDER BY rowid DESC LIMIT ?"
+                ") c JOIN segments s ON s.id = c.rowid ORDER BY c.rank LIMIT ?",
+                (match, candidates, limit)
+            )
+        else:
+            conditions = " AND ".join("text LIKE ?" for _ in words)
+            rows = self.execute(
+                f"SELECT id, conversation, timestamp, text FROM segments WHERE {conditions} "
+                "ORDER BY id DESC LIMIT ?",
+                [f"%{word}%" for word in words] + [limit]
+            )
+        return [(segment_id, conversation, timestamp, make_snippet(text, words))
+                for segment_id, conversation, timestamp, text in rows]
+
+    def get_segment_row(self, segment_id):
+        """Position of a segment within its conversation, or None if it no longer exists."""
+        rows = self.execute(
+            "SELECT COUNT(*) FROM segments p JOIN segments s ON p.conversation = s.conversation "
+            "WHERE s.id = ? AND p.seq < s.seq",
+            (segment_id,)
+        )
+        exists = self.execute("SELECT 1 FROM segments WHERE id = ?", (segment_id,))
+        return rows[0][0] if exists else None
+
+    def get_conversations_of_segments(self, segment_ids):
+        segment_ids = list(segment_ids)
+        rows = self.execute(
+            f"SELECT DISTINCT conversation FROM segments WHERE id IN ({', '.join('?' * len(segment_ids))})",
+            segment_ids
+        )
+        return [conversation for conversation, in rows]
+
+    def replace_all(self, conversation, transcripts):
+        # transcripts: [(timestamp, text)]; the old segments are swapped out atomically
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM segments WHERE conversation = ?", (conversation,))
+            for timestamp, text in transcripts:
+                self.insert(conversation, timestamp, text)
+
+    def delete_conversation(self, conversation):
+        self.execute("DELETE FROM segments WHERE conversation = ?", (conversation,))
+
+    def import_legacy_dir(self, conversation, transcript_dir):
+        """
+        Moves a directory of per-timestamp .txt segment files into the store
+        and removes it. Returns the number of segments imported.
+        """
+        filenames = sorted(filename for filename in os.listdir(transcript_dir) if filename.endswith('.txt'))
+        with self.lock, self.connection:
+            # Segments already present means an earlier import committed but was interrupted before cleanup
+            already_imported = self.connection.execute(
+                "SELECT 1 FROM segments WHERE conversation = ? LIMIT 1", (conversation,)
+            ).fetchall()
+            if not already_imported:
+                for filename in filenames:
+                    file_path = os.path.join(transcript_dir, filename)
+                    with open(file_path, 'r') as f:
+                        text = f.read()
+                    # Keep the file's modification time so conversations still sort by last activity
+                    self.insert(conversation, filename[:-len('.txt')], text, os.path.getmtime(file_path))
+        for filename in filenames:
+            os.remove(os.path.join(transcript_dir, filename))
+        try:
+            os.rmdir(transcript_dir)
+        except OSError:
+            pass
+        return len(filenames)
+
+    def close(self):
+        self.connection.close()
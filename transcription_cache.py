@@ -0,0 +1,153 @@
+# transcription_cache.py
+
+import hashlib
+import json
+import mmap
+import os
+import threading
+import time
+from split_wav import read_wav_layout
+from metrics import metrics
+
+HASH_BLOCK_SIZE = 1 << 20
+
+class TranscriptionCache:
+    """
+    On-disk cache of transcription responses, keyed on a hash of the audio
+    payload and the request parameters. For WAV files only the PCM data and
+    its format are hashed, so the same audio re-saved with a different header
+    still hits. Entries are evicted least recently used first once the cache
+    is over max_bytes, and unconditionally after max_age seconds. Hits,
+    misses, evictions and the hit rate are published to the metrics registry.
+
+    :param cache_dir: Directory holding the cache entries.
+    :param max_bytes: Total size the entries may take up.
+    :param max_age: Seconds after its last use that an entry expires.
+    """
+    def __init__(self, cache_dir, max_bytes=100 * 1024 * 1024, max_age=90 * 24 * 3600):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.entries = {}  # key -> (size, last_used)
+        self.total_bytes = 0
+        self.scan()
+        self.evict()
+
+    def scan(self):
+        for shard in os.listdir(self.cache_dir):
+            shard_dir = os.path.join(self.cache_dir, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for filename in os.listdir(shard_dir):
+                if filename.endswith('.json'):
+                    stat = os.stat(os.path.join(shard_dir, filename))
+                    self.entries[filename[:-len('.json')]] = (stat.st_size, stat.st_mtime)
+                    self.total_bytes += stat.st_size
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def key(self, audio_file_path, **params):
+        digest = hashlib.sha256()
+        with open(audio_file_path, 'rb') as f:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    channels, sample_width, frame_rate, data_offset, data_size = read_wav_layout(data)
+                    digest.update(f"pcm:{channels}:{sample_width}:{frame_rate}\n".encode())
+                    for position in range(data_offset, data_offset + data_size, HASH_BLOCK_SIZE):
+                        digest.update(data[position:min(position + HASH_BLOCK_SIZE, data_offset + data_size)])
+            except ValueError:
+                # Not a WAV file (or an empty one): hash the file as it is
+                digest.update(b"file\n")
+                f.seek(0)
+                for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                    digest.update(block)
+        digest.update(json.dumps(params, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        result = self.lookup(key)
+        if result is None:
+            metrics.counter('transcriber_cache_misses_total', "Transcriptions not found in the cache").inc()
+        else:
+            metrics.counter('transcriber_cache_hits_total', "Transcriptions served from the cache").inc()
+        self.update_metrics()
+        return result
+
+    def lookup(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or time.time() - entry[1] > self.max_age:
+                self.misses += 1
+                return None
+            path = self.entry_path(key)
+            try:
+                with open(path, 'r') as f:
+                    result = json.load(f)
+            except (OSError, ValueError):
+                self.remove(key)
+                self.misses += 1
+                return None
+            now = time.time()
+            os.utime(path, (now, now))
+            self.entries[key] = (entry[0], now)
+            self.hits += 1
+            return result
+
+    def put(self, key, result):
+        path = self.entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(result, f)
+        os.replace(temp_path, path)
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries[key][0]
+            size = os.path.getsize(path)
+            self.entries[key] = (size, time.time())
+            self.total_bytes += size
+        self.evict()
+
+    def remove(self, key):
+        size, _ = self.entries.pop(key)
+        self.total_bytes -= size
+        try:
+            os.remove(self.entry_path(key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        with self.lock:
+            now = time.time()
+            for key in [key for key, (_, last_used) in self.entries.items() if now - last_used > self.max_age]:
+                self.remove(key)
+                metrics.counter('transcriber_cache_evictions_total', "Cache entries evicted", reason='age').inc()
+            if self.total_bytes > self.max_bytes:
+                for key, _ in sorted(self.entries.items(), key=lambda item: item[1][1]):
+                    if self.total_bytes <= self.max_bytes:
+                        break
+                    self.remove(key)
+                    metrics.counter('transcriber_cache_evictions_total', "Cache entries evicted", reason='size').inc()
+        self.update_metrics()
+
+    def get_stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+            }
+
+    def update_metrics(self):
+        stats = self.get_stats()
+        metrics.gauge('transcriber_cache_hit_rate', "Share of cache lookups that hit").set(stats['hit_rate'])
+        metrics.gauge('transcriber_cache_entries', "Transcriptions in the cache").set(stats['entries'])
+        metrics.gauge('transcriber_cache_bytes', "Disk space used by the cache").set(stats['bytes'])
@@ -0,0 +1,208 @@
+# transcription_queue.py
+
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import CancelledError, Future
+from job_journal import DONE, UNSPLIT
+from split_wav import iter_split_wav, is_wav_file
+from transcription_scheduler import TranscriptionScheduler, IMPORT
+from config import MAX_UPLOAD_BYTES
+
+class TranscriptionQueue:
+    """
+    Transcribes recording chunks as soon as they are handed over, so only the
+    last chunks are still outstanding when the recording stops. Uploads go
+    through a TranscriptionScheduler, which decides when each chunk is sent
+    given its priority and the API's rate limits, and the results are
+    reassembled in submission order.
+
+    With a journal, every chunk and its transcript are recorded under job_id
+    before the chunk file is deleted, and resume() picks an interrupted job
+    up at its unfinished chunks.
+
+    :param transcriber: Transcriber used for every chunk.
+    :param on_complete: Called with the joined text of all chunks once the queue is closed and drained.
+    :param on_error: Called instead with the list of chunk paths that could not be transcribed.
+    :param max_workers: Number of chunks uploaded at the same time, when no scheduler is given.
+    :param delete_chunks: Remove chunk files once they have been transcribed.
+    :param journal: Optional JobJournal recording the progress of the job.
+    :param job_id: Journal job the chunks belong to.
+    :param on_chunk_complete: Called with each chunk path and its text (None if it failed) as it finishes.
+    :param scheduler: Shared TranscriptionScheduler; a private one without rate limits is used otherwise.
+    :param priority: Scheduler priority of this queue's chunks.
+    :param archive: Optional AudioArchive that transcribed chunks are moved to instead of being deleted.
+    :param archive_key: Conversation key the chunks are archived under.
+    """
+    def __init__(self, transcriber, on_complete=None, on_error=None, max_workers=4, delete_chunks=True,
+                 journal=None, job_id=None, on_chunk_complete=None, scheduler=None, priority=IMPORT,
+                 archive=None, archive_key=None):
+        self.transcriber = transcriber
+        self.on_complete = on_complete
+        self.on_error = on_error
+        self.on_chunk_complete = on_chunk_complete
+        self.delete_chunks = delete_chunks
+        self.archive = archive
+        self.archive_key = archive_key
+        self.journal = journal
+        self.job_id = job_id
+        self.owns_scheduler = scheduler is None
+        self.scheduler = scheduler or TranscriptionScheduler(max_workers=max_workers)
+        self.priority = priority
+        self.chunks = []  # (chunk_path, future) in submission order
+        self.lock = threading.Lock()
+        self.finisher = None
+
+    def submit(self, chunk_path):
+        index = self.journal.add_chunk(self.job_id, chunk_path) if self.journal else None
+        self.submit_chunk(chunk_path, index)
+
+    def submit_file(self, audio_file_path, parts_dir, max_duration):
+        """
+        Splits an audio file into parts of at most max_duration seconds in
+        parts_dir and submits each part as soon as it is written. Returns the
+        number of parts submitted. Compressed audio is decoded to a temporary
+        WAV first, so it is split and compressed for upload like a recording.
+
+        If splitting fails partway, the parts already written are still
+        transcribed but the job fails, so the truncated transcript is only
+        saved if the user chooses to keep it.
+        """
+        submitted = 0
+        # Named after the file but never written, so cleaning up parts_dir can't touch the original
+        unsplit_path = os.path.join(parts_dir, os.path.basename(audio_file_path) + ".unsplit")
+        decoded_dir = None
+        source_path = audio_file_path
+        try:
+            if not is_wav_file(audio_file_path):
+                # Outside parts_dir, so the recordings compactor never picks it up
+                decoded_dir = tempfile.mkdtemp(prefix="decode_")
+                base_name = os.path.splitext(os.path.basename(audio_file_path))[0]
+                try:
+                    from audio_encoder import decode_to_wav
+                    source_path = decode_to_wav(audio_file_path, os.path.join(decoded_dir, base_name + ".wav"))
+                except Exception as e:
+                    print(f"Error decoding {audio_file_path}: {e}")
+                    return self.submit_whole_file(audio_file_path, parts_dir, unsplit_path)
+            for part_path in iter_split_wav(
+                source_path,
+                parts_dir,
+                max_duration=max_duration,
+                split_on_silence=True
+            ):
+                self.submit(part_path)
+                submitted += 1
+        except Exception as e:
+            print(f"Error splitting {audio_file_path}: {e}")
+            self.add_failed_chunk(unsplit_path)
+        finally:
+            if decoded_dir:
+                shutil.rmtree(decoded_dir, ignore_errors=True)
+        return submitted
+
+    def submit_whole_file(self, audio_file_path, parts_dir, unsplit_path):
+        # Without a decoder, compressed audio can only be sent as it is, if the API accepts its size
+        size = os.path.getsize(audio_file_path)
+        if size > MAX_UPLOAD_BYTES:
+            print(f"Cannot transcribe {audio_file_path}: it is {size / 2 ** 20:.0f} MB, over the "
+                  f"{MAX_UPLOAD_BYTES / 2 ** 20:.0f} MB upload limit, and could not be decoded to split it.")
+            self.add_failed_chunk(unsplit_path)
+            return 0
+        part_path = os.path.join(parts_dir, os.path.basename(audio_file_path))
+        shutil.copyfile(audio_file_path, part_path)
+        self.submit(part_path)
+        return 1
+
+    def add_failed_chunk(self, chunk_path):
+        # Recorded in the journal so the job also fails when it is resumed
+        if self.journal:
+            self.journal.add_chunk(self.job_id, chunk_path, state=UNSPLIT)
+        future = Future()
+        future.set_result(None)
+        with self.lock:
+            self.chunks.append((chunk_path, future))
+
+    def submit_chunk(self, chunk_path, index, block=None):
+        # Waits while the scheduler has a backlog at this priority, unless block is False
+        future = self.scheduler.submit_file(self.transcribe_chunk, chunk_path, index, priority=self.priority,
+                                            block=block)
+        with self.lock:
+            self.chunks.append((chunk_path, future))
+
+    def resume(self):
+        # Completed chunks come from the journal; only the rest are uploaded
+        for chunk in self.journal.get_chunks(self.job_id):
+            if chunk['state'] in (DONE, UNSPLIT):
+                # The missing rest of a file that couldn't be split has no audio to upload
+                future = Future()
+                future.set_result(chunk['text'] if chunk['state'] == DONE else None)
+                with self.lock:
+                    self.chunks.append((chunk['path'], future))
+            else:
+                # Called from the GUI thread, which mustn't wait for uploads to drain
+                self.submit_chunk(chunk['path'], chunk['index'], block=False)
+
+    def close(self):
+        # No more chunks will be submitted; results are collected once every upload has finished
+        if self.journal:
+            self.journal.close_job(self.job_id)
+        self.finisher = threading.Thread(target=self.finish, daemon=True)
+        self.finisher.start()
+
+    def join(self, timeout=None):
+        if self.finisher:
+            self.finisher.join(timeout)
+
+    def transcribe_chunk(self, chunk_path, index=None):
+        text = self.transcribe_and_record(chunk_path, index)
+        if self.on_chunk_complete:
+            self.on_chunk_complete(chunk_path, text)
+        return text
+
+    def transcribe_and_record(self, chunk_path, index=None):
+        try:
+            transcript_data = self.transcriber.transcribe(chunk_path)
+        except Exception as e:
+            print(f"Error transcribing {chunk_path}: {e}")
+            transcript_data = None
+        if not transcript_data:
+            if self.journal:
+                self.journal.fail_chunk(self.job_id, index)
+            return None
+        text = transcript_data.get('text', '')
+        if self.journal:
+            # Commit the text before the audio is gone
+            self.journal.complete_chunk(self.job_id, index, text)
+        if self.archive:
+            # Encoded on the archive's thread, so this worker can take the next upload
+            self.archive.add_later(chunk_path, self.archive_key)
+        elif self.delete_chunks:
+            # Remove chunk file after transcription
+            os.remove(chunk_path)
+        return text
+
+    def finish(self):
+        transcripts = []
+        failed_chunks = []
+        with self.lock:
+            chunks = list(self.chunks)
+        for chunk_path, future in chunks:
+            try:
+                text = future.result()
+            except CancelledError:
+                # Abandoned by a scheduler that was closed; the chunk file is still on disk
+                text = None
+            if text is None:
+                # The chunk file is kept on disk so it can be retried
+                failed_chunks.append(chunk_path)
+            else:
+                transcripts.append(text)
+        if self.owns_scheduler:
+            self.scheduler.close()
+
+        if failed_chunks:
+            if self.on_error:
+                self.on_error(failed_chunks)
+        elif self.on_complete:
+            self.on_complete('\n'.join(transcripts))
@@ -0,0 +1,263 @@
+# transcription_scheduler.py
+
+import heapq
+import itertools
+import os
+import threading
+import time
+import wave
+from concurrent.futures import Future
+from metrics import metrics
+
+# Priorities, most urgent first: chunks of a recording in progress go ahead of bulk imports
+LIVE = 0
+IMPORT = 1
+
+# Assumed bitrate of compressed audio, whose duration isn't read from the file
+COMPRESSED_BITS_PER_SECOND = 128000
+
+def audio_duration(file_path):
+    """Seconds of audio in a file; read from the header of WAV files, estimated from the size of others."""
+    try:
+        with wave.open(file_path, 'rb') as wf:
+            return wf.getnframes() / wf.getframerate()
+    except (wave.Error, EOFError, OSError):
+        pass
+    try:
+        return os.path.getsize(file_path) * 8 / COMPRESSED_BITS_PER_SECOND
+    except OSError:
+        return 0
+
+class TokenBucket:
+    """
+    Refills at rate_per_minute tokens per minute up to `burst` tokens. A
+    request larger than the bucket can still go through once it is full,
+    leaving it in debt, so big chunks are delayed rather than stuck.
+    """
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60
+        self.capacity = burst if burst is not None else max(1, rate_per_minute / 6)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        # Seconds until amount can be taken
+        self.refill()
+        needed = min(amount, self.capacity) - self.tokens
+        return max(0.0, needed / self.rate)
+
+    def take(self, amount):
+        self.refill()
+        self.tokens -= amount
+
+    def drain(self, seconds):
+        # Empties the bucket and keeps it empty for `seconds` more, e.g. after the API asked us to slow down
+        self.refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+class TranscriptionScheduler:
+    """
+    Application-wide queue for every transcription request. Requests run on
+    up to max_workers threads, most urgent priority first, and only as fast
+    as the requests-per-minute and audio-seconds-per-minute token buckets
+    allow. When the API answers 429 anyway, both buckets are paused for the
+    time it asked for. Retries are charged to the buckets too: the
+    transcriber waits for them through wait_for_retry(), which frees the
+    worker's slot for another request while it backs off.
+
+    Producers of LIVE work never wait, since they are recording. Other
+    producers block in submit() while max_pending of their tasks are queued,
+    so a large import can't run far ahead of the uploads.
+
+    :param transcriber: Transcriber whose rate-limit responses pause the scheduler.
+    :param requests_per_minute: Request limit, or None for no limit.
+    :param audio_seconds_per_minute: Audio limit, or None for no limit.
+    :param max_workers: Requests in flight at the same time, not counting workers backing off before a retry.
+    :param max_pending: Queued tasks per non-live priority before submit() blocks.
+    """
+    def __init__(self, transcriber=None, requests_per_minute=None, audio_seconds_per_minute=None, max_workers=4,
+                 max_pending=16):
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.audio_bucket = TokenBucket(audio_seconds_per_minute) if audio_seconds_per_minute else None
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.condition = threading.Condition()
+        self.queue = []  # Heap of (priority, seq, task)
+        self.sequence = itertools.count()
+        self.queued_by_priority = {}
+        self.queued_audio_seconds = 0.0
+        self.running = 0
+        self.completed = 0
+        self.busy_seconds = 0.0  # Total time spent running tasks, for the ETA
+        self.stopped = False
+        self.current = threading.local()  # Audio seconds of the task each worker is running
+        if transcriber is not None:
+            transcriber.on_rate_limited = self.pause
+            transcriber.wait_for_retry = self.wait_for_retry
+        # Spare threads take over the slots of workers that are backing off
+        self.workers = [threading.Thread(target=self.run, daemon=True, name=f"transcription-{number}")
+                        for number in range(max_workers * 2)]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, function, *args, priority=IMPORT, audio_seconds=0.0, block=None):
+        """
+        Queues function(*args) and returns a Future for its result.
+
+        :param audio_seconds: Seconds of audio the call uploads, charged to the audio bucket.
+        :param block: Wait while the priority's queue is full; defaults to True except for LIVE.
+        """
+        future = Future()
+        task = (future, function, args, audio_seconds)
+        if block is None:
+            block = priority != LIVE
+        with self.condition:
+            while block and not self.stopped and self.queued_by_priority.get(priority, 0) >= self.max_pending:
+                self.condition.wait()
+            heapq.heappush(self.queue, (priority, next(self.sequence), task))
+            self.queued_by_priority[priority] = self.queued_by_priority.get(priority, 0) + 1
+            self.queued_audio_seconds += audio_seconds
+            self.condition.notify_all()
+        self.update_metrics()
+        return future
+
+    def submit_file(self, function, file_path, *args, priority=IMPORT, block=None):
+        # Convenience for calls that upload one audio file, given as the first argument
+        return self.submit(function, file_path, *args, priority=priority, audio_seconds=audio_duration(file_path),
+                           block=block)
+
+    def pause(self, seconds):
+        with self.condition:
+            for bucket in (self.request_bucket, self.audio_bucket):
+                if bucket:
+                    bucket.drain(seconds)
+        print(f"Rate limited; pausing transcription requests for {seconds:.1f}s")
+
+    def limit_wait(self, audio_seconds):
+        # Seconds until one request of audio_seconds fits the rate limits; caller holds the condition
+        wait = 0.0
+        if self.request_bucket:
+            wait = max(wait, self.request_bucket.wait_time(1))
+        if self.audio_bucket:
+            wait = max(wait, self.audio_bucket.wait_time(audio_seconds))
+        return wait
+
+    def charge(self, audio_seconds):
+        if self.request_bucket:
+            self.request_bucket.take(1)
+        if self.audio_bucket:
+            self.audio_bucket.take(audio_seconds)
+
+    def next_task(self):
+        # Blocks until the most urgent task may start under the rate limits; None once stopped
+        with self.condition:
+            while True:
+                if self.stopped:
+                    return None
+                if not self.queue or self.running >= self.max_workers:
+                    self.condition.wait()
+                    continue
+                priority, _, task = self.queue[0]
+                audio_seconds = task[3]
+                wait = self.limit_wait(audio_seconds)
+                if wait > 0:
+                    # Woken early if something more urgent arrives
+                    self.condition.wait(wait)
+                    continue
+                heapq.heappop(self.queue)
+                self.charge(audio_seconds)
+                self.queued_by_priority[priority] -= 1
+                self.queued_audio_seconds -= audio_seconds
+                self.running += 1
+                self.condition.notify_all()  # Room for blocked producers
+                return task
+
+    def wait_for_retry(self, delay, file_path):
+        """
+        Called by the transcriber instead of sleeping `delay` seconds before
+        it retries a request. The worker gives up its slot while it waits, and
+        the retry is charged to the rate limits like a new request.
+        """
+        worker = threading.current_thread() in self.workers
+        audio_seconds = self.current.audio_seconds if worker else audio_duration(file_path)
+        if worker:
+            with self.condition:
+                self.running -= 1
+                self.condition.notify_all()
+        time.sleep(delay)
+        with self.condition:
+            while not self.stopped:
+                wait = self.limit_wait(audio_seconds)
+                if worker and self.running >= self.max_workers:
+                    self.condition.wait()
+                elif wait > 0:
+                    self.condition.wait(wait)
+                else:
+                    self.charge(audio_seconds)
+                    break
+            if worker:
+                self.running += 1
+        self.update_metrics()
+
+    def run(self):
+        while True:
+            task = self.next_task()
+            if task is None:
+                return
+            future, function, args, audio_seconds = task
+            self.current.audio_seconds = audio_seconds
+            self.update_metrics()
+            started = time.monotonic()
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(function(*args))
+                except BaseException as e:
+                    future.set_exception(e)
+            with self.condition:
+                self.running -= 1
+                self.completed += 1
+                self.busy_seconds += time.monotonic() - started
+                self.condition.notify_all()  # A slot is free
+            self.update_metrics()
+
+    def get_stats(self):
+        """Queue depth per priority, tasks running, and an estimate of the seconds until the queue is empty."""
+        with self.condition:
+            queued = len(self.queue)
+            stats = {
+                'queued': queued,
+                'queued_live': self.queued_by_priority.get(LIVE, 0),
+                'queued_import': queued - self.queued_by_priority.get(LIVE, 0),
+                'running': self.running,
+                'queued_audio_seconds': self.queued_audio_seconds,
+            }
+            # Whichever is slower: working through the queue at the observed speed, or the rate limits
+            average = self.busy_seconds / self.completed if self.completed else None
+            eta = (queued + self.running) * average / self.max_workers if average is not None else None
+            if self.request_bucket:
+                eta = max(eta or 0, queued / (self.request_bucket.rate))
+            if self.audio_bucket:
+                eta = max(eta or 0, self.queued_audio_seconds / self.audio_bucket.rate)
+            stats['eta_seconds'] = eta
+        return stats
+
+    def update_metrics(self):
+        stats = self.get_stats()
+        metrics.gauge('scheduler_queued', "Transcription tasks waiting", priority='live').set(stats['queued_live'])
+        metrics.gauge('scheduler_queued', "Transcription tasks waiting", priority='import').set(stats['queued_import'])
+        metrics.gauge('scheduler_running', "Transcription tasks in flight").set(stats['running'])
+
+    def close(self):
+        # Queued tasks are abandoned; their futures are cancelled
+        with self.condition:
+            self.stopped = True
+            abandoned = [task for _, _, task in self.queue]
+            self.queue = []
+            self.condition.notify_all()
+        for future, _, _, _ in abandoned:
+            future.cancel()
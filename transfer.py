@@ -0,0 +1,338 @@
+# transfer.py
+
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from conversation_manager import ConversationManager
+from tree_journal import JournalLockedError
+
+FORMATS = ('jsonl', 'markdown')
+# Seconds between checkpoints of an export, so an interrupted one can resume
+CHECKPOINT_INTERVAL = 1.0
+BATCH_SIZE = 500
+# Prefix of the line that starts a conversation in Markdown; an HTML comment, so it doesn't render
+MARKDOWN_CONVERSATION = "<!-- conversation: "
+
+def guess_format(file_path):
+    return 'markdown' if file_path.lower().endswith(('.md', '.markdown')) else 'jsonl'
+
+def escape_markdown(text):
+    # Lines that could be read back as headings or markers get a backslash, which Markdown renders as nothing
+    return "\n".join("\\" + line if line.startswith(("#", "<", "\\")) else line for line in text.split("\n"))
+
+def unescape_markdown(lines):
+    return "\n".join(line[1:] if line.startswith("\\") else line for line in lines)
+
+class JsonlWriter:
+    # One line per conversation, followed by one line per segment
+    def __init__(self, f):
+        self.f = f
+
+    def start_conversation(self, path):
+        self.f.write(json.dumps({'conversation': path}, ensure_ascii=False) + "\n")
+
+    def write_segments(self, segments):
+        self.f.write("".join(json.dumps({'timestamp': timestamp, 'text': text}, ensure_ascii=False) + "\n"
+                             for segment_id, timestamp, text in segments))
+
+class MarkdownWriter:
+    # A heading per conversation and per segment; readable as it is, and imported back losslessly
+    def __init__(self, f):
+        self.f = f
+
+    def start_conversation(self, path):
+        self.f.write(f"{MARKDOWN_CONVERSATION}{json.dumps(path, ensure_ascii=False)} -->\n"
+                     f"# {' / '.join(path)}\n\n")
+
+    def write_segments(self, segments):
+        self.f.write("".join(f"## {timestamp}\n\n{escape_markdown(text)}\n\n"
+                             for segment_id, timestamp, text in segments))
+
+WRITERS = {'jsonl': JsonlWriter, 'markdown': MarkdownWriter}
+
+def read_jsonl(f):
+    """Yields ('conversation', path) and ('segment', timestamp, text) events, one line at a time."""
+    for number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise ValueError(f"Line {number} is not valid JSON") from None
+        if 'conversation' in record:
+            yield ('conversation', record['conversation'])
+        else:
+            yield ('segment', record['timestamp'], record['text'])
+
+def read_markdown(f):
+    """Yields the same events as read_jsonl from a Markdown export, holding one segment at a time."""
+    timestamp = None
+    lines = []
+
+    def segment():
+        # The text is followed by one blank line separating it from the next heading
+        return ('segment', timestamp, unescape_markdown(lines[1:-1]))
+
+    for line in f:
+        line = line.rstrip("\n")
+        if line.startswith(MARKDOWN_CONVERSATION):
+            if timestamp is not None:
+                yield segment()
+            timestamp = None
+            yield ('conversation', json.loads(line[len(MARKDOWN_CONVERSATION):-len(" -->")]))
+        elif line.startswith("## "):
+            if timestamp is not None:
+                yield segment()
+            timestamp = line[3:]
+            lines = []
+        elif timestamp is not None:
+            lines.append(line)
+    if timestamp is not None:
+        yield segment()
+
+READERS = {'jsonl': read_jsonl, 'markdown': read_markdown}
+
+class Exporter:
+    """
+    Streams every conversation of a subtree to a JSONL or Markdown file.
+    Segments are read in batches, so memory use doesn't grow with the size
+    of the export. With `workers` above one, that many conversations are
+    read ahead on their own database connections while the output is
+    still written in tree order; each holds at most a few batches.
+
+    Progress is checkpointed next to the output. An export started again
+    with resume=True truncates the output to the last checkpoint and
+    carries on after the last conversation it covers.
+    """
+    def __init__(self, conversation_manager, output_path, format='jsonl', workers=1, batch_size=BATCH_SIZE):
+        self.conversation_manager = conversation_manager
+        self.store = conversation_manager.transcript_store
+        self.output_path = output_path
+        self.checkpoint_path = output_path + ".checkpoint"
+        self.format = format
+        self.workers = workers
+        self.batch_size = batch_size
+        self.conversations = 0
+        self.segments = 0
+        self.readers = []
+        self.local = threading.local()
+        self.readers_lock = threading.Lock()
+
+    def run(self, path=[], resume=False):
+        """Exports the subtree at path. Returns the number of conversations written in this run."""
+        checkpoint = self.load_checkpoint() if resume else None
+        paths = self.conversation_manager.iter_conversation_paths(path)
+        if checkpoint:
+            # Paths come in list order, so everything up to the last one written is already in the file
+            paths = (conversation_path for conversation_path in paths if conversation_path > checkpoint['last'])
+            with open(self.output_path, 'r+b') as f:
+                f.truncate(checkpoint['offset'])
+        elif os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        started = time.monotonic()
+        last_checkpoint = started
+        with open(self.output_path, 'a' if checkpoint else 'w', encoding='utf-8') as f:
+            writer = WRITERS[self.format](f)
+            for conversation_path, batches in self.read_conversations(paths):
+                writer.start_conversation(conversation_path)
+                for segments in batches:
+                    writer.write_segments(segments)
+                    self.segments += len(segments)
+                self.conversations += 1
+                if time.monotonic() - last_checkpoint >= CHECKPOINT_INTERVAL:
+                    self.save_checkpoint(f, conversation_path)
+                    last_checkpoint = time.monotonic()
+                    self.report_progress(started)
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        self.report_progress(started)
+        print()
+        return self.conversations
+
+    def read_conversations(self, paths):
+        # Yields (path, iterable of segment batches) in order
+        if self.workers <= 1:
+            for conversation_path in paths:
+                yield conversation_path, self.conversation_manager.iter_segments(conversation_path, self.batch_size)
+            return
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="export") as executor:
+            pending = deque()
+            try:
+                for conversation_path in paths:
+                    # A short queue per conversation keeps workers from reading far ahead of the writer
+                    batches = queue.Queue(maxsize=2)
+                    pending.append((conversation_path, batches, executor.submit(self.read, conversation_path, batches)))
+                    if len(pending) >= self.workers:
+                        # Left in pending until written, so it is cleaned up if writing fails
+                        yield self.drain(*pending[0])
+                        pending.popleft()
+                while pending:
+                    yield self.drain(*pending[0])
+                    pending.popleft()
+            finally:
+                # Unblock workers still waiting to hand over a batch
+                for _, batches, future in pending:
+                    future.cancel()
+                    while not future.done():
+                        try:
+                            batches.get(timeout=0.1)
+                        except queue.Empty:
+                            pass
+                self.close_readers()
+
+    def read(self, conversation_path, batches):
+        # Runs on a worker thread; None marks the end of the conversation
+        try:
+            connection = self.get_reader()
+            key = self.conversation_manager.get_conversation_key(conversation_path)
+            for segments in self.store.iter_segments(key, self.batch_size, connection):
+                batches.put(segments)
+        finally:
+            batches.put(None)
+
+    def drain(self, conversation_path, batches, future):
+        def iter_batches():
+            for segments in iter(batches.get, None):
+                yield segments
+            future.result()  # Raises the worker's error, if any
+        return conversation_path, iter_batches()
+
+    def get_reader(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = self.store.open_reader()
+            with self.readers_lock:
+                self.readers.append(connection)
+        return connection
+
+    def close_readers(self):
+        with self.readers_lock:
+            for connection in self.readers:
+                connection.close()
+            self.readers = []
+
+    def load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, 'r') as f:
+                checkpoint = json.load(f)
+            if checkpoint.get('format') == self.format and os.path.getsize(self.output_path) >= checkpoint['offset']:
+                return checkpoint
+        except (OSError, ValueError, KeyError):
+            pass
+        return None
+
+    def save_checkpoint(self, f, last_path):
+        # The output is flushed first, so the checkpoint never covers bytes that aren't in the file
+        f.flush()
+        os.fsync(f.fileno())
+        checkpoint = {'format': self.format, 'offset': f.tell(), 'last': last_path}
+        temp_path = self.checkpoint_path + ".tmp"
+        with open(temp_path, 'w') as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file)
+        os.replace(temp_path, self.checkpoint_path)
+
+    def report_progress(self, started):
+        elapsed = time.monotonic() - started
+        line = f"Exported {self.conversations} conversations, {self.segments} segments in {elapsed:.0f}s"
+        if sys.stdout.isatty():
+            print("\r" + line, end="", flush=True)
+        else:
+            print(line, flush=True)
+
+def import_conversations(conversation_manager, input_path, parent_path=[], format='jsonl', append=False):
+    """
+    Streams an export back into the tree under parent_path, creating
+    missing folders and conversations. Each conversation is written in one
+    transaction, and conversations that already have segments are skipped
+    unless append is set, so an interrupted import can simply be run again.
+
+    :return: (conversations imported, segments imported, conversations skipped)
+    """
+    store = conversation_manager.transcript_store
+    imported = segments = skipped = 0
+    with open(input_path, 'r', encoding='utf-8') as f:
+        events = READERS[format](f)
+        event = next(events, None)
+        while event is not None:
+            if event[0] != 'conversation':
+                raise ValueError("Segment found before the first conversation")
+            path = parent_path + event[1]
+            key = None
+            if not conversation_manager.ensure_conversation(path):
+                print(f"Skipping '{'/'.join(path)}': a folder of that name exists.")
+            elif append or not store.count(conversation_manager.get_conversation_key(path)):
+                key = conversation_manager.get_conversation_key(path)
+            with store.lock, store.connection:
+                event = next(events, None)
+                while event is not None and event[0] == 'segment':
+                    if key is not None:
+                        store.insert(key, event[1], event[2])
+                        segments += 1
+                    event = next(events, None)
+            if key is None:
+                skipped += 1
+            else:
+                conversation_manager.index.refresh_paths(conversation_manager.conversations, [path])
+                imported += 1
+    return imported, segments, skipped
+
+def main():
+    parser = argparse.ArgumentParser(description="Export conversations to JSONL or Markdown, or import an export.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Export a folder or conversation")
+    export_parser.add_argument("output", help="File to write")
+    export_parser.add_argument("path", nargs="?", default="", help="Folder or conversation, e.g. 'Meetings/2024'")
+    export_parser.add_argument("--format", choices=FORMATS, help="Defaults to markdown for .md files, else jsonl")
+    export_parser.add_argument("--resume", action="store_true", help="Continue an interrupted export")
+    export_parser.add_argument("--workers", type=int, default=1, help="Conversations read in parallel")
+    import_parser = subparsers.add_parser("import", help="Import an export")
+    import_parser.add_argument("input", help="File to read")
+    import_parser.add_argument("--into", default="", help="Folder to import under, created if missing")
+    import_parser.add_argument("--format", choices=FORMATS, help="Defaults to markdown for .md files, else jsonl")
+    import_parser.add_argument("--append", action="store_true",
+                               help="Append to conversations that already have segments instead of skipping them")
+    for subparser in (export_parser, import_parser):
+        subparser.add_argument("--data-dir", default=".", help="Directory containing the app's conversations directory")
+    args = parser.parse_args()
+
+    # Paths of files given relative to where the command was run
+    file_path = os.path.abspath(args.output if args.command == "export" else args.input)
+    file_format = args.format or guess_format(file_path)
+    os.chdir(args.data_dir)
+    try:
+        conversation_manager = ConversationManager()
+    except JournalLockedError:
+        print("The conversations are open in the app or another command; close it and try again.")
+        return 1
+    try:
+        if args.command == "export":
+            path = [part for part in args.path.split("/") if part]
+            if path and conversation_manager.get_node(path) is None and not conversation_manager.is_conversation(path):
+                print(f"'{args.path}' does not exist.")
+                return 1
+            exporter = Exporter(conversation_manager, file_path, file_format, workers=args.workers)
+            exporter.run(path, resume=args.resume)
+        else:
+            parent_path = [part for part in args.into.split("/") if part]
+            if parent_path and conversation_manager.is_conversation(parent_path):
+                print(f"'{args.into}' is a conversation, not a folder.")
+                return 1
+            for depth in range(1, len(parent_path) + 1):
+                if conversation_manager.get_node(parent_path[:depth]) is None:
+                    conversation_manager.create_folder(parent_path[depth - 1], parent_path[:depth - 1])
+            imported, segments, skipped = import_conversations(
+                conversation_manager, file_path, parent_path, file_format, append=args.append
+            )
+            print(f"Imported {segments} segments into {imported} conversations, skipped {skipped}.")
+    finally:
+        conversation_manager.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+# tree_journal.py
+
+import json
+import os
+import threading
+from metrics import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Version 3: conversations are leaves holding their stable id instead of None
+SNAPSHOT_VERSION = 3
+
+class JournalLockedError(RuntimeError):
+    """Raised when another process already has the journal open."""
+
+def apply_operation(tree, operation):
+    """
+    Applies one logged mutation to the conversation tree.
+
+    :return: True if the tree changed.
+    """
+    path = operation['path']
+    parent = tree
+    for part in path[:-1]:
+        if not isinstance(parent, dict) or part not in parent:
+            return False
+        parent = parent[part]
+    if not isinstance(parent, dict):
+        return False
+    name = path[-1]
+    kind = operation['op']
+    if kind == 'create':
+        if name in parent:
+            return False
+        parent[name] = operation['value']
+    elif kind == 'rename':
+        if name not in parent or operation['name'] in parent:
+            return False
+        parent[operation['name']] = parent.pop(name)
+    elif kind == 'move':
+        target = tree
+        for part in operation['to']:
+            if not isinstance(target, dict) or part not in target:
+                return False
+            target = target[part]
+        # Not onto itself, into its own subtree, or over a sibling of the same name
+        if name not in parent or not isinstance(target, dict) or name in target or operation['to'][:len(path)] == path:
+            return False
+        target[name] = parent.pop(name)
+    elif kind == 'delete':
+        if name not in parent:
+            return False
+        del parent[name]
+    else:
+        raise ValueError(f"Unknown tree operation: {kind}")
+    return True
+
+class TreeJournal:
+    """
+    Persists the conversation tree as a snapshot plus an append-only log of
+    operations. Each mutation costs one small fsynced append; once the log
+    passes compact_threshold bytes a background thread folds it into a new
+    snapshot, written to a temporary file and renamed into place. Every
+    operation carries a sequence number and the snapshot records the last
+    one it contains, so replaying after a crash at any point is exact.
+
+    Sequence numbers are only unique within one writer, so load() takes an
+    exclusive lock on a file next to the log and keeps it until close(); a
+    second process opening the same journal gets JournalLockedError.
+    """
+    def __init__(self, snapshot_path, log_path, compact_threshold=256 * 1024):
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path
+        self.rotated_log_path = log_path + ".old"
+        self.lock_path = log_path + ".lock"
+        self.lock_file = None
+        self.compact_threshold = compact_threshold
+        self.lock = threading.RLock()
+        self.compaction_lock = threading.Lock()  # Only one snapshot is written at a time
+        self.seq = 0
+        self.log_file = None
+        self.compacting = False
+        self.tree = {}
+
+    def load(self):
+        if self.lock_file is None:
+            self.acquire_writer_lock()
+        tree, self.seq = self.read_snapshot()
+        self.replay(tree, self.rotated_log_path)
+        good_length = self.replay(tree, self.log_path)
+        self.tree = tree
+        if os.path.exists(self.rotated_log_path):
+            # A crash interrupted compaction; snapshot its operations before the next compaction replaces the file
+            self.write_snapshot(json.dumps({'version': SNAPSHOT_VERSION, 'seq': self.seq, 'tree': tree}))
+            os.remove(self.rotated_log_path)
+        self.log_file = open(self.log_path, 'a+b')
+        # Drop a half-written last line left by a crash so new operations start on a clean line
+        self.log_file.truncate(good_length)
+        self.log_file.seek(0, os.SEEK_END)
+        return tree
+
+    def acquire_writer_lock(self):
+        lock_file = open(self.lock_path, 'a+b')
+        try:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            lock_file.close()
+            raise JournalLockedError(f"{self.log_path} is in use by another process") from None
+        self.lock_file = lock_file
+
+    def read_snapshot(self):
+        if not os.path.exists(self.snapshot_path):
+            return {}, 0
+        with open(self.snapshot_path, 'r') as f:
+            data = json.load(f)
+        if isinstance(data.get('version'), int):
+            return data['tree'], data['seq']
+        # Snapshots written before the journal existed are the bare tree
+        return data, 0
+
+    def replay(self, tree, log_path):
+        # Returns the length of the valid prefix of the log
+        good_length = 0
+        if not os.path.exists(log_path):
+            return good_length
+        with open(log_path, 'rb') as f:
+            for line in f:
+                try:
+                    operation = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                good_length += len(line)
+                if operation['seq'] > self.seq:
+                    apply_operation(tree, operation)
+                    self.seq = operation['seq']
+        return good_length
+
+    def apply(self, operation):
+        """Logs an operation durably, then applies it to the in-memory tree."""
+        with self.lock, metrics.timer('tree_journal_append_seconds', "Time to durably log a tree operation"):
+            self.seq += 1
+            operation = dict(operation, seq=self.seq)
+            self.log_file.write(json.dumps(operation).encode() + b'\n')
+            self.log_file.flush()
+            os.fsync(self.log_file.fileno())
+            changed = apply_operation(self.tree, operation)
+            if self.log_file.tell() >= self.compact_threshold and not self.compacting:
+                self.compacting = True
+                threading.Thread(target=self.compact, daemon=True).start()
+        return changed
+
+    def compact(self):
+        """Writes a new snapshot and discards the log entries it covers."""
+        with self.compaction_lock, metrics.timer('tree_journal_compact_seconds', "Time to write a tree snapshot"):
+            with self.lock:
+                self.compacting = True
+                data = json.dumps({'version': SNAPSHOT_VERSION, 'seq': self.seq, 'tree': self.tree})
+                # New operations go to a fresh log while the snapshot is written
+                self.log_file.close()
+                os.replace(self.log_path, self.rotated_log_path)
+                self.log_file = open(self.log_path, 'a+b')
+            try:
+                self.write_snapshot(data)
+                os.remove(self.rotated_log_path)
+            finally:
+                with self.lock:
+                    self.compacting = False
+
+    def write_snapshot(self, data):
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, 'w') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+
+    def close(self):
+        with self.lock:
+            if self.log_file:
+                self.log_file.close()
+                self.log_file = None
+            if self.lock_file:
+                # Closing the file releases the lock
+                self.lock_file.close()
+                self.lock_file = None
@@ -2,39 +2,197 @@
 
 import sys
 from PyQt5.QtWidgets import (
-    QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QMessageBox, QInputDialog, QApplication, QFileDialog
+    QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QMessageBox, QInputDialog, QApplication, QFileDialog,
+    QLineEdit, QListWidget, QListWidgetItem, QDockWidget
 )
-from PyQt5.QtCore import pyqtSignal, pyqtSlot
+from PyQt5.QtCore import Qt, pyqtSignal, pyqtSlot, QFileSystemWatcher, QTimer
 import os
 import glob
+import re
+import tempfile
 import threading
 from conversation_manager import ConversationManager
 from conversation_tree import ConversationTree
 from transcript_editor import TranscriptEditor
-from recorder import Recorder
-from transcriber import Transcriber
-from config import OPENAI_API_KEY
+from transcript_saver import TranscriptSaver
+from job_journal import JobJournal, OPEN, UNSPLIT, INGEST_SOURCE_PREFIX
+from tree_journal import JournalLockedError
+from audio_backend import warm_up_in_background, terminate_shared_audio
+from metrics import metrics, MetricsExporter
+from metrics_panel import MetricsPanel
+from config import (
+    OPENAI_API_KEY, OPENAI_API_BASE, UPLOAD_AUDIO_FORMAT, UPLOAD_SAMPLE_RATE, IMPORT_CHUNK_DURATION,
+    TRANSCRIPTION_CACHE_DIR, TRANSCRIPTION_CACHE_MAX_BYTES, TRANSCRIPTION_CACHE_MAX_AGE,
+    TRANSCRIPTION_REQUESTS_PER_MINUTE, TRANSCRIPTION_AUDIO_SECONDS_PER_MINUTE, TRANSCRIPTION_WORKERS,
+    TRANSCRIPTION_MAX_PENDING, ARCHIVE_RECORDINGS, ARCHIVE_COMPACT_INTERVAL, ARCHIVE_COMPACT_GRACE,
+    METRICS_FILE, METRICS_FORMAT, METRICS_INTERVAL
+)
+
+def chunk_index(chunk_file):
+    match = re.search(r"recording_chunk_(\d+)\.wav$", chunk_file)
+    return int(match.group(1)) if match else -1
+
+def remove_empty_import_dirs(directories):
+    for directory in directories:
+        if os.path.basename(directory).startswith("import_"):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
 
 class MainWindow(QMainWindow):
-    transcription_complete = pyqtSignal(str)
-    transcription_error = pyqtSignal()
+    transcription_complete = pyqtSignal(int, str)  # job id, transcript text
+    transcription_error = pyqtSignal(int, list)  # job id, chunk files that failed
+    metadata_loaded = pyqtSignal()
+    metadata_load_failed = pyqtSignal(str)
 
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Conversation Recorder")
         self.resize(1000, 700)
 
-        self.conversation_manager = ConversationManager()
-        self.transcriber = Transcriber(OPENAI_API_KEY)
+        # The tree and its metadata are loaded on a background thread once the window is up
+        self.conversation_manager = ConversationManager(load=False)
+        # Edits are saved per segment on a background thread once typing pauses
+        self.transcript_saver = TranscriptSaver(self.conversation_manager)
+        self.job_journal = JobJournal(os.path.join(self.conversation_manager.conversations_dir, "jobs.sqlite3"))
+        self.transcriber = None  # Created on first use; importing requests and numpy slows down startup
+        self.transcriber_lock = threading.Lock()
+        self.scheduler = None  # Shared by every transcription queue; created with the transcriber
         self.recorder = None
         self.recording_thread = None
+        self.transcription_queue = None
         self.recording = False
+        self.recordings_compactor = None
 
         self.setup_ui()
 
         # Connect signals for transcription results
         self.transcription_complete.connect(self.on_transcription_complete)
         self.transcription_error.connect(self.show_transcription_error)
+        self.metadata_loaded.connect(self.on_metadata_loaded)
+        self.metadata_load_failed.connect(self.on_metadata_load_failed)
+
+        # Keep the metadata index in sync with changes made outside this window
+        self.metadata_reload_timer = QTimer(self)
+        self.metadata_reload_timer.setSingleShot(True)
+        self.metadata_reload_timer.setInterval(500)
+        self.metadata_reload_timer.timeout.connect(self.reload_metadata)
+        self.metadata_watcher = QFileSystemWatcher(self)
+        self.metadata_watcher.addPath(self.conversation_manager.conversations_dir)
+        self.metadata_watcher.fileChanged.connect(self.metadata_reload_timer.start)
+        self.metadata_watcher.directoryChanged.connect(self.metadata_reload_timer.start)
+
+        self.metrics_exporter = MetricsExporter(metrics, METRICS_FILE, METRICS_INTERVAL, METRICS_FORMAT)
+        self.metrics_exporter.start()
+
+        # Show the transcription backlog in the status bar
+        self.scheduler_status_timer = QTimer(self)
+        self.scheduler_status_timer.setInterval(1000)
+        self.scheduler_status_timer.timeout.connect(self.update_scheduler_status)
+        self.scheduler_status_timer.start()
+
+        threading.Thread(target=self.load_metadata, daemon=True).start()
+
+    def load_metadata(self):
+        # Runs on a background thread
+        try:
+            self.conversation_manager.load()
+        except JournalLockedError:
+            self.metadata_load_failed.emit(
+                "The conversations are already open in another window or in the ingest or import command."
+            )
+            return
+        except Exception as e:
+            print(f"Error loading conversations: {e}")
+            return
+        self.metadata_loaded.emit()
+
+    @pyqtSlot(str)
+    def on_metadata_load_failed(self, message):
+        QMessageBox.critical(self, "Cannot Open Conversations", message)
+        self.close()
+
+    @pyqtSlot()
+    def on_metadata_loaded(self):
+        self.conversation_tree.refresh()
+        self.new_folder_button.setEnabled(True)
+        self.new_conv_button.setEnabled(True)
+        self.watch_metadata_files()
+        # Jobs saved before conversations had ids refer to them by path
+        self.conversation_manager.migrate_job_journal(self.job_journal)
+        # Taken now, so a recording started in the meantime isn't resumed as well
+        unfinished_jobs = self.job_journal.get_unfinished_jobs()
+        # Later recordings start without waiting for PortAudio to enumerate devices
+        warm_up_in_background()
+        threading.Thread(target=self.start_transcription, args=(unfinished_jobs,), daemon=True).start()
+
+    def start_transcription(self, unfinished_jobs):
+        # Runs on a background thread, since building the transcriber imports requests and numpy
+        try:
+            self.get_scheduler()
+            # Pick up transcriptions that were interrupted by a failure or crash
+            self.resume_unfinished_jobs(unfinished_jobs)
+        except Exception as e:
+            print(f"Error resuming transcription jobs: {e}")
+        if ARCHIVE_RECORDINGS:
+            # Started after the jobs are resumed, so their chunks are in the journal
+            from audio_archive import RecordingsCompactor
+            self.recordings_compactor = RecordingsCompactor(
+                self.conversation_manager.audio_archive,
+                self.conversation_manager.data_dir,
+                self.job_journal,
+                interval=ARCHIVE_COMPACT_INTERVAL,
+                grace=ARCHIVE_COMPACT_GRACE
+            )
+            self.recordings_compactor.start()
+
+    def get_transcriber(self):
+        # Called from the GUI and from import threads
+        with self.transcriber_lock:
+            if self.transcriber is None:
+                from transcriber import Transcriber
+                from transcription_cache import TranscriptionCache
+                self.transcriber = Transcriber(
+                    OPENAI_API_KEY,
+                    upload_format=UPLOAD_AUDIO_FORMAT,
+                    upload_sample_rate=UPLOAD_SAMPLE_RATE,
+                    cache=TranscriptionCache(
+                        TRANSCRIPTION_CACHE_DIR,
+                        max_bytes=TRANSCRIPTION_CACHE_MAX_BYTES,
+                        max_age=TRANSCRIPTION_CACHE_MAX_AGE
+                    ),
+                    api_base=OPENAI_API_BASE
+                )
+            return self.transcriber
+
+    def get_scheduler(self):
+        transcriber = self.get_transcriber()
+        with self.transcriber_lock:
+            if self.scheduler is None:
+                from transcription_scheduler import TranscriptionScheduler
+                self.scheduler = TranscriptionScheduler(
+                    transcriber,
+                    requests_per_minute=TRANSCRIPTION_REQUESTS_PER_MINUTE,
+                    audio_seconds_per_minute=TRANSCRIPTION_AUDIO_SECONDS_PER_MINUTE,
+                    max_workers=TRANSCRIPTION_WORKERS,
+                    max_pending=TRANSCRIPTION_MAX_PENDING
+                )
+            return self.scheduler
+
+    def update_scheduler_status(self):
+        if self.scheduler is None:
+            return
+        stats = self.scheduler.get_stats()
+        if not stats['queued'] and not stats['running']:
+            self.statusBar().clearMessage()
+            return
+        message = (f"Transcribing: {stats['running']} in progress, {stats['queued_live']} recording and "
+                   f"{stats['queued_import']} import chunks queued")
+        if stats['eta_seconds'] is not None:
+            minutes, seconds = divmod(int(stats['eta_seconds']), 60)
+            message += f", about {minutes}:{seconds:02d} left"
+        self.statusBar().showMessage(message)
 
     def setup_ui(self):
         central_widget = QWidget()
@@ -49,34 +207,68 @@ class MainWindow(QMainWindow):
         self.new_conv_button = QPushButton("New Conversation")
         self.record_button = QPushButton("Start Recording")
         self.rename_button = QPushButton("Rename")
+        self.move_button = QPushButton("Move")
         self.delete_button = QPushButton("Delete")
         self.transcribe_file_button = QPushButton("Transcribe Audio File")
+        self.status_button = QPushButton("Status")
 
         control_layout.addWidget(self.new_folder_button)
         control_layout.addWidget(self.new_conv_button)
         control_layout.addWidget(self.record_button)
         control_layout.addWidget(self.rename_button)
+        control_layout.addWidget(self.move_button)
         control_layout.addWidget(self.delete_button)
         control_layout.addWidget(self.transcribe_file_button)
+        control_layout.addWidget(self.status_button)
+
+        # Search across all conversations; clicking a result opens its conversation at the segment
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText("Search transcripts...")
+        self.search_box.setClearButtonEnabled(True)
+        self.search_results = QListWidget()
+        self.search_results.setWordWrap(True)
+        self.search_results.hide()
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(250)
+        self.search_timer.timeout.connect(self.run_search)
+        self.search_box.textChanged.connect(self.search_timer.start)
+        self.search_box.returnPressed.connect(self.run_search)
+        self.search_results.itemClicked.connect(self.open_search_result)
+        self.search_results.itemActivated.connect(self.open_search_result)
 
         # Conversation Tree
         self.conversation_tree = ConversationTree(self.conversation_manager)
         self.conversation_tree.itemSelectionChanged.connect(self.on_conversation_select)
 
+        side_layout = QVBoxLayout()
+        side_layout.addWidget(self.search_box)
+        side_layout.addWidget(self.search_results, 40)
+        side_layout.addWidget(self.conversation_tree, 60)
+
         # Transcript Editor
         self.transcript_editor = TranscriptEditor()
-        self.transcript_editor.textChanged.connect(self.save_transcript)
+        self.transcript_editor.segmentChanged.connect(self.transcript_saver.mark_dirty)
 
-        content_layout.addWidget(self.conversation_tree, 30)
+        content_layout.addLayout(side_layout, 30)
         content_layout.addWidget(self.transcript_editor, 70)
 
+        # Pipeline metrics, hidden until asked for
+        self.status_dock = QDockWidget("Status", self)
+        self.status_dock.setWidget(MetricsPanel(metrics))
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.status_dock)
+        self.status_dock.hide()
+
         main_layout.addLayout(control_layout)
         main_layout.addLayout(content_layout)
         central_widget.setLayout(main_layout)
 
-        # Disable buttons initially
+        # Disable buttons initially; the tree can't be changed until it has been loaded
+        self.new_folder_button.setEnabled(False)
+        self.new_conv_button.setEnabled(False)
         self.record_button.setEnabled(False)
         self.rename_button.setEnabled(False)
+        self.move_button.setEnabled(False)
         self.delete_button.setEnabled(False)
         self.transcribe_file_button.setEnabled(False)
         self.transcript_editor.setEnabled(False)
@@ -86,8 +278,10 @@ class MainWindow(QMainWindow):
         self.new_conv_button.clicked.connect(self.create_new_conversation)
         self.record_button.clicked.connect(self.toggle_recording)
         self.rename_button.clicked.connect(self.rename_item)
+        self.move_button.clicked.connect(self.move_item)
         self.delete_button.clicked.connect(self.delete_item)
         self.transcribe_file_button.clicked.connect(self.transcribe_audio_file)
+        self.status_button.clicked.connect(lambda: self.status_dock.setVisible(not self.status_dock.isVisible()))
 
     def create_new_folder(self):
         folder_name, ok = QInputDialog.getText(self, "New Folder", "Enter folder name:")
@@ -95,7 +289,7 @@ class MainWindow(QMainWindow):
             parent_path = self.conversation_tree.get_selected_path()
             success = self.conversation_manager.create_folder(folder_name, parent_path)
             if success:
-                self.conversation_tree.refresh()
+                self.conversation_tree.insert_item(parent_path, folder_name)
                 QMessageBox.information(self, "Success", f"Folder '{folder_name}' created successfully.")
             else:
                 QMessageBox.warning(self, "Error", "A folder with that name already exists or invalid parent.")
@@ -108,7 +302,7 @@ class MainWindow(QMainWindow):
             parent_path = self.conversation_tree.get_selected_path()
             success = self.conversation_manager.create_conversation(conversation_name, parent_path)
             if success:
-                self.conversation_tree.refresh()
+                self.conversation_tree.insert_item(parent_path, conversation_name)
                 QMessageBox.information(self, "Success", f"Conversation '{conversation_name}' created successfully.")
             else:
                 QMessageBox.warning(self, "Error", "A conversation with that name already exists or invalid parent.")
@@ -126,8 +320,15 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "No Conversation Selected", "Please select a conversation first.")
             return
 
+        from recorder import Recorder
         recordings_dir = self.conversation_manager.get_recordings_dir()
-        self.recorder = Recorder(recordings_dir)
+        # Chunks are transcribed while the recording is still running
+        conversation_id = self.conversation_manager.get_conversation_key(
+            self.conversation_manager.selected_conversation_path
+        )
+        job_id = self.job_journal.create_job(conversation_id, "recording")
+        self.transcription_queue = self.create_transcription_queue(job_id, live=True)
+        self.recorder = Recorder(recordings_dir, on_chunk_saved=self.transcription_queue.submit)
         self.recording_thread = threading.Thread(target=self.recorder.record, daemon=True)
         self.recording_thread.start()
         self.recording = True
@@ -143,41 +344,107 @@ class MainWindow(QMainWindow):
             self.process_recording()
 
     def process_recording(self):
-        threading.Thread(target=self.transcribe_audio, daemon=True).start()
+        # The recorder has handed over its final chunk; only that one is still outstanding
+        self.transcription_queue.close()
+        self.transcription_queue = None
+
+    def create_transcription_queue(self, job_id, live=False):
+        # Chunks of recordings are sent ahead of imported files, and kept in the archive once transcribed
+        from transcription_queue import TranscriptionQueue
+        from transcription_scheduler import LIVE, IMPORT
+        archive = archive_key = None
+        conversation_id = self.job_journal.get_job(job_id)['conversation']
+        if live and ARCHIVE_RECORDINGS and conversation_id:
+            archive = self.conversation_manager.audio_archive
+            archive_key = conversation_id
+        return TranscriptionQueue(
+            self.get_transcriber(),
+            on_complete=lambda text: self.transcription_complete.emit(job_id, text),
+            on_error=lambda failed_chunks: self.transcription_error.emit(job_id, failed_chunks),
+            journal=self.job_journal,
+            job_id=job_id,
+            scheduler=self.get_scheduler(),
+            priority=LIVE if live else IMPORT,
+            archive=archive,
+            archive_key=archive_key
+        )
 
-    def transcribe_audio(self):
-        recordings_dir = self.conversation_manager.get_recordings_dir()
-        chunk_files = sorted(glob.glob(os.path.join(recordings_dir, "recording_chunk_*.wav")))
-        if not chunk_files:
+    def transcribe_audio(self, job_id):
+        # Completed chunks come from the journal; only unfinished ones are uploaded
+        live = self.job_journal.get_job(job_id)['source'] == "recording"
+        transcription_queue = self.create_transcription_queue(job_id, live)
+        transcription_queue.resume()
+        transcription_queue.close()
+
+    def resume_unfinished_jobs(self, jobs):
+        for job in jobs:
+            if job['source'].startswith(INGEST_SOURCE_PREFIX):
+                # Left to the ingest command, which owns the files and their progress
+                continue
+            if self.conversation_manager.get_conversation_path(job['conversation']) is None:
+                print(f"Conversation of transcription job {job['id']} not found; not resuming it.")
+                continue
+            if job['state'] == OPEN and job['source'] == "recording":
+                self.adopt_orphan_chunks(job)
+            print(f"Resuming transcription job {job['id']}.")
+            self.transcribe_audio(job['id'])
+
+    def adopt_orphan_chunks(self, job):
+        # The app stopped during this recording; add the chunks it never handed over
+        from recorder import recover_partial_chunks
+        path = self.conversation_manager.get_conversation_path(job['conversation'])
+        if path is None:
             return
+        recordings_dir = self.conversation_manager.get_recordings_dir_from_path(path)
+        recover_partial_chunks(recordings_dir)
+        journaled = self.job_journal.get_chunk_paths()
+        chunk_files = glob.glob(os.path.join(recordings_dir, "recording_chunk_*.wav"))
+        # Sort numerically so recording_chunk_10 comes after recording_chunk_9
+        for chunk_file in sorted(chunk_files, key=chunk_index):
+            if chunk_file not in journaled:
+                self.job_journal.add_chunk(job['id'], chunk_file)
+
+    @pyqtSlot(int, str)
+    def on_transcription_complete(self, job_id, transcript_text):
+        job = self.job_journal.get_job(job_id)
+        if job is None:
+            return
+        # Wherever the conversation was moved while it was being transcribed
+        path = self.conversation_manager.get_conversation_path(job['conversation'])
+        if path is None:
+            # Jobs of deleted conversations are dropped with them, so keep the transcript in the journal
+            print(f"Conversation of transcription job {job_id} not found; keeping the job.")
+            return
+        if self.conversation_manager.append_transcript(transcript_text, path) is not None:
+            self.conversation_tree.touch_item(path)
+        chunk_dirs = {os.path.dirname(chunk['path']) for chunk in self.job_journal.get_chunks(job_id)}
+        self.job_journal.finish_job(job_id)
+        remove_empty_import_dirs(chunk_dirs)
+        if path == self.conversation_manager.selected_conversation_path:
+            self.load_transcript()
+        if self.conversation_manager.selected_conversation_path and not self.recording:
+            self.transcript_editor.setEnabled(True)
 
-        def transcription_thread():
-            all_transcripts = []
-            for chunk_file in chunk_files:
-                transcript_data = self.transcriber.transcribe(chunk_file)
-                if transcript_data:
-                    transcript_text = transcript_data.get('text', '')
-                    all_transcripts.append(transcript_text)
-                else:
-                    self.transcription_error.emit()
-                    return
-                # Remove chunk file after transcription
-                os.remove(chunk_file)
-            full_transcript = '\n'.join(all_transcripts)
-            self.transcription_complete.emit(full_transcript)
-
-        threading.Thread(target=transcription_thread, daemon=True).start()
-
-    @pyqtSlot(str)
-    def on_transcription_complete(self, transcript_text):
-        self.conversation_manager.append_transcript(transcript_text)
-        self.load_transcript()
-        self.transcript_editor.setEnabled(True)
-
-    @pyqtSlot()
-    def show_transcription_error(self):
-        QMessageBox.warning(self, "Transcription Failed", "Could not transcribe the audio.")
-        self.transcript_editor.setEnabled(True)
+    @pyqtSlot(int, list)
+    def show_transcription_error(self, job_id, failed_chunks):
+        if self.conversation_manager.selected_conversation_path and not self.recording:
+            self.transcript_editor.setEnabled(True)
+        message = f"Could not transcribe {len(failed_chunks)} chunk(s). The audio was kept.\n\n"
+        if any(chunk['state'] == UNSPLIT for chunk in self.job_journal.get_chunks(job_id)):
+            # Retrying won't help; at most the parts before the error were transcribed
+            message = "Could not read or split all of the audio file, so some or all of it is missing.\n\n"
+        reply = QMessageBox.warning(
+            self,
+            "Transcription Failed",
+            message +
+            "Retry now, save what was transcribed (Discard), or leave the job to be resumed next time (Ignore)?",
+            QMessageBox.Retry | QMessageBox.Discard | QMessageBox.Ignore,
+            QMessageBox.Retry
+        )
+        if reply == QMessageBox.Retry:
+            self.transcribe_audio(job_id)
+        elif reply == QMessageBox.Discard:
+            self.on_transcription_complete(job_id, self.job_journal.get_transcript(job_id))
 
     def rename_item(self):
         selected_path = self.conversation_tree.get_selected_path()
@@ -185,21 +452,46 @@ class MainWindow(QMainWindow):
             return
         new_name, ok = QInputDialog.getText(self, "Rename", "Enter new name:", text=selected_path[-1])
         if ok and new_name and new_name != selected_path[-1]:
+            self.transcript_saver.flush()
             success = self.conversation_manager.rename_item(selected_path, new_name)
             if success:
-                self.conversation_tree.refresh()
+                self.conversation_tree.rename_item(selected_path, new_name)
                 QMessageBox.information(self, "Success", f"Renamed to '{new_name}' successfully.")
             else:
                 QMessageBox.warning(self, "Error", "Failed to rename.")
         elif not new_name:
             QMessageBox.warning(self, "Invalid Name", "Name cannot be empty.")
 
-    def delete_item(self):
-        selected_item = self.conversation_tree.currentItem()
-        if not selected_item:
+    def move_item(self):
+        selected_path = self.conversation_tree.get_selected_path()
+        if not selected_path:
+            return
+        # Any folder except the one it is in, the item itself and anything inside it
+        targets = [[]] + list(self.conversation_manager.iter_folder_paths())
+        targets = [path for path in targets
+                   if path != selected_path[:-1] and path[:len(selected_path)] != selected_path]
+        if not targets:
+            QMessageBox.information(self, "Move", "There is no other folder to move it to.")
             return
-        item_name = selected_item.text(0)
+        labels = ["/".join(path) if path else "(Top level)" for path in targets]
+        label, ok = QInputDialog.getItem(self, "Move", f"Move '{selected_path[-1]}' to:", labels, 0, False)
+        if not ok:
+            return
+        new_parent_path = targets[labels.index(label)]
+        self.transcript_saver.flush()
+        if self.conversation_manager.move_item(selected_path, new_parent_path):
+            self.conversation_tree.remove_item(selected_path)
+            self.conversation_tree.insert_item(new_parent_path, selected_path[-1])
+            self.conversation_tree.select_path(new_parent_path + [selected_path[-1]])
+            QMessageBox.information(self, "Success", f"Moved '{selected_path[-1]}' successfully.")
+        else:
+            QMessageBox.warning(self, "Error", "Failed to move. The folder may already contain an item of that name.")
+
+    def delete_item(self):
         selected_path = self.conversation_tree.get_selected_path()
+        if not selected_path:
+            return
+        item_name = selected_path[-1]
         reply = QMessageBox.question(
             self,
             "Delete",
@@ -208,12 +500,17 @@ class MainWindow(QMainWindow):
             QMessageBox.No
         )
         if reply == QMessageBox.Yes:
+            self.transcript_saver.flush()
+            conversation_ids = [self.conversation_manager.get_conversation_key(path)
+                                for path in self.conversation_manager.iter_conversation_paths(selected_path)]
             success = self.conversation_manager.delete_item(selected_path)
             if success:
-                self.conversation_tree.refresh()
+                self.job_journal.finish_conversation_jobs(conversation_ids)
+                self.conversation_tree.remove_item(selected_path)
                 self.transcript_editor.clear()
                 self.record_button.setEnabled(False)
                 self.rename_button.setEnabled(False)
+                self.move_button.setEnabled(False)
                 self.delete_button.setEnabled(False)
                 self.transcribe_file_button.setEnabled(False)
                 self.transcript_editor.setEnabled(False)
@@ -222,12 +519,15 @@ class MainWindow(QMainWindow):
                 QMessageBox.warning(self, "Error", "Failed to delete.")
 
     def on_conversation_select(self):
+        # Edits to the conversation being left are written before anything else is loaded
+        self.transcript_saver.flush()
         selected_path = self.conversation_tree.get_selected_path()
         if selected_path and self.conversation_tree.is_conversation(selected_path):
             self.conversation_manager.select_conversation(selected_path)
             self.load_transcript()
             self.record_button.setEnabled(True)
             self.rename_button.setEnabled(True)
+            self.move_button.setEnabled(True)
             self.delete_button.setEnabled(True)
             self.transcribe_file_button.setEnabled(True)
             self.transcript_editor.setEnabled(True)
@@ -235,18 +535,85 @@ class MainWindow(QMainWindow):
             self.conversation_manager.deselect_conversation()
             self.transcript_editor.clear()
             self.record_button.setEnabled(False)
-            self.rename_button.setEnabled(False)
-            self.delete_button.setEnabled(False)
+            # Folders can be renamed, moved and deleted with everything in them
+            self.rename_button.setEnabled(bool(selected_path))
+            self.move_button.setEnabled(bool(selected_path))
+            self.delete_button.setEnabled(bool(selected_path))
             self.transcribe_file_button.setEnabled(False)
             self.transcript_editor.setEnabled(False)
 
+    def run_search(self):
+        self.search_timer.stop()
+        query = self.search_box.text().strip()
+        self.search_results.clear()
+        if not query:
+            self.search_results.hide()
+            return
+        # Pending edits are written first so they can be found
+        self.transcript_saver.flush()
+        results = self.conversation_manager.search(query)
+        for path, segment_id, timestamp, snippet in results:
+            item = QListWidgetItem(f"{' / '.join(path)}  ({timestamp})\n{snippet}")
+            item.setData(Qt.UserRole, (path, segment_id))
+            self.search_results.addItem(item)
+        if not results:
+            self.search_results.addItem(QListWidgetItem("No matches"))
+        self.search_results.show()
+
+    def open_search_result(self, item):
+        result = item.data(Qt.UserRole)
+        if not result:
+            return
+        path, segment_id = result
+        if not self.conversation_tree.select_path(path):
+            return
+        row = self.conversation_manager.get_segment_row(segment_id)
+        if row is not None:
+            self.transcript_editor.scroll_to_segment(row)
+
+    def watch_metadata_files(self):
+        # Files that are replaced or created later drop out of (or never enter) the watch list
+        watched = set(self.metadata_watcher.files())
+        for path in self.conversation_manager.get_metadata_files():
+            if os.path.exists(path) and path not in watched:
+                self.metadata_watcher.addPath(path)
+
+    def reload_metadata(self):
+        if not self.conversation_manager.loaded.is_set():
+            return
+        self.watch_metadata_files()
+        if self.conversation_manager.reload_metadata():
+            self.conversation_tree.refresh()
+
     def load_transcript(self):
-        transcripts = self.conversation_manager.get_transcripts()
-        self.transcript_editor.set_transcripts(transcripts)
+        # Pending edits must be on disk, or reloading would show stale text
+        self.transcript_saver.flush()
+        path = self.conversation_manager.selected_conversation_path
+        if not path:
+            self.transcript_editor.clear()
+            return
+        # Segments are paged in by the editor as it scrolls
+        self.transcript_editor.set_source(
+            lambda offset, limit: self.conversation_manager.get_segments(path, offset, limit),
+            self.conversation_manager.get_segment_count(path)
+        )
 
-    def save_transcript(self):
-        transcripts = self.transcript_editor.get_transcripts()
-        self.conversation_manager.save_transcripts(transcripts)
+    def closeEvent(self, event):
+        self.transcript_saver.close()
+        self.metrics_exporter.stop()
+        if self.recordings_compactor:
+            self.recordings_compactor.stop()
+        # Also closes the archive, the tree journal (releasing its lock) and the transcript store
+        self.conversation_manager.close()
+        if self.scheduler:
+            # Queued chunks stay in the job journal and are resumed on the next start
+            self.scheduler.close()
+        if self.transcriber:
+            self.transcriber.close()
+        self.job_journal.close()
+        if not self.recording:
+            terminate_shared_audio()
+        super().closeEvent(event)
 
     def transcribe_audio_file(self):
         if not self.conversation_manager.selected_conversation_path:
@@ -266,12 +633,17 @@ class MainWindow(QMainWindow):
             threading.Thread(target=self.transcribe_selected_file, args=(audio_file_path,), daemon=True).start()
 
     def transcribe_selected_file(self, audio_file_path):
+        conversation_id = self.conversation_manager.get_conversation_key(
+            self.conversation_manager.selected_conversation_path
+        )
+        recordings_dir = self.conversation_manager.get_recordings_dir()
+
         def transcription_thread():
-            transcript_data = self.transcriber.transcribe(audio_file_path)
-            if transcript_data:
-                transcript_text = transcript_data.get('text', '')
-                self.transcription_complete.emit(transcript_text)
-            else:
-                self.transcription_error.emit()
+            # Split large files before upload; parts are transcribed while later ones are still being written
+            job_id = self.job_journal.create_job(conversation_id, "import")
+            parts_dir = tempfile.mkdtemp(prefix="import_", dir=recordings_dir)
+            transcription_queue = self.create_transcription_queue(job_id)
+            transcription_queue.submit_file(audio_file_path, parts_dir, IMPORT_CHUNK_DURATION)
+            transcription_queue.close()
 
-        threading.Thread(target=transcription_thread, daemon=True).start()
\ No newline at end of file
+        threading.Thread(target=transcription_thread, daemon=True).start()
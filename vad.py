@@ -0,0 +1,120 @@
+# vad.py
+
+import numpy as np
+
+class VoiceActivityDetector:
+    """
+    Energy and zero-crossing-rate voice activity detector for 16-bit mono PCM.
+
+    The noise floor adapts to the room: frames well above it are speech, and
+    quieter frames with a high zero-crossing rate (fricatives like "s" or "f")
+    are kept as speech too. A short hangover stops word endings from being
+    classified as silence.
+
+    The floor starts from the quietest frame seen so far, so recording that
+    starts mid-sentence or in a loud room still finds the gaps between words.
+    It is considered learned after learning_duration seconds of audio.
+
+    :param sample_rate: Sample rate of the PCM data.
+    :param frame_duration: Analysis frame length in seconds.
+    :param energy_ratio: How far above the noise floor a frame must be to count as speech.
+    :param min_energy: Absolute RMS floor (full scale = 1.0) below which nothing is speech.
+    :param zcr_threshold: Zero-crossing rate above which quieter frames still count as speech.
+    :param hangover: Seconds that speech state is held after the last speech frame.
+    :param learning_duration: Seconds of audio needed before the noise floor is trusted.
+    """
+    def __init__(self, sample_rate=44100, frame_duration=0.02, energy_ratio=3.0, min_energy=0.003,
+                 zcr_threshold=0.25, hangover=0.3, learning_duration=1.5):
+        self.sample_rate = sample_rate
+        self.frame_length = max(1, int(sample_rate * frame_duration))
+        self.energy_ratio = energy_ratio
+        self.min_energy = min_energy
+        self.zcr_threshold = zcr_threshold
+        self.hangover_frames = int(hangover / frame_duration)
+        self.learning_frames = int(learning_duration / frame_duration)
+        self.noise_floor = None
+        self.hangover_left = 0
+        self.frames_seen = 0
+
+    def reset(self):
+        self.noise_floor = None
+        self.hangover_left = 0
+        self.frames_seen = 0
+
+    @property
+    def learned(self):
+        return self.frames_seen >= self.learning_frames
+
+    def frame_features(self, samples):
+        # RMS energy and zero-crossing rate for every complete analysis frame
+        usable = len(samples) - len(samples) % self.frame_length
+        if usable == 0:
+            frames = samples.reshape(1, -1)
+        else:
+            frames = samples[:usable].reshape(-1, self.frame_length)
+        energy = np.sqrt(np.mean(frames ** 2, axis=1))
+        signs = np.signbit(frames)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1) if frames.shape[1] > 1 else np.zeros(len(frames))
+        return energy, zcr
+
+    def classify(self, samples):
+        """
+        Returns a boolean speech flag per analysis frame of a float32 signal
+        in the range [-1, 1], updating the adaptive noise floor as it goes.
+        """
+        energy, zcr = self.frame_features(samples)
+        self.frames_seen += len(energy)
+        # A quieter frame pulls the floor down at once, so a floor set during speech recovers at the next gap
+        lowest = max(float(np.min(energy)), self.min_energy / self.energy_ratio)
+        if self.noise_floor is None or lowest < self.noise_floor:
+            self.noise_floor = lowest
+
+        threshold = max(self.min_energy, self.noise_floor * self.energy_ratio)
+        speech = (energy > threshold) | ((energy > threshold / 2) & (zcr > self.zcr_threshold))
+
+        quiet = energy[~speech]
+        if len(quiet):
+            # Track the noise floor slowly so a burst of speech doesn't drag it up
+            self.noise_floor = 0.95 * self.noise_floor + 0.05 * float(np.mean(quiet))
+
+        # Hold speech state for a short while after each speech frame
+        flags = np.empty(len(speech), dtype=bool)
+        hangover_left = self.hangover_left
+        for i, is_speech in enumerate(speech):
+            if is_speech:
+                hangover_left = self.hangover_frames
+                flags[i] = True
+            elif hangover_left > 0:
+                hangover_left -= 1
+                flags[i] = True
+            else:
+                flags[i] = False
+        self.hangover_left = hangover_left
+        return flags
+
+    def is_speech(self, pcm):
+        """Returns True if any part of a block of 16-bit PCM bytes contains speech."""
+        samples = np.frombuffer(pcm, dtype='<i2').astype(np.float32) / 32768
+        if len(samples) == 0:
+            return False
+        return bool(self.classify(samples).any())
+
+def find_pauses(samples, sample_rate, min_pause=0.3, detector=None):
+    """
+    Finds pauses in a float32 mono signal.
+
+    :return: List of (start_sample, end_sample) ranges that are silent for at least min_pause seconds.
+    """
+    detector = detector or VoiceActivityDetector(sample_rate)
+    flags = detector.classify(samples)
+    frame_length = detector.frame_length
+    min_frames = max(1, int(min_pause * sample_rate / frame_length))
+
+    pauses = []
+    # Boundaries of runs of silent frames
+    padded = np.concatenate(([False], ~flags, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    for start, end in zip(edges[::2], edges[1::2]):
+        if end - start >= min_frames:
+            pauses.append((int(start * frame_length), int(min(end * frame_length, len(samples)))))
+    return pauses